@@ -0,0 +1,164 @@
+"""
+Context-window budgeting for chat prompts.
+
+Ollama silently drops the start of a prompt that exceeds num_ctx, so before each request we
+estimate every section and trim the least important ones first. Priority (highest first):
+system prompt + tools, the user message, recent history, long-term memory, older history.
+Dropped history is replaced by a one-line extractive summary when there is room for it.
+"""
+from __future__ import annotations
+import math
+import threading
+from typing import Any, Dict, List, Tuple
+
+from app.core.config import settings
+from app.memory.retrieval import memory_prompt
+
+# Chat-template tokens Ollama adds around each message (role header, separators).
+_MESSAGE_OVERHEAD = 4
+
+
+class TokenEstimator:
+    """
+    Character-based token estimate, calibrated against Ollama's prompt_eval_count.
+    Only responses that evaluated (nearly) the whole prompt are used for calibration;
+    a KV-cache hit makes prompt_eval_count smaller than the real prompt size.
+    """
+
+    def __init__(self, chars_per_token: float = 4.0) -> None:
+        self.chars_per_token = chars_per_token
+        self.samples = 0
+        self._lock = threading.Lock()
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token) if text else 0
+
+    def count_message(self, message: Dict[str, str]) -> int:
+        return self.count(message.get("content") or "") + _MESSAGE_OVERHEAD
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        return sum(self.count_message(m) for m in messages)
+
+    def calibrate(self, messages: List[Dict[str, str]], prompt_eval_count: int | None) -> None:
+        if not prompt_eval_count or prompt_eval_count <= 0:
+            return
+        estimated = self.count_messages(messages)
+        if prompt_eval_count < 0.8 * estimated:
+            return  # prefix was served from cache; not a full-prompt sample
+        chars = sum(len(m.get("content") or "") for m in messages)
+        content_tokens = prompt_eval_count - _MESSAGE_OVERHEAD * len(messages)
+        if chars <= 0 or content_tokens <= 0:
+            return
+        observed = min(6.0, max(2.0, chars / content_tokens))
+        with self._lock:
+            self.chars_per_token = 0.8 * self.chars_per_token + 0.2 * observed
+            self.samples += 1
+
+
+token_estimator = TokenEstimator()
+
+
+def _trim_memory(memory_text: str, max_tokens: int) -> Tuple[str, int]:
+    """Drop memory entries from the end until the block fits. Returns (text, lines dropped)."""
+    lines = memory_text.split("\n")
+    dropped = 0
+    while lines and token_estimator.count_message({"content": memory_prompt("\n".join(lines))}) > max_tokens:
+        entry_idx = [i for i, line in enumerate(lines) if line.startswith("- ")]
+        if not entry_idx:
+            return "", dropped
+        lines.pop(entry_idx[-1])
+        dropped += 1
+    return "\n".join(lines), dropped
+
+
+def _summarize_dropped(dropped: List[Dict[str, str]]) -> str:
+    """Cheap extractive summary of history that no longer fits: what the user asked about."""
+    asks = []
+    for m in dropped:
+        if m.get("role") != "user":
+            continue
+        text = " ".join((m.get("content") or "").split())
+        asks.append(text[:60] + ("..." if len(text) > 60 else ""))
+    if not asks:
+        return ""
+    return "Earlier in this conversation the user asked about: " + "; ".join(asks)
+
+
+def fit_to_context(
+    static_prompt: str,
+    memory_text: str,
+    history: List[Dict[str, str]],
+    user_message: str,
+) -> Tuple[str, List[Dict[str, str]], str, Dict[str, Any]]:
+    """
+    Trim memory, history and (as a last resort) the user message so the prompt plus the
+    reserved output tokens fit OLLAMA_NUM_CTX. Returns (memory_text, history, user_message, report).
+    """
+    num_ctx = getattr(settings, "OLLAMA_NUM_CTX", 0)
+    if num_ctx <= 0:
+        return memory_text, history, user_message, {"enabled": False}
+
+    est = token_estimator
+    num_predict = getattr(settings, "OLLAMA_NUM_PREDICT", -1)
+    reserved = min(num_predict, num_ctx // 2) if num_predict > 0 else num_ctx // 4
+    available = num_ctx - reserved - getattr(settings, "CONTEXT_SAFETY_MARGIN", 32)
+
+    trimmed = {"memory_lines": 0, "history_messages": 0, "user_chars": 0}
+    system_tokens = est.count_message({"content": static_prompt})
+    user_tokens = est.count_message({"content": user_message})
+    remaining = available - system_tokens - user_tokens
+    if remaining < 0:
+        # Even without memory and history the message does not fit: keep its beginning.
+        keep_chars = max(0, int((available - system_tokens - _MESSAGE_OVERHEAD) * est.chars_per_token))
+        trimmed["user_chars"] = len(user_message) - keep_chars
+        user_message = user_message[:keep_chars]
+        user_tokens = est.count_message({"content": user_message})
+        trimmed["memory_lines"] = memory_text.count("\n- ") + memory_text.startswith("- ")
+        trimmed["history_messages"] = len(history)
+        memory_text, history, remaining = "", [], 0
+
+    # Memory gets its share of what is left, or everything history does not need.
+    history_tokens = est.count_messages(history)
+    memory_cap = max(int(remaining * getattr(settings, "CONTEXT_MEMORY_SHARE", 0.25)), remaining - history_tokens)
+    memory_tokens = est.count_message({"content": memory_prompt(memory_text)}) if memory_text else 0
+    if memory_tokens > memory_cap:
+        memory_text, trimmed["memory_lines"] = _trim_memory(memory_text, memory_cap)
+        memory_tokens = est.count_message({"content": memory_prompt(memory_text)}) if memory_text else 0
+    remaining -= memory_tokens
+
+    # History: keep the newest messages that fit; summarize the rest if possible.
+    kept: List[Dict[str, str]] = []
+    for m in reversed(history):
+        cost = est.count_message(m)
+        if cost > remaining:
+            break
+        kept.append(m)
+        remaining -= cost
+    kept.reverse()
+    dropped = history[: len(history) - len(kept)]
+    summarized = False
+    if dropped:
+        trimmed["history_messages"] = len(dropped)
+        summary = _summarize_dropped(dropped)
+        if summary and est.count_message({"content": summary}) <= remaining:
+            kept.insert(0, {"role": "system", "content": summary})
+            remaining -= est.count_message({"content": summary})
+            summarized = True
+
+    report = {
+        "enabled": True,
+        "num_ctx": num_ctx,
+        "reserved_output": reserved,
+        "chars_per_token": round(est.chars_per_token, 2),
+        "calibration_samples": est.samples,
+        "estimated_prompt_tokens": available - remaining,
+        "sections": {
+            "system": system_tokens,
+            "memory": memory_tokens,
+            "history": est.count_messages(kept),
+            "user": user_tokens,
+        },
+        "trimmed": trimmed,
+        "history_summarized": summarized,
+    }
+    return memory_text, kept, user_message, report
@@ -0,0 +1,244 @@
+"""
+Local intent router: answers obvious tool commands without an LLM call.
+
+"open spotify" or "search the web for X" otherwise costs a full generation just to produce
+{"tool": ...} JSON. Each rule below maps a command pattern to a registered tool with a fixed
+confidence; open_app rules only fire for names in the allowed-apps list. A match at or above
+INTENT_ROUTER_MIN_CONFIDENCE runs the tool directly, anything else (unknown app, several
+commands in one message, a bare "look up X" that may be a question) goes to the model.
+"""
+from __future__ import annotations
+import re
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.prompt_loader import get_character
+from app.tools.implementations.open_app import get_allowed_apps
+from app.tools.registry import TOOLS
+
+
+@dataclass
+class IntentMatch:
+    tool: str
+    args: Dict[str, Any]
+    confidence: float
+    rule: str
+
+
+@dataclass
+class _Rule:
+    name: str
+    tool: str
+    pattern: re.Pattern
+    confidence: float
+    # Match -> (args, confidence) or None when the captured text does not fit the tool.
+    build: Callable[[re.Match, float], Optional[Tuple[Dict[str, Any], float]]] = field(repr=False)
+
+
+# Politeness and addressing around a command: "hey aika, could you please open spotify for me?"
+_LEADING = r"^(?:(?:hey|hi|ok|okay|yo)[,:]?\s+)?(?:{name}\b[,:]?\s*)?(?:(?:can|could|would|will)\s+(?:you|u)\s+)?(?:please\s+)?"
+_TRAILING = re.compile(r"(?:[\s,]+(?:please|for me|now|right now|thanks|thank you))+$")
+# A second clause ("open spotify and play jazz") needs the model to plan both steps.
+_COMPOUND = re.compile(r"\b(?:and|then|also|after that)\b|[,;]")
+_COMPOUND_PENALTY = 0.15
+# Web-search phrasings that are often something else: below the default threshold.
+_AMBIGUOUS_WEB_CONFIDENCE = 0.8
+_FILE_WORDS = re.compile(r"\b(?:files?|folders?|documents?|downloads|desktop|pdfs?)\b")
+# "report.pdf", "*.csv", "notes?.txt": a name to search for rather than a topic.
+_FILENAME = re.compile(r"^[\w\-. *?]*(?:\.[a-z0-9*]{1,5}|[*?][\w\-.*?]*)$")
+# A find-file request without one is below the default threshold.
+_FIND_TOPIC_CONFIDENCE = 0.7
+
+
+def _normalize(message: str) -> str:
+    text = re.sub(r"\s+", " ", message.strip().lower())
+    text = re.sub(r"[.!?]+$", "", text).strip()
+    name = re.escape((get_character().get("name") or "aika").strip().lower())
+    text = re.sub(_LEADING.format(name=name), "", text, count=1)
+    return _TRAILING.sub("", text).strip()
+
+
+def _compact(name: str) -> str:
+    return re.sub(r"[^a-z0-9]", "", name)
+
+
+def _build_open_app(m: re.Match, confidence: float) -> Optional[Tuple[Dict[str, Any], float]]:
+    requested = m.group("app").strip()
+    allowed = get_allowed_apps()
+    if requested in allowed:
+        return {"app": requested}, confidence
+    # "vs code" / "v.s. code" for "vscode": same letters, lower confidence.
+    for app in allowed:
+        if _compact(app) == _compact(requested):
+            return {"app": app}, confidence - 0.05
+    return None
+
+
+def _query_builder(tool: str) -> Callable[[re.Match, float], Optional[Tuple[Dict[str, Any], float]]]:
+    def build(m: re.Match, confidence: float) -> Optional[Tuple[Dict[str, Any], float]]:
+        query = m.group("q").strip().strip("\"'")
+        if not query:
+            return None
+        if tool == "web_search":
+            if _COMPOUND.search(query):
+                confidence -= _COMPOUND_PENALTY
+            return {"query": query}, confidence
+        return {"op": "search_user", "query": query}, confidence
+    return build
+
+
+def _build_bare_web_search(m: re.Match, confidence: float) -> Optional[Tuple[Dict[str, Any], float]]:
+    if _FILE_WORDS.search(m.group("q")):
+        return None  # "search for my tax documents" is about files, not the web
+    return _query_builder("web_search")(m, confidence)
+
+
+def _build_find_file(m: re.Match, confidence: float) -> Optional[Tuple[Dict[str, Any], float]]:
+    built = _query_builder("file_ops")(m, confidence)
+    if built is None:
+        return None
+    args, confidence = built
+    # "find files about taxes" names a topic, not a file: leave it to the model.
+    if not m.group("named") and not _FILENAME.match(args["query"]):
+        confidence = _FIND_TOPIC_CONFIDENCE
+    return args, confidence
+
+
+def _build_web_explicit(m: re.Match, confidence: float) -> Optional[Tuple[Dict[str, Any], float]]:
+    if not m.group("for"):
+        if m.group("verb") == "check":
+            return None  # "check the internet speed", "check online banking"
+        confidence = _AMBIGUOUS_WEB_CONFIDENCE  # "search online banking"
+    return _query_builder("web_search")(m, confidence)
+
+
+def _build_web_verb(m: re.Match, confidence: float) -> Optional[Tuple[Dict[str, Any], float]]:
+    # "google maps" is more likely about the product than a search for "maps".
+    if m.group("verb") == "google" and not m.group("for") and len(m.group("q").split()) < 2:
+        confidence = _AMBIGUOUS_WEB_CONFIDENCE
+    return _query_builder("web_search")(m, confidence)
+
+
+def _build_list_files(m: re.Match, confidence: float) -> Optional[Tuple[Dict[str, Any], float]]:
+    return {"op": "search_user", "query": ""}, confidence
+
+
+_WEB = r"(?:the\s+)?(?:web|internet|google|online)"
+_RULES: List[_Rule] = [
+    _Rule("open_app", "open_app",
+          re.compile(r"^(?:open|launch|start|run|fire up)\s+(?:up\s+)?(?:the\s+|my\s+)?(?P<app>[a-z0-9][a-z0-9 ._+-]*?)(?:\s+app(?:lication)?)?$"),
+          0.95, _build_open_app),
+    _Rule("web_search_explicit", "web_search",
+          re.compile(rf"^(?P<verb>search|look up|lookup|check)\s+(?:on\s+)?{_WEB}\s+(?P<for>for\s+)?(?P<q>.+)$"),
+          0.95, _build_web_explicit),
+    _Rule("web_search_suffix", "web_search",
+          re.compile(rf"^(?:search(?: for)?|look up|lookup|find)\s+(?P<q>.+?)\s+(?:(?:on|in)\s+{_WEB}|online)$"),
+          0.95, _query_builder("web_search")),
+    _Rule("web_search_verb", "web_search",
+          re.compile(r"^(?P<verb>google|web search|websearch)\s+(?P<for>for\s+)?(?P<q>.+)$"),
+          0.95, _build_web_verb),
+    # Bare "look up X" could also be a question for the model itself: below the default threshold.
+    _Rule("web_search_bare", "web_search",
+          re.compile(r"^(?:search for|look up|lookup)\s+(?P<q>.+)$"),
+          _AMBIGUOUS_WEB_CONFIDENCE, _build_bare_web_search),
+    _Rule("list_files", "file_ops",
+          re.compile(r"^(?:list|show|show me|what are)\s+(?:all\s+)?(?:of\s+)?my\s+files$|^what files do i have$"),
+          0.95, _build_list_files),
+    _Rule("search_files", "file_ops",
+          re.compile(r"^(?:search|search through|look through)\s+my\s+(?:files|documents|folders)\s+for\s+(?P<q>.+)$"),
+          0.95, _query_builder("file_ops")),
+    _Rule("find_file", "file_ops",
+          re.compile(r"^(?:find|search for|look for|locate)\s+(?:the\s+|my\s+)?(?:file|files|document)\s+(?:(?P<named>named|called)\s+)?(?P<q>.+)$"),
+          0.9, _build_find_file),
+    _Rule("find_filename", "file_ops",
+          re.compile(r"^(?:find|locate|where is|where's)\s+(?:the\s+|my\s+)?(?P<q>[\w\-. *?]+\.[a-z0-9*]{1,5})$"),
+          0.9, _query_builder("file_ops")),
+]
+
+
+class _IntentStats:
+    """Routing counters: how many messages skipped the model, per rule, and why the rest did not."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counts = {"routed": 0, "below_threshold": 0, "no_match": 0}
+        self.rules: Dict[str, int] = {}
+        self.total_route_ms = 0.0
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=50)
+
+    def record(self, outcome: str, match: Optional[IntentMatch], message: str, route_ms: float) -> None:
+        with self._lock:
+            self.counts[outcome] += 1
+            self.total_route_ms += route_ms
+            if match is not None and outcome == "routed":
+                self.rules[match.rule] = self.rules.get(match.rule, 0) + 1
+            if match is not None:
+                self.recent.append({
+                    "outcome": outcome,
+                    "rule": match.rule,
+                    "confidence": round(match.confidence, 2),
+                    "message": message[:60],
+                })
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                "enabled": getattr(settings, "INTENT_ROUTER_ENABLED", True),
+                "min_confidence": getattr(settings, "INTENT_ROUTER_MIN_CONFIDENCE", 0.85),
+                "checked": total,
+                **self.counts,
+                "hit_rate": round(self.counts["routed"] / total, 3) if total else 0.0,
+                "avg_route_ms": round(self.total_route_ms / total, 3) if total else 0.0,
+                "rules": dict(self.rules),
+                "recent": list(self.recent),
+            }
+
+
+_intent_stats = _IntentStats()
+
+
+def get_intent_stats() -> Dict[str, Any]:
+    return _intent_stats.snapshot()
+
+
+def match_intent(message: str) -> Optional[IntentMatch]:
+    """Best rule match for the message among registered tools, regardless of threshold."""
+    text = _normalize(message)
+    if not text:
+        return None
+    best: Optional[IntentMatch] = None
+    for rule in _RULES:
+        if rule.tool not in TOOLS:
+            continue
+        m = rule.pattern.match(text)
+        if not m:
+            continue
+        built = rule.build(m, rule.confidence)
+        if built is None:
+            continue
+        args, confidence = built
+        if best is None or confidence > best.confidence:
+            best = IntentMatch(tool=rule.tool, args=args, confidence=confidence, rule=rule.name)
+    return best
+
+
+def route_intent(message: str) -> Optional[IntentMatch]:
+    """The tool call to run for the message without the model, or None to let the model decide."""
+    if not getattr(settings, "INTENT_ROUTER_ENABLED", True):
+        return None
+    t0 = time.perf_counter()
+    match = match_intent(message)
+    route_ms = (time.perf_counter() - t0) * 1000
+    if match is None:
+        _intent_stats.record("no_match", None, message, route_ms)
+        return None
+    if match.confidence < getattr(settings, "INTENT_ROUTER_MIN_CONFIDENCE", 0.85):
+        _intent_stats.record("below_threshold", match, message, route_ms)
+        return None
+    _intent_stats.record("routed", match, message, route_ms)
+    return match
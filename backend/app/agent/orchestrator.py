@@ -2,15 +2,20 @@ from __future__ import annotations
 import json
 import re
 import random
-from typing import Any, AsyncIterator, Dict, List
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Dict, List, Tuple
 
-from app.agent.tool_parse import try_parse_tool_call
+from app.agent.context_budget import fit_to_context, token_estimator
+from app.agent.intent_router import IntentMatch, route_intent
+from app.agent.prompt_builder import build_chat_messages, prompt_stats, static_prefix
+from app.agent.tool_parse import StreamingToolCallDetector, try_parse_tool_call
 from app.core.config import settings
-from app.core.prompt_loader import get_character, get_chat_system_prompt, get_greeting_replies
+from app.core.metrics import stage
+from app.core.prompt_loader import get_character, get_greeting_replies
 from app.llm.ollama_client import OllamaClient
-from app.memory.repo import get_all_preferences, get_all_learned_facts
-from app.tools.router import execute_tool
-from app.tools.registry import TOOLS
+from app.llm.scheduler import OllamaBusyError
+from app.memory.repo import get_relevant_memory_text
+from app.tools.router import execute_tool_async
 
 # Greetings that get an instant reply (no LLM call). Keeps "Hello Aika!" etc. under ~0s.
 _GREETING_NORMALIZED = {
@@ -138,9 +143,48 @@ class Agent:
         max_messages = self._max_history_turns * 2
         return source[-max_messages:] if len(source) > max_messages else source
 
+    def _build_messages(self, user_message: str, history: list[dict] | None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """
+        Static prefix first (cache-friendly), then long-term memory, history and the new message,
+        trimmed to fit the context window. Returns (messages, context budget report).
+        """
+        effective = self._effective_history(history)
+        # Rank memory against the new message plus the user's recent turns (for follow-ups like "and her birthday?");
+        # the message is included twice so its terms outweigh older turns.
+        recent_user = [m["content"] for m in effective[-4:] if m.get("role") == "user"]
+        with stage("memory"):
+            memory_text = get_relevant_memory_text(
+                " ".join([user_message, user_message, *recent_user]),
+                top_k=getattr(settings, "MEMORY_RETRIEVAL_TOP_K", 8),
+                token_budget=getattr(settings, "MEMORY_TOKEN_BUDGET", 160),
+            )
+        with stage("prompt"):
+            memory_text, effective, user_message, budget = fit_to_context(
+                static_prefix(), memory_text, effective, user_message
+            )
+            return build_chat_messages(user_message, memory_text, effective), budget
+
+    async def _handle_routed(self, intent: IntentMatch, user_message: str, use_db_history: bool) -> Dict[str, Any]:
+        """Run a tool call chosen by the local intent router (no LLM call) and format its result."""
+        tool_result = await execute_tool_async(intent.tool, intent.args)
+        final_reply = _post_process_reply(_format_tool_reply(intent.tool, tool_result), user_message)
+        if not use_db_history:
+            self._append_turn(user_message, final_reply)
+        return {
+            "reply": final_reply,
+            "tool_used": {"tool": intent.tool, "args": intent.args},
+            "tool_result": tool_result,
+            "intent_route": {"rule": intent.rule, "confidence": round(intent.confidence, 2)},
+        }
+
     async def handle_chat(self, user_message: str, history: list[dict] | None = None) -> Dict[str, Any]:
         use_db_history = history is not None
 
+        # Before the greeting check: "hey aika, open spotify" is short and starts with a greeting word.
+        intent = route_intent(user_message)
+        if intent is not None:
+            return await self._handle_routed(intent, user_message, use_db_history)
+
         if _is_greeting(user_message):
             replies = get_greeting_replies()
             if not replies:
@@ -155,37 +199,25 @@ class Agent:
                 "tool_result": None,
             }
 
-        tool_list = [
-            {"name": spec.name, "description": spec.description}
-            for spec in TOOLS.values()
-        ]
-        effective = self._effective_history(history)
-        prefs = get_all_preferences()
-        learned_facts = get_all_learned_facts()
-        prefs_text = "\n".join([f"- {k}: {v}" for k, v in prefs.items()]) if prefs else "None"
-        facts_text = "\n".join([f"- {k}: {v}" for k, v in learned_facts.items()]) if learned_facts else "None"
-        memory_text = f"User preferences:\n{prefs_text}\n\nLearned facts:\n{facts_text}"
-        messages = [
-            {"role": "system", "content": get_chat_system_prompt()},
-            {"role": "system", "content": f"Long-term memory:\n{memory_text}"},
-            {"role": "system", "content": f"Allowed tools: {json.dumps(tool_list)}"},
-            *effective,
-            {"role": "user", "content": user_message},
-        ]
+        messages, budget = self._build_messages(user_message, history)
 
         num_predict = getattr(settings, "OLLAMA_NUM_PREDICT", -1)
         num_ctx = getattr(settings, "OLLAMA_NUM_CTX", 0)
+        stats: Dict[str, Any] = {}
         try:
             assistant = await self.ollama.chat(
                 model=self.model,
                 messages=messages,
                 num_predict=num_predict if num_predict > 0 else -1,
                 num_ctx=num_ctx if num_ctx > 0 else 0,
+                stats=stats,
             )
+        except OllamaBusyError:
+            raise  # surfaced as 429 + Retry-After; the model is up, just saturated
         except Exception as e:
             # Fallback: on model failure, try web search and return that if successful
             fallback_max = getattr(settings, "WEB_SEARCH_MAX_RESULTS_DEFAULT", 5)
-            fallback_result = execute_tool("web_search", {"query": user_message, "max_results": fallback_max})
+            fallback_result = await execute_tool_async("web_search", {"query": user_message, "max_results": fallback_max})
             if fallback_result.get("ok") and fallback_result.get("results"):
                 parts = ["I couldn't reach my usual model, so I searched the web for you:\n\n"]
                 for i, r in enumerate(fallback_result["results"][:fallback_max], 1):
@@ -211,6 +243,8 @@ class Agent:
                 self._append_turn(user_message, reply)
             return {"reply": reply, "tool_used": None, "tool_result": None}
 
+        report = prompt_stats(stats)
+        token_estimator.calibrate(messages, stats.get("prompt_eval_count"))
         tool_call = try_parse_tool_call(assistant)
         if not tool_call:
             final_reply = _post_process_reply(assistant, user_message)
@@ -220,10 +254,12 @@ class Agent:
                 "reply": final_reply,
                 "tool_used": None,
                 "tool_result": None,
+                "prompt_stats": report,
+                "context_budget": budget,
             }
 
         tool_name, args = tool_call
-        tool_result = execute_tool(tool_name, args)
+        tool_result = await execute_tool_async(tool_name, args)
 
         if getattr(settings, "FAST_REPLY", True):
             formatted = _format_tool_reply(tool_name, tool_result)
@@ -234,6 +270,8 @@ class Agent:
                 "reply": final_reply,
                 "tool_used": {"tool": tool_name, "args": args},
                 "tool_result": tool_result,
+                "prompt_stats": report,
+                "context_budget": budget,
             }
 
         # Full path: ask model to summarize tool result
@@ -248,6 +286,7 @@ class Agent:
                 messages=followup_messages,
                 num_predict=num_predict if num_predict > 0 else -1,
                 num_ctx=num_ctx if num_ctx > 0 else 0,
+                priority="summarization",
             )
             final_reply = _post_process_reply(model_reply, user_message)
         except Exception:
@@ -261,15 +300,23 @@ class Agent:
             "reply": final_reply,
             "tool_used": {"tool": tool_name, "args": args},
             "tool_result": tool_result,
+            "prompt_stats": report,
+            "context_budget": budget,
         }
 
     async def handle_chat_stream(self, user_message: str, history: list[dict] | None = None) -> AsyncIterator[Dict[str, Any]]:
         """
         Stream the AI reply chunk by chunk. Yields {"type": "chunk", "text": "..."} then
         {"type": "done", "reply": "...", "tool_used": ..., "tool_result": ...}.
-        Greetings yield only "done". On error yields {"type": "error", "message": "..."}.
+        Greetings and commands handled by the intent router yield only "done". On error yields {"type": "error", "message": "..."}.
+        A reply that starts with tool-call JSON is not forwarded as chunks: generation is
+        cancelled as soon as the JSON object closes and the tool runs right away.
         """
         use_db_history = history is not None
+        intent = route_intent(user_message)
+        if intent is not None:
+            yield {"type": "done", **await self._handle_routed(intent, user_message, use_db_history)}
+            return
         if _is_greeting(user_message):
             replies = get_greeting_replies()
             if not replies:
@@ -281,51 +328,55 @@ class Agent:
             yield {"type": "done", "reply": reply, "tool_used": None, "tool_result": None}
             return
 
-        tool_list = [
-            {"name": spec.name, "description": spec.description}
-            for spec in TOOLS.values()
-        ]
-        effective = self._effective_history(history)
-        prefs = get_all_preferences()
-        learned_facts = get_all_learned_facts()
-        prefs_text = "\n".join([f"- {k}: {v}" for k, v in prefs.items()]) if prefs else "None"
-        facts_text = "\n".join([f"- {k}: {v}" for k, v in learned_facts.items()]) if learned_facts else "None"
-        memory_text = f"User preferences:\n{prefs_text}\n\nLearned facts:\n{facts_text}"
-        messages = [
-            {"role": "system", "content": get_chat_system_prompt()},
-            {"role": "system", "content": f"Long-term memory:\n{memory_text}"},
-            {"role": "system", "content": f"Allowed tools: {json.dumps(tool_list)}"},
-            *effective,
-            {"role": "user", "content": user_message},
-        ]
+        messages, budget = self._build_messages(user_message, history)
 
         num_predict = getattr(settings, "OLLAMA_NUM_PREDICT", -1)
         num_ctx = getattr(settings, "OLLAMA_NUM_CTX", 0)
         accumulated = []
+        detector = StreamingToolCallDetector()
+        stats: Dict[str, Any] = {}
+        stream = self.ollama.chat_stream(
+            model=self.model,
+            messages=messages,
+            num_predict=num_predict if num_predict > 0 else -1,
+            num_ctx=num_ctx if num_ctx > 0 else 0,
+            stats=stats,
+        )
         try:
-            async for chunk in self.ollama.chat_stream(
-                model=self.model,
-                messages=messages,
-                num_predict=num_predict if num_predict > 0 else -1,
-                num_ctx=num_ctx if num_ctx > 0 else 0,
-            ):
-                accumulated.append(chunk)
-                yield {"type": "chunk", "text": chunk}
+            # aclosing() makes breaking out of the loop close the HTTP stream, which
+            # tells Ollama to stop generating tokens nobody will read.
+            async with aclosing(stream):
+                async for chunk in stream:
+                    accumulated.append(chunk)
+                    text = detector.feed(chunk)
+                    if text:
+                        yield {"type": "chunk", "text": text}
+                    if detector.complete:
+                        break
         except Exception as e:
             yield {"type": "error", "message": str(e)}
             return
 
+        if detector.complete:
+            tool_call = detector.tool_call
+        else:
+            # Held-back text that never became a tool call still belongs to the reply.
+            held = detector.held_text
+            if held:
+                yield {"type": "chunk", "text": held}
+            tool_call = try_parse_tool_call("".join(accumulated))
         assistant = "".join(accumulated)
-        tool_call = try_parse_tool_call(assistant)
+        report = prompt_stats(stats)
+        token_estimator.calibrate(messages, stats.get("prompt_eval_count"))
         if not tool_call:
             final_reply = _post_process_reply(assistant, user_message)
             if not use_db_history:
                 self._append_turn(user_message, final_reply)
-            yield {"type": "done", "reply": final_reply, "tool_used": None, "tool_result": None}
+            yield {"type": "done", "reply": final_reply, "tool_used": None, "tool_result": None, "prompt_stats": report, "context_budget": budget}
             return
 
         tool_name, args = tool_call
-        tool_result = execute_tool(tool_name, args)
+        tool_result = await execute_tool_async(tool_name, args)
         formatted = _format_tool_reply(tool_name, tool_result)
         final_reply = _post_process_reply(formatted, user_message)
         if not use_db_history:
@@ -335,4 +386,6 @@ class Agent:
             "reply": final_reply,
             "tool_used": {"tool": tool_name, "args": args},
             "tool_result": tool_result,
+            "prompt_stats": report,
+            "context_budget": budget,
         }
\ No newline at end of file
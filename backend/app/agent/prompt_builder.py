@@ -0,0 +1,71 @@
+"""
+Prompt assembly for chat turns.
+
+Ollama reuses its KV cache for the longest prefix shared with the previous request, so the
+order of messages matters: the character prompt and tool catalogue go first and are built
+to be byte-identical across requests; volatile parts (long-term memory, history, the user
+message) come after them.
+"""
+from __future__ import annotations
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from app.core.prompt_loader import get_chat_system_prompt
+from app.memory.retrieval import memory_prompt
+from app.tools.registry import TOOLS
+
+_static_cache: Dict[str, Any] = {"key": None, "content": "", "hash": ""}
+_last_prefix_hash: Optional[str] = None
+
+
+def _tool_catalogue() -> List[Dict[str, str]]:
+    return [{"name": spec.name, "description": spec.description} for spec in TOOLS.values()]
+
+
+def static_prefix() -> str:
+    """The system message shared by every chat request (character prompt + allowed tools)."""
+    system_prompt = get_chat_system_prompt()
+    tools_json = json.dumps(_tool_catalogue(), ensure_ascii=False)
+    key = (system_prompt, tools_json)
+    if _static_cache["key"] != key:
+        content = f"{system_prompt}\n\nAllowed tools: {tools_json}"
+        _static_cache.update(
+            key=key,
+            content=content,
+            hash=hashlib.sha1(content.encode("utf-8")).hexdigest()[:12],
+        )
+    return _static_cache["content"]
+
+
+def build_chat_messages(
+    user_message: str,
+    memory_text: str,
+    history: List[Dict[str, str]],
+) -> List[Dict[str, str]]:
+    """Assemble the message list: static prefix, then memory, history and the new user message."""
+    messages = [{"role": "system", "content": static_prefix()}]
+    if memory_text:
+        messages.append({"role": "system", "content": memory_prompt(memory_text)})
+    messages.extend(history)
+    messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+def prompt_stats(ollama_stats: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Per-request prompt report: whether the static prefix matched the previous request
+    byte-for-byte, and how many prompt tokens Ollama actually re-evaluated.
+    """
+    global _last_prefix_hash
+    prefix_hash = _static_cache["hash"]
+    reused = prefix_hash == _last_prefix_hash
+    _last_prefix_hash = prefix_hash
+    out: Dict[str, Any] = {"prefix_hash": prefix_hash, "prefix_unchanged": reused}
+    if "prompt_eval_count" in ollama_stats:
+        out["prompt_eval_count"] = ollama_stats["prompt_eval_count"]
+    if "prompt_eval_duration" in ollama_stats:
+        out["prompt_eval_ms"] = round(ollama_stats["prompt_eval_duration"] / 1e6, 1)
+    if "eval_count" in ollama_stats:
+        out["eval_count"] = ollama_stats["eval_count"]
+    return out
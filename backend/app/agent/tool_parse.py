@@ -73,4 +73,117 @@ def try_parse_tool_call(text: str) -> Optional[Tuple[str, Dict[str, Any]]]:
                     return tool, args
             except Exception:
                 continue
-    return None
\ No newline at end of file
+    return None
+
+_TOOL_KEY = '"tool"'
+
+
+class StreamingToolCallDetector:
+    """
+    Incrementally classify a streamed model reply as plain text or a leading tool call.
+
+    feed() returns the text that is safe to forward to the client. While the start of
+    the reply could still be a tool call ({"tool": ...}, optionally inside a ```json fence)
+    nothing is forwarded. Once the prefix is confirmed, chunks are held back until the JSON
+    object closes; `complete` then becomes True and `tool_call` holds the parsed call.
+    """
+
+    # Undecided prefixes longer than this are treated as text (a tool prefix is short).
+    _MAX_PREFIX = 64
+
+    def __init__(self) -> None:
+        self.mode = "undecided"  # "undecided" | "text" | "tool"
+        self.complete = False
+        self.tool_call: Optional[Tuple[str, Dict[str, Any]]] = None
+        self._buffer = ""
+        self._json_start = -1
+        self._scan_pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._quote: Optional[str] = None
+
+    @property
+    def held_text(self) -> str:
+        """Text received but not forwarded (a tool call in progress or an undecided prefix)."""
+        return self._buffer
+
+    def feed(self, chunk: str) -> str:
+        if self.mode == "text":
+            return chunk
+        self._buffer += chunk
+        if self.mode == "undecided":
+            state = self._prefix_state(self._buffer)
+            if state == "maybe" and len(self._buffer) <= self._MAX_PREFIX:
+                return ""
+            if state != "match":
+                return self._release()
+            self.mode = "tool"
+            self._json_start = self._buffer.index("{")
+            self._scan_pos = self._json_start
+        if not self.complete and self._scan():
+            # Looked like a tool call but did not parse: hand it all back as text.
+            return self._release()
+        return ""
+
+    def _release(self) -> str:
+        """Switch to text mode and hand back everything held so far."""
+        self.mode = "text"
+        text, self._buffer = self._buffer, ""
+        return text
+
+    def _scan(self) -> bool:
+        """Advance the brace scanner. Returns True if the object closed but was not a tool call."""
+        s = self._buffer
+        i = self._scan_pos
+        while i < len(s):
+            c = s[i]
+            i += 1
+            if self._escape:
+                self._escape = False
+            elif self._in_string:
+                if c == "\\":
+                    self._escape = True
+                elif c == self._quote:
+                    self._in_string = False
+            elif c in ("'", '"'):
+                self._in_string = True
+                self._quote = c
+            elif c == "{":
+                self._depth += 1
+            elif c == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._scan_pos = i
+                    self.tool_call = try_parse_tool_call(s[self._json_start : i])
+                    self.complete = self.tool_call is not None
+                    return not self.complete
+        self._scan_pos = i
+        return False
+
+    @staticmethod
+    def _prefix_state(buf: str) -> str:
+        """Return "match" if buf starts a tool call, "maybe" if it still could, else "no"."""
+        rest = buf.lstrip()
+        if not rest:
+            return "maybe"
+        if rest[0] == "`":
+            if len(rest) < 3:
+                return "maybe" if "```".startswith(rest) else "no"
+            if not rest.startswith("```"):
+                return "no"
+            rest = rest[3:]
+            lang = rest[:4].lower()
+            if len(rest) < 4 and "json".startswith(lang):
+                return "maybe"
+            if lang == "json":
+                rest = rest[4:]
+            rest = rest.lstrip()
+            if not rest:
+                return "maybe"
+        if rest[0] != "{":
+            return "no"
+        rest = rest[1:].lstrip()
+        if len(rest) < len(_TOOL_KEY):
+            return "maybe" if _TOOL_KEY.startswith(rest.lower()) else "no"
+        return "match" if rest[: len(_TOOL_KEY)].lower() == _TOOL_KEY else "no"
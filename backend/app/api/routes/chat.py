@@ -1,8 +1,7 @@
-import asyncio
 import json
 from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query, Response
 from fastapi.responses import StreamingResponse
 
 from app.api.schemas.chat import (
@@ -14,11 +13,22 @@ from app.api.schemas.chat import (
     SessionMessagesResponse,
 )
 from app.core.config import settings
+from app.core.metrics import request_timings, stage
 from app.llm.ollama_client import OllamaClient
+from app.llm.scheduler import llm_scheduler
+from app.agent.intent_router import get_intent_stats
 from app.agent.orchestrator import Agent
 from app.core.prompt_loader import get_greeting_message
-from app.memory.repo import add_message, get_recent_messages, get_session_messages, log_tool, list_sessions
-from app.memory.learning import learn_from_conversation
+from app.memory.repo import (
+    add_message_async,
+    flush_writes_async,
+    get_recent_messages_async,
+    get_session_messages,
+    iter_session_messages,
+    list_sessions,
+    log_tool_async,
+)
+from app.memory.learning_scheduler import learning_scheduler
 
 router = APIRouter(tags=["chat"])
 
@@ -32,25 +42,65 @@ async def chat_greeting():
     return GreetingResponse(message=get_greeting_message())
 
 
+@router.get("/chat/intent/stats")
+async def intent_stats():
+    """Local intent router: messages answered without the model (hit rate, per rule) and near misses."""
+    return get_intent_stats()
+
+
 @router.get("/chat/sessions", response_model=list[SessionListItem])
-async def get_sessions():
-    """List chat sessions ordered by last activity (most recent first)."""
-    return list_sessions(limit=50)
+async def get_sessions(response: Response, limit: int = Query(50, ge=1, le=200), cursor: str | None = None):
+    """
+    List chat sessions ordered by last activity (most recent first).
+    If more sessions exist, the X-Next-Cursor header holds the cursor for the next page.
+    """
+    try:
+        await flush_writes_async()
+        sessions, next_cursor = list_sessions(limit=limit, cursor=cursor, flush=False)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return sessions
 
 
 @router.get("/chat/sessions/{session_id}/messages", response_model=SessionMessagesResponse)
-async def get_session_messages_route(session_id: str):
-    """Get messages for a session in chronological order."""
-    rows = get_session_messages(session_id, limit=100)
+async def get_session_messages_route(
+    session_id: str,
+    limit: int = Query(100, ge=1, le=500),
+    before: int | None = None,
+    after: int | None = None,
+):
+    """
+    Get a page of messages for a session in chronological order. By default the newest page;
+    pass `before=<next_before>` to lazy-load older scrollback, or `after=<id>` to fetch newer messages.
+    """
+    if before is not None and after is not None:
+        raise HTTPException(status_code=400, detail="Use either before or after, not both.")
+    await flush_writes_async()
+    rows, has_more = get_session_messages(session_id, limit=limit, before=before, after=after, flush=False)
+    next_before = rows[0]["id"] if rows and has_more and after is None else None
     return SessionMessagesResponse(
         session_id=session_id,
         messages=[
-            SessionMessage(role=m["role"], content=m["content"], created_at=m.get("created_at", ""))
+            SessionMessage(id=m["id"], role=m["role"], content=m["content"], created_at=m.get("created_at", ""))
             for m in rows
         ],
+        has_more=has_more,
+        next_before=next_before,
     )
 
 
+@router.get("/chat/sessions/{session_id}/messages/stream")
+def stream_session_messages(session_id: str):
+    """Stream the whole session as NDJSON (one message per line, oldest first) without loading it all in memory."""
+    def lines():
+        for m in iter_session_messages(session_id):
+            yield json.dumps(m) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat(req: ChatRequest):
     """Send a message to the AI agent; may trigger a tool and return a summarized reply. Session-based memory is used when session_id is provided or generated."""
@@ -59,36 +109,28 @@ async def chat(req: ChatRequest):
     msg = req.message.strip()
     session_id = req.session_id or uuid4().hex
 
-    history = get_recent_messages(session_id, limit=settings.CHAT_HISTORY_FETCH_LIMIT)
-    add_message(session_id, "user", msg)
+    # Reject up front if the model queue is already full (429 + Retry-After).
+    llm_scheduler.check_admission(settings.OLLAMA_MODEL)
+
+    with stage("history"):
+        history = await get_recent_messages_async(session_id, limit=settings.CHAT_HISTORY_FETCH_LIMIT)
 
-    result = await agent.handle_chat(msg, history=history)
+    async with learning_scheduler.interactive():
+        result = await agent.handle_chat(msg, history=history)
 
-    add_message(session_id, "assistant", result["reply"])
+    # Persisted only once there is a reply, so a request rejected or failed in handle_chat leaves no orphan user turn.
+    await add_message_async(session_id, "user", msg)
+    await add_message_async(session_id, "assistant", result["reply"])
     if result.get("tool_used") and result.get("tool_result"):
-        log_tool(
+        await log_tool_async(
             session_id,
             result["tool_used"]["tool"],
             result["tool_used"]["args"],
             result["tool_result"],
         )
 
-    # Auto-learn in background so response returns immediately
-    async def _learn_background():
-        try:
-            learned = await learn_from_conversation(
-                msg,
-                result["reply"],
-                session_id,
-                ollama,
-                settings.OLLAMA_MODEL,
-            )
-            if learned:
-                result["learned_facts"] = learned
-        except Exception:
-            pass
-
-    asyncio.create_task(_learn_background())
+    # Auto-learn in the background, batched per session and only while no chat is generating
+    learning_scheduler.submit(session_id, msg, result["reply"])
 
     result["session_id"] = session_id
     return result
@@ -99,7 +141,7 @@ async def chat_stream(req: ChatRequest):
     """
     Stream the AI reply as Server-Sent Events. Each event is a JSON object:
     - {"type": "chunk", "text": "..."} for incremental text
-    - {"type": "done", "reply": "...", "session_id": "...", "tool_used": ..., "tool_result": ...} when finished
+    - {"type": "done", "reply": "...", "session_id": "...", "tool_used": ..., "tool_result": ..., "timings": {...}} when finished
     - {"type": "error", "message": "..."} on error
     """
     if not req.message or not req.message.strip():
@@ -107,39 +149,35 @@ async def chat_stream(req: ChatRequest):
     msg = req.message.strip()
     session_id = req.session_id or uuid4().hex
 
-    history = get_recent_messages(session_id, limit=settings.CHAT_HISTORY_FETCH_LIMIT)
-    add_message(session_id, "user", msg)
+    # Reject before the 200 SSE response starts if the model queue is already full (429 + Retry-After).
+    llm_scheduler.check_admission(settings.OLLAMA_MODEL)
+
+    with stage("history"):
+        history = await get_recent_messages_async(session_id, limit=settings.CHAT_HISTORY_FETCH_LIMIT)
+    await add_message_async(session_id, "user", msg)
 
     async def event_stream():
-        async for event in agent.handle_chat_stream(msg, history=history):
-            if event.get("type") == "done":
-                event["session_id"] = session_id
-                add_message(session_id, "assistant", event["reply"])
-                if event.get("tool_used") and event.get("tool_result"):
-                    log_tool(
-                        session_id,
-                        event["tool_used"]["tool"],
-                        event["tool_used"]["args"],
-                        event["tool_result"],
-                    )
-                # Yield done immediately so client gets response fast
-                yield f"data: {json.dumps(event)}\n\n"
-                # Auto-learn in background (don't block the stream)
-                reply = event.get("reply") or ""
-
-                async def _learn_stream():
-                    try:
-                        learned = await learn_from_conversation(
-                            msg, reply, session_id, ollama, settings.OLLAMA_MODEL
+        async with learning_scheduler.interactive():
+            async for event in agent.handle_chat_stream(msg, history=history):
+                if event.get("type") == "done":
+                    event["session_id"] = session_id
+                    await add_message_async(session_id, "assistant", event["reply"])
+                    if event.get("tool_used") and event.get("tool_result"):
+                        await log_tool_async(
+                            session_id,
+                            event["tool_used"]["tool"],
+                            event["tool_used"]["args"],
+                            event["tool_result"],
                         )
-                        if learned:
-                            event["learned_facts"] = learned
-                    except Exception:
-                        pass
-
-                asyncio.create_task(_learn_stream())
-            else:
-                yield f"data: {json.dumps(event)}\n\n"
+                    timings = request_timings()
+                    if timings is not None:
+                        event["timings"] = timings
+                    # Yield done immediately so client gets response fast
+                    yield f"data: {json.dumps(event)}\n\n"
+                    # Auto-learn in background (don't block the stream)
+                    learning_scheduler.submit(session_id, msg, event.get("reply") or "")
+                else:
+                    yield f"data: {json.dumps(event)}\n\n"
 
     return StreamingResponse(
         event_stream(),
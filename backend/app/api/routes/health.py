@@ -1,8 +1,33 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Response
+
+from app.core.metrics import CONTENT_TYPE, render_metrics
+from app.llm.model_warmer import model_warmer
+from app.llm.scheduler import llm_scheduler
 
 router = APIRouter(tags=["health"])
 
 @router.get("/health")
 def health():
     """Liveness check for the backend."""
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+
+@router.get("/health/llm")
+def llm_health():
+    """LLM request scheduler: in-flight/queued requests per model and queue-wait times per priority class."""
+    return {"scheduler": llm_scheduler.stats()}
+
+
+@router.get("/metrics")
+def metrics():
+    """Prometheus text format: per-stage and per-route request duration histograms."""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE)
+
+
+@router.get("/health/ready")
+async def readiness(response: Response):
+    """Readiness: 200 when the chat model is loaded in Ollama, else 503. Lists residency of each configured model."""
+    report = await model_warmer.readiness()
+    if not report["ready"]:
+        response.status_code = 503
+    return report
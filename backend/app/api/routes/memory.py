@@ -1,6 +1,7 @@
 from fastapi import APIRouter
 from app.api.schemas.memory import SetPreferenceRequest, SetPreferenceResponse, GetPreferencesResponse
-from app.memory.repo import set_preference, get_all_preferences
+from app.memory.repo import set_preference, get_all_preferences, get_write_stats
+from app.memory.learning_scheduler import learning_scheduler
 
 router = APIRouter(tags=["memory"])
 
@@ -14,3 +15,15 @@ def save_preference(req: SetPreferenceRequest):
 @router.get("/memory/preferences", response_model=GetPreferencesResponse)
 def list_preferences():
     return GetPreferencesResponse(preferences=get_all_preferences())
+
+
+@router.get("/memory/db/stats")
+def db_stats():
+    """Write-behind queue mode, depth and batching counters."""
+    return get_write_stats()
+
+
+@router.get("/memory/learning/stats")
+def learning_stats():
+    """Auto-learn queue depth, lag and batch counters."""
+    return learning_scheduler.stats()
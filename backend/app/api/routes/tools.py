@@ -0,0 +1,11 @@
+from fastapi import APIRouter
+
+from app.tools.router import tool_cache
+
+router = APIRouter(tags=["tools"])
+
+
+@router.get("/tools/stats")
+def tool_stats():
+    """Tool result cache size and per-tool hit/miss/eviction counters."""
+    return {"cache": tool_cache.stats()}
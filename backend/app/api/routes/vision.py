@@ -1,11 +1,21 @@
 from __future__ import annotations
+import hashlib
+import json
+from contextlib import aclosing
+from typing import Any, Dict, Optional, Tuple
 
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi.responses import StreamingResponse
 
 from app.core.config import settings
+from app.core.metrics import request_timings
 from app.core.prompt_loader import get_prompt
-from app.core.storage import save_upload_bytes
+from app.core.storage import find_upload, save_upload_bytes, upload_collector
+from app.llm.image_prep import Crop, parse_crop
 from app.llm.ollama_vision import OllamaVisionClient
+from app.llm.scheduler import llm_scheduler
+from app.memory.learning_scheduler import learning_scheduler
+from app.memory.repo import get_vision_result, save_vision_result
 from app.tools.registry import TOOLS
 from app.api.schemas.vision import (
     VisionResponse,
@@ -13,28 +23,85 @@ from app.api.schemas.vision import (
     VisionProposeToolResponse,
 )
 from app.agent.tool_parse import try_parse_tool_call
-from app.tools.router import execute_tool
+from app.tools.router import execute_tool_async
 
 router = APIRouter(tags=["vision"])
 vision_client = OllamaVisionClient(settings.OLLAMA_URL)
 
+
+def _request_key(prompt: str, crop: Optional[Crop], temperature: float) -> str:
+    """Everything besides image and model that changes the reply, including how the image is preprocessed."""
+    parts = [
+        prompt,
+        crop,
+        temperature,
+        getattr(settings, "VISION_PREPROCESS_ENABLED", True),
+        getattr(settings, "VISION_MAX_IMAGE_SIDE", 1024),
+        getattr(settings, "VISION_IMAGE_FORMAT", "jpeg"),
+    ]
+    return hashlib.sha256(json.dumps(parts).encode("utf-8")).hexdigest()[:32]
+
+
+async def _analyze_image(
+    image_id: str,
+    image_bytes: bytes,
+    prompt: str,
+    crop: Optional[Crop],
+    temperature: float = 0.2,
+) -> Tuple[str, Dict[str, Any]]:
+    """Vision reply for the image, served from the vision cache when the same request was answered before."""
+    model = settings.OLLAMA_VISION_MODEL
+    use_cache = getattr(settings, "VISION_CACHE_ENABLED", True)
+    key = _request_key(prompt, crop, temperature)
+    if use_cache:
+        cached = get_vision_result(image_id, model, key)
+        if cached is not None:
+            return cached, {"cached": True}
+
+    vision_stats: Dict[str, Any] = {"cached": False}
+    async with learning_scheduler.interactive():
+        reply = await vision_client.chat_with_image(
+            model=model,
+            prompt=prompt,
+            image_bytes=image_bytes,
+            temperature=temperature,
+            crop=crop,
+            stats=vision_stats,
+        )
+    if use_cache:
+        save_vision_result(image_id, model, key, reply, getattr(settings, "VISION_CACHE_MAX_ENTRIES", 1000))
+    return reply, vision_stats
+
+
+def _parse_crop_or_400(value: Optional[str]) -> Optional[Crop]:
+    try:
+        return parse_crop(value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid crop: {e}")
+
+
 @router.post("/vision", response_model=VisionResponse)
 async def vision(
     message: str = Form(...),
     image: UploadFile = File(...),
+    crop: Optional[str] = Form(None),
 ):
-    """Analyze an image with the vision model and return a text reply."""
+    """
+    Analyze an image with the vision model and return a text reply.
+    crop: optional region 'left,top,right,bottom' as fractions of the image (e.g. '0.5,0,1,0.5').
+    """
     if not (message and message.strip()):
         raise HTTPException(status_code=400, detail="message must be non-empty.")
     message = message.strip()
+    crop_box = _parse_crop_or_400(crop)
     # Validate file type
     if not image.content_type or not image.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Uploaded file must be an image.")
 
     image_bytes = await image.read()
 
-    # Save image to disk
-    image_id, saved_path = save_upload_bytes(image.filename or "upload.png", image_bytes)
+    # Save image to disk (deduplicated by content: image_id is the content hash)
+    image_id, saved_path = save_upload_bytes(image.filename or "upload.png", image_bytes, mime=image.content_type)
 
     prompt = get_prompt(
         "vision_analyze",
@@ -42,12 +109,7 @@ async def vision(
         message=message,
     )
 
-    reply = await vision_client.chat_with_image(
-        model=settings.OLLAMA_VISION_MODEL,
-        prompt=prompt,
-        image_bytes=image_bytes,
-        temperature=0.2,
-    )
+    reply, vision_stats = await _analyze_image(image_id, image_bytes, prompt, crop_box)
 
     return VisionResponse(
         reply=reply,
@@ -57,6 +119,98 @@ async def vision(
         saved_path=saved_path,
         tool_used=None,
         tool_result=None,
+        vision_stats=vision_stats,
+    )
+
+
+@router.post("/vision/stream")
+async def vision_stream(
+    message: str = Form(...),
+    image: UploadFile = File(...),
+    crop: Optional[str] = Form(None),
+):
+    """
+    Analyze an image and stream the reply as Server-Sent Events (same protocol as /chat/stream):
+    - {"type": "chunk", "text": "..."} for incremental text
+    - {"type": "done", "reply": "...", "model": "...", "image_id": "...", "saved_path": "...", "vision_stats": {...}, "timings": {...}} when finished
+    - {"type": "error", "message": "..."} on error
+    A cached reply is sent as a single chunk followed by done.
+    """
+    if not (message and message.strip()):
+        raise HTTPException(status_code=400, detail="message must be non-empty.")
+    message = message.strip()
+    crop_box = _parse_crop_or_400(crop)
+    if not image.content_type or not image.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Uploaded file must be an image.")
+
+    model = settings.OLLAMA_VISION_MODEL
+    # Reject before the 200 SSE response starts if the model queue is already full (429 + Retry-After).
+    llm_scheduler.check_admission(model)
+
+    image_bytes = await image.read()
+    image_id, saved_path = save_upload_bytes(image.filename or "upload.png", image_bytes, mime=image.content_type)
+    prompt = get_prompt(
+        "vision_analyze",
+        settings.PROMPT_VISION_ANALYZE,
+        message=message,
+    )
+    temperature = 0.2
+    use_cache = getattr(settings, "VISION_CACHE_ENABLED", True)
+    key = _request_key(prompt, crop_box, temperature)
+
+    def done_event(reply: str, vision_stats: Dict[str, Any]) -> str:
+        event = {
+            "type": "done",
+            "reply": reply,
+            "model": model,
+            "filename": image.filename,
+            "image_id": image_id,
+            "saved_path": saved_path,
+            "vision_stats": vision_stats,
+        }
+        timings = request_timings()
+        if timings is not None:
+            event["timings"] = timings
+        return f"data: {json.dumps(event)}\n\n"
+
+    async def event_stream():
+        if use_cache:
+            cached = get_vision_result(image_id, model, key)
+            if cached is not None:
+                yield f"data: {json.dumps({'type': 'chunk', 'text': cached})}\n\n"
+                yield done_event(cached, {"cached": True})
+                return
+
+        vision_stats: Dict[str, Any] = {"cached": False}
+        accumulated = []
+        stream = vision_client.chat_with_image_stream(
+            model=model,
+            prompt=prompt,
+            image_bytes=image_bytes,
+            temperature=temperature,
+            crop=crop_box,
+            stats=vision_stats,
+        )
+        async with learning_scheduler.interactive():
+            try:
+                # aclosing() closes the HTTP stream if the client disconnects, so Ollama stops generating.
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        accumulated.append(chunk)
+                        yield f"data: {json.dumps({'type': 'chunk', 'text': chunk})}\n\n"
+            except Exception as e:
+                yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
+                return
+
+        reply = "".join(accumulated)
+        if use_cache:
+            save_vision_result(image_id, model, key, reply, getattr(settings, "VISION_CACHE_MAX_ENTRIES", 1000))
+        yield done_event(reply, vision_stats)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
@@ -65,14 +219,16 @@ async def vision_propose_tool(req: VisionProposeToolRequest):
     """Propose (and optionally execute) a tool based on the image and message. Set execute=true to run the tool."""
     if not (req.message and req.message.strip()):
         raise HTTPException(status_code=400, detail="message must be non-empty.")
-    # Load the saved image by image_id (file may have any allowed image extension)
-    from app.core.storage import UPLOAD_DIR
-
-    matches = list(UPLOAD_DIR.glob(f"{req.image_id}.*"))
-    if not matches:
+    crop_box = _parse_crop_or_400(req.crop)
+    # Load the saved image by image_id (indexed lookup in the uploads table)
+    file_path = find_upload(req.image_id)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="image_id not found in uploads.")
+    try:
+        image_bytes = file_path.read_bytes()
+    except FileNotFoundError:
+        # Removed by the upload collector between the lookup and the read.
         raise HTTPException(status_code=404, detail="image_id not found in uploads.")
-    file_path = matches[0]
-    image_bytes = file_path.read_bytes()
 
     allowed_tools = ", ".join(TOOLS.keys()) if TOOLS else "open_app"
     prompt = get_prompt(
@@ -82,12 +238,7 @@ async def vision_propose_tool(req: VisionProposeToolRequest):
         allowed_tools=allowed_tools,
     )
 
-    raw = await vision_client.chat_with_image(
-        model=settings.OLLAMA_VISION_MODEL,
-        prompt=prompt,
-        image_bytes=image_bytes,
-        temperature=0.2,
-    )
+    raw, vision_stats = await _analyze_image(req.image_id, image_bytes, prompt, crop_box)
 
     proposed = None
     executed = False
@@ -100,7 +251,7 @@ async def vision_propose_tool(req: VisionProposeToolRequest):
 
         # Safety default: don't execute unless explicitly requested
         if req.execute is True:
-            tool_result = execute_tool(tool_name, args)
+            tool_result = await execute_tool_async(tool_name, args)
             executed = True
 
             # Provide a user-friendly reply after execution
@@ -118,4 +269,11 @@ async def vision_propose_tool(req: VisionProposeToolRequest):
         proposed_tool=proposed,
         executed=executed,
         tool_result=tool_result,
-    )
\ No newline at end of file
+        vision_stats=vision_stats,
+    )
+
+
+@router.get("/vision/uploads/stats")
+def upload_stats():
+    """Upload directory usage against its quotas, and what the upload collector has reclaimed."""
+    return upload_collector.report()
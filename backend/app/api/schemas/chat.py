@@ -11,6 +11,12 @@ class ChatResponse(BaseModel):
     tool_used: Optional[Dict[str, Any]] = None
     tool_result: Optional[Dict[str, Any]] = None
     learned_facts: Optional[List[str]] = None
+    # Prompt-cache report: static prefix hash/stability and Ollama's prompt_eval_count.
+    prompt_stats: Optional[Dict[str, Any]] = None
+    # Context-window budget decisions (section sizes, what was trimmed).
+    context_budget: Optional[Dict[str, Any]] = None
+    # Set when the local intent router ran the tool without the model: matched rule and confidence.
+    intent_route: Optional[Dict[str, Any]] = None
 
 
 class GreetingResponse(BaseModel):
@@ -26,6 +32,7 @@ class SessionListItem(BaseModel):
 
 
 class SessionMessage(BaseModel):
+    id: Optional[int] = None
     role: str
     content: str
     created_at: str
@@ -33,4 +40,8 @@ class SessionMessage(BaseModel):
 
 class SessionMessagesResponse(BaseModel):
     session_id: str
-    messages: List[SessionMessage]
\ No newline at end of file
+    messages: List[SessionMessage]
+    # More messages exist beyond this page (older ones, or newer ones when paging with `after`).
+    has_more: bool = False
+    # Pass as `before` to load the previous (older) page; set only when has_more and not paging with `after`.
+    next_before: Optional[int] = None
\ No newline at end of file
@@ -14,11 +14,16 @@ class VisionResponse(BaseModel):
     tool_used: Optional[Dict[str, Any]] = None
     tool_result: Optional[Dict[str, Any]] = None
 
+    # Payload size, preprocessing/encode time and model latency for this call.
+    vision_stats: Optional[Dict[str, Any]] = None
+
 
 class VisionProposeToolRequest(BaseModel):
     image_id: str
     message: str
     execute: bool = False  
+    # Optional region 'left,top,right,bottom' as fractions of the image.
+    crop: Optional[str] = None
 
 
 class VisionProposeToolResponse(BaseModel):
@@ -27,4 +32,5 @@ class VisionProposeToolResponse(BaseModel):
     image_id: str
     proposed_tool: Optional[Dict[str, Any]] = None
     executed: bool = False
-    tool_result: Optional[Dict[str, Any]] = None
\ No newline at end of file
+    tool_result: Optional[Dict[str, Any]] = None
+    vision_stats: Optional[Dict[str, Any]] = None
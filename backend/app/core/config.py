@@ -18,8 +18,37 @@ class Settings(BaseSettings):
     OLLAMA_NUM_PREDICT: int = 256
     # Context window size. Smaller = faster first token (e.g. 1024, 2048). 0 = use Ollama default.
     OLLAMA_NUM_CTX: int = 1024
+    # LLM request scheduler: concurrent requests per model sent to Ollama (match OLLAMA_NUM_PARALLEL),
+    # interactive requests allowed to wait before new ones get 429 + Retry-After, and how long a
+    # background (summarization/learning) request waits before it competes as interactive.
+    LLM_MAX_IN_FLIGHT_PER_MODEL: int = 1
+    LLM_MAX_QUEUE_DEPTH: int = 8
+    LLM_PRIORITY_AGING_SECONDS: float = 30.0
+    # How long Ollama keeps a model loaded after each request (e.g. "30m", "-1" = forever, "" = Ollama default).
+    OLLAMA_KEEP_ALIVE: str = "30m"
+    # Preload the chat (with its system prompt) and vision models on startup, and during
+    # MODEL_ACTIVE_HOURS ("08:00-23:00"; empty = always) reload/extend them every MODEL_REFRESH_MINUTES.
+    MODEL_PRELOAD_ENABLED: bool = True
+    MODEL_PRELOAD_VISION: bool = True
+    MODEL_ACTIVE_HOURS: str = ""
+    MODEL_REFRESH_MINUTES: float = 10.0
+    # Vision images are cropped/downscaled to this longest side and re-encoded (jpeg|png) before
+    # being sent; needs Pillow, otherwise images are sent as uploaded.
+    VISION_PREPROCESS_ENABLED: bool = True
+    VISION_MAX_IMAGE_SIDE: int = 1024
+    VISION_IMAGE_FORMAT: str = "jpeg"
+    VISION_JPEG_QUALITY: int = 85
     # If True, skip the second LLM call after a tool run and format the result in-code (faster).
     FAST_REPLY: bool = True
+    # Time each request stage (history, memory, prompt, LLM queue/prefill/generation, tools, DB
+    # writes): histograms on GET /metrics, a Server-Timing header and "timings" in the stream's
+    # done event. Off = the timing middleware is not installed.
+    STAGE_TIMINGS_ENABLED: bool = True
+    # Local intent router: obvious tool commands ("open spotify", "search the web for X", "list my
+    # files") run the tool directly without an LLM call when a rule matches with at least this
+    # confidence (0.0-1.0). Anything less certain goes to the model.
+    INTENT_ROUTER_ENABLED: bool = True
+    INTENT_ROUTER_MIN_CONFIDENCE: float = 0.85
     # Conversation turns to keep in context (fewer = faster inference).
     CHAT_MAX_HISTORY_TURNS: int = 3
     # If True, use a shorter system prompt for faster first-token (less personality detail).
@@ -28,6 +57,28 @@ class Settings(BaseSettings):
     AUTO_LEARN_ENABLED: bool = True
     # Minimum confidence (0.0-1.0) for auto-learned facts to be saved.
     AUTO_LEARN_CONFIDENCE_THRESHOLD: float = 0.7
+    # Auto-learn scheduling: turns are batched per session after this many quiet seconds (or once
+    # LEARN_MAX_TURNS_PER_BATCH are queued) and extracted only when no chat has been generating for
+    # LEARN_IDLE_GRACE_SECONDS. At most LEARN_QUEUE_MAX_TURNS wait (oldest dropped first).
+    LEARN_DEBOUNCE_SECONDS: float = 20.0
+    LEARN_MAX_TURNS_PER_BATCH: int = 6
+    LEARN_IDLE_GRACE_SECONDS: float = 2.0
+    LEARN_QUEUE_MAX_TURNS: int = 200
+    # On shutdown, queued turns are still processed for up to this long.
+    LEARN_DRAIN_TIMEOUT_SECONDS: float = 15.0
+    # Local pre-filter: only turns whose user message has a self-disclosure cue ("my ...", "I prefer",
+    # "remember ...") are sent to the extractor. This fraction of skipped turns is extracted anyway
+    # to measure the recall the filter loses (see /memory/learning/stats).
+    LEARN_PREFILTER_ENABLED: bool = True
+    LEARN_PREFILTER_AUDIT_RATE: float = 0.0
+    # Long-term memory in the prompt: at most this many preferences/facts, ranked by relevance
+    # to the current message, within this token budget. If everything fits, all of it is sent.
+    MEMORY_RETRIEVAL_TOP_K: int = 8
+    MEMORY_TOKEN_BUDGET: int = 160
+    # Context budget: share of the free context (after system prompt, message and output reserve)
+    # that long-term memory may use when history also needs room, and a safety margin in tokens.
+    CONTEXT_MEMORY_SHARE: float = 0.25
+    CONTEXT_SAFETY_MARGIN: int = 32
 
     # Server
     SERVER_HOST: str = "0.0.0.0"
@@ -41,14 +92,38 @@ class Settings(BaseSettings):
     # --- Paths (leave empty to use defaults under backend/data/ or backend root) ---
     # SQLite database file path.
     DB_PATH: Optional[str] = None
+    # SQLite tuning: synchronous mode (NORMAL with WAL, or FULL for fsync on every commit),
+    # page cache and memory-mapped I/O sizes per connection.
+    DB_SYNCHRONOUS: str = "NORMAL"
+    DB_CACHE_SIZE_MB: int = 16
+    DB_MMAP_SIZE_MB: int = 64
+    # Chat message/tool-log writes: "sync" (commit inline), "group" (queued, caller waits for the
+    # shared batch commit) or "async" (queued, caller returns at once; a crash can lose chat turns
+    # already answered in the last flush window). Queued writes are committed together every
+    # DB_FLUSH_INTERVAL_MS.
+    DB_WRITE_MODE: str = "group"
+    DB_FLUSH_INTERVAL_MS: int = 50
     # Directory for uploaded images (vision).
     UPLOAD_DIR: Optional[str] = None
     # Comma-separated image extensions allowed for uploads (e.g. .png,.jpg,.jpeg,.webp,.bmp).
     UPLOAD_ALLOWED_EXTENSIONS: str = ".png,.jpg,.jpeg,.webp,.bmp"
+    # Uploads are stored once per content hash. A background collector deletes uploads unused for
+    # UPLOAD_MAX_AGE_DAYS, then the least recently used beyond UPLOAD_DISK_QUOTA_MB (0 = no limit),
+    # every UPLOAD_GC_INTERVAL_MINUTES and whenever an upload pushes usage over the quota.
+    UPLOAD_DISK_QUOTA_MB: float = 500.0
+    UPLOAD_MAX_AGE_DAYS: float = 90.0
+    UPLOAD_GC_INTERVAL_MINUTES: float = 30.0
+    # Vision replies cached by (image content, model, prompt/options); at most this many kept.
+    VISION_CACHE_ENABLED: bool = True
+    VISION_CACHE_MAX_ENTRIES: int = 1000
     # File-ops sandbox base directory (writable by the app).
     FILE_OPS_SAFE_BASE_DIR: Optional[str] = None
     # Comma-separated user folder names allowed for search/read (e.g. Documents,Desktop,Downloads).
     FILE_OPS_USER_FOLDERS: str = "Documents,Desktop,Downloads"
+    # Filename index for file_ops search_user (SQLite, refreshed in the background).
+    FILE_INDEX_ENABLED: bool = True
+    FILE_INDEX_DB_PATH: Optional[str] = None
+    FILE_INDEX_REFRESH_SECONDS: int = 300
 
     # --- Limits ---
     # How many messages to load from DB per session for chat context (match history turns * 2).
@@ -60,6 +135,15 @@ class Settings(BaseSettings):
     WEB_SEARCH_MAX_RESULTS_DEFAULT: int = 5
     WEB_SEARCH_MAX_RESULTS_CAP: int = 10
 
+    # --- Tool runtime ---
+    # Tools run off the event loop. Default per-call timeout (seconds) and worker pool sizes.
+    TOOL_DEFAULT_TIMEOUT: float = 30.0
+    TOOL_THREAD_WORKERS: int = 8
+    TOOL_PROCESS_WORKERS: int = 2
+    # Tool result cache: default TTL (seconds) for cacheable tools and max cached results (LRU).
+    TOOL_CACHE_DEFAULT_TTL: float = 120.0
+    TOOL_CACHE_MAX_ENTRIES: int = 256
+
     # --- Open app ---
     # JSON object of app_name -> executable path. Leave empty "{}" to use code defaults.
     # Paths can use %USERNAME% etc. on Windows.
@@ -0,0 +1,182 @@
+"""
+Per-stage request timings, exported as Prometheus histograms and Server-Timing headers.
+
+StageTimingMiddleware gives every HTTP request a StageTimings object in a context variable;
+code on the request path wraps its stages in `with stage("memory"): ...` (or reports an
+externally measured duration with record_stage, e.g. Ollama's prefill time). When the request
+ends, each stage is observed into aika_stage_duration_seconds{route,stage} and the whole
+request into aika_request_duration_seconds{route,method,status}; GET /metrics renders them.
+
+Stages reached before the response starts are sent as a Server-Timing header. Streaming
+routes also put request_timings() in their final SSE event, since the header is sent before
+generation. With STAGE_TIMINGS_ENABLED off the middleware is not installed, so stage() only
+does one context-variable lookup and returns a shared no-op context manager.
+"""
+from __future__ import annotations
+import threading
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+
+# Seconds; chosen to separate sub-millisecond DB calls from multi-second generations.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus text format, one series per label tuple."""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for labels, series in sorted(snapshot.items()):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.label_names, labels))
+            sep = "," if base else ""
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound:g}"}} {cumulative:g}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {cumulative:g}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative:g}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+STAGE_SECONDS = Histogram(
+    "aika_stage_duration_seconds",
+    "Time spent per request stage (history, memory, prompt, llm_queue, llm_prefill, llm_generate, tool, db_write, ...).",
+    ("route", "stage"),
+)
+REQUEST_SECONDS = Histogram(
+    "aika_request_duration_seconds",
+    "HTTP request duration until the response body is complete.",
+    ("route", "method", "status"),
+)
+
+
+def render_metrics() -> str:
+    return "\n".join(STAGE_SECONDS.render() + REQUEST_SECONDS.render()) + "\n"
+
+
+class StageTimings:
+    """Milliseconds per stage for one request; a stage entered several times accumulates."""
+
+    __slots__ = ("started", "stages")
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, name: str, ms: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + ms
+
+    def snapshot(self) -> Dict[str, float]:
+        timings = {name: round(ms, 2) for name, ms in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 2)
+        return timings
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={ms}" for name, ms in self.snapshot().items())
+
+
+_current: ContextVar[Optional[StageTimings]] = ContextVar("stage_timings", default=None)
+_NOOP = nullcontext()
+
+
+class _Stage:
+    __slots__ = ("timings", "name", "t0")
+
+    def __init__(self, timings: StageTimings, name: str) -> None:
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self) -> None:
+        self.t0 = time.perf_counter()
+
+    def __exit__(self, *exc: Any) -> None:
+        self.timings.add(self.name, (time.perf_counter() - self.t0) * 1000)
+
+
+def stage(name: str):
+    """Time the block as stage `name` of the current request (no-op outside a timed request)."""
+    timings = _current.get()
+    if timings is None:
+        return _NOOP
+    return _Stage(timings, name)
+
+
+def record_stage(name: str, ms: float) -> None:
+    """Add an externally measured duration (ms) to the current request's stage `name`."""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, ms)
+
+
+def request_timings() -> Optional[Dict[str, float]]:
+    """Stage timings of the current request so far (ms, plus "total"), or None when not timed."""
+    timings = _current.get()
+    return timings.snapshot() if timings is not None else None
+
+
+class StageTimingMiddleware:
+    """ASGI middleware: times each HTTP request, adds Server-Timing and feeds the histograms."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        timings = StageTimings()
+        token = _current.set(timings)
+        status = "500"
+
+        async def send_with_timing(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                headers = list(message.get("headers") or [])
+                headers.append((b"server-timing", timings.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            route = scope.get("route")
+            # Route templates ("/chat/sessions/{session_id}/messages") keep label cardinality bounded.
+            route_label = getattr(route, "path", None) or "unmatched"
+            for name, ms in timings.stages.items():
+                STAGE_SECONDS.observe((route_label, name), ms / 1000)
+            REQUEST_SECONDS.observe((route_label, scope.get("method", ""), status), time.perf_counter() - timings.started)
@@ -1,28 +1,208 @@
 from __future__ import annotations
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta
 from pathlib import Path
-from datetime import datetime
-from uuid import uuid4
+from typing import Any, Dict, List, Optional, Tuple
 
 from app.core.config import settings
+from app.memory.repo import (
+    delete_uploads,
+    get_upload,
+    get_upload_totals,
+    get_uploads_lru,
+    register_upload,
+    touch_upload,
+)
 
 _PROJECT_ROOT = Path(__file__).resolve().parents[2]
 UPLOAD_DIR = Path(settings.UPLOAD_DIR) if settings.UPLOAD_DIR else _PROJECT_ROOT / "data" / "uploads"
 UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
+# Guards the dedup check + write + registration of an upload, and collector deletions.
+_lock = threading.Lock()
+
 _ALLOWED_EXTENSIONS = [e.strip().lower() for e in settings.UPLOAD_ALLOWED_EXTENSIONS.split(",") if e.strip()] or [".png", ".jpg", ".jpeg", ".webp", ".bmp"]
 
-def save_upload_bytes(filename: str, data: bytes) -> tuple[str, str]:
+def content_id(data: bytes) -> str:
+    """Content address of an upload: the first 32 hex chars (128 bits) of its SHA-256."""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+def find_upload(image_id: str) -> Optional[Path]:
+    """Path of a stored upload by image_id via the uploads table (no directory scan), or None."""
+    row = get_upload(image_id)
+    if row is None:
+        return None
+    path = UPLOAD_DIR / row["path"]
+    if not path.is_file():
+        delete_uploads([image_id])  # removed outside the app
+        return None
+    touch_upload(image_id)
+    return path
+
+
+def save_upload_bytes(filename: str, data: bytes, mime: Optional[str] = None) -> tuple[str, str]:
     """
-    Saves uploaded bytes to UPLOAD_DIR with a unique name.
+    Saves uploaded bytes to UPLOAD_DIR under their content hash, so identical uploads are
+    stored once and share an image_id, and records them in the uploads table.
     Returns (image_id, saved_path_str).
     """
     ext = Path(filename).suffix.lower() if filename else ".png"
     if ext not in _ALLOWED_EXTENSIONS:
         ext = ".png"
 
-    image_id = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid4().hex[:10]}"
-    saved_name = f"{image_id}{ext}"
-    saved_path = UPLOAD_DIR / saved_name
-    saved_path.write_bytes(data)
+    image_id = content_id(data)
+    with _lock:
+        existing = find_upload(image_id)
+        if existing is not None:
+            # Same bytes already stored (maybe under another extension); find_upload marked it used.
+            return image_id, str(existing)
+
+        saved_path = UPLOAD_DIR / f"{image_id}{ext}"
+        tmp_path = saved_path.with_name(f".{saved_path.name}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, saved_path)
+        register_upload(image_id, saved_path.name, len(data), mime)
+        over_quota = upload_collector.over_quota_after(len(data))
+
+    if over_quota:
+        upload_collector.wake()
+    return image_id, str(saved_path)
+
+
+class UploadCollector:
+    """
+    Background garbage collector for uploads: deletes uploads not used for UPLOAD_MAX_AGE_DAYS,
+    then the least recently used ones until the directory fits UPLOAD_DISK_QUOTA_MB. Runs every
+    UPLOAD_GC_INTERVAL_MINUTES, and early when a save pushes usage over the quota.
+    """
+
+    def __init__(self) -> None:
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._usage_bytes: Optional[int] = None
+        self.stats: Dict[str, Any] = {
+            "runs": 0,
+            "last_run_at": None,
+            "last_removed": 0,
+            "last_reclaimed_bytes": 0,
+            "total_removed": 0,
+            "total_reclaimed_bytes": 0,
+        }
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="upload-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def over_quota_after(self, added_bytes: int) -> bool:
+        """Track usage after a save (call with _lock held); True when the collector should run now."""
+        quota = self._quota_bytes()
+        if quota <= 0 or self._thread is None:
+            return False
+        if self._usage_bytes is None:
+            self._usage_bytes = get_upload_totals()[1]
+        else:
+            self._usage_bytes += added_bytes
+        return self._usage_bytes > quota
+
+    def _quota_bytes(self) -> int:
+        return int(getattr(settings, "UPLOAD_DISK_QUOTA_MB", 0) * 1024 * 1024)
+
+    def _run(self) -> None:
+        interval = max(60.0, getattr(settings, "UPLOAD_GC_INTERVAL_MINUTES", 30.0) * 60)
+        while not self._stop.is_set():
+            try:
+                self.collect()
+            except Exception as e:
+                print(f"Upload GC failed: {e}")
+            self._wake.wait(interval)
+            self._wake.clear()
+
+    def _remove(self, rows: List[Dict[str, Any]]) -> Tuple[int, int]:
+        removed, reclaimed = [], 0
+        with _lock:
+            for row in rows:
+                try:
+                    (UPLOAD_DIR / row["path"]).unlink()
+                except FileNotFoundError:
+                    pass
+                except OSError:
+                    continue  # e.g. locked by another process on Windows; retry next run
+                removed.append(row["id"])
+                reclaimed += row["size"]
+            delete_uploads(removed)
+        return len(removed), reclaimed
+
+    def collect(self) -> Dict[str, Any]:
+        """One collection pass. Returns what it removed."""
+        removed = reclaimed = 0
+        max_age_days = getattr(settings, "UPLOAD_MAX_AGE_DAYS", 0)
+        if max_age_days > 0:
+            cutoff = (datetime.utcnow() - timedelta(days=max_age_days)).isoformat()
+            while True:
+                rows = get_uploads_lru(500, used_before=cutoff)
+                if not rows:
+                    break
+                n, b = self._remove(rows)
+                removed, reclaimed = removed + n, reclaimed + b
+                if n == 0:
+                    break
+
+        quota = self._quota_bytes()
+        _, usage = get_upload_totals()
+        while quota > 0 and usage > quota:
+            rows = get_uploads_lru(100)
+            # Only as many as needed to get back under the quota.
+            needed, excess = [], usage - quota
+            for row in rows:
+                needed.append(row)
+                excess -= row["size"]
+                if excess <= 0:
+                    break
+            n, b = self._remove(needed)
+            if n == 0:
+                break
+            removed, reclaimed, usage = removed + n, reclaimed + b, usage - b
+        with _lock:
+            # Re-read under the lock: saves during this pass are counted in the table, not in `usage`.
+            self._usage_bytes = get_upload_totals()[1]
+
+        self.stats["runs"] += 1
+        self.stats["last_run_at"] = datetime.utcnow().isoformat()
+        self.stats["last_removed"] = removed
+        self.stats["last_reclaimed_bytes"] = reclaimed
+        self.stats["total_removed"] += removed
+        self.stats["total_reclaimed_bytes"] += reclaimed
+        if removed:
+            print(f"Upload GC removed {removed} file(s), reclaimed {reclaimed / (1024 * 1024):.1f} MB")
+        return {"removed": removed, "reclaimed_bytes": reclaimed}
+
+    def report(self) -> Dict[str, Any]:
+        files, usage = get_upload_totals()
+        quota = self._quota_bytes()
+        return {
+            "files": files,
+            "bytes": usage,
+            "quota_bytes": quota or None,
+            "max_age_days": getattr(settings, "UPLOAD_MAX_AGE_DAYS", 0) or None,
+            **self.stats,
+        }
+
 
-    return image_id, str(saved_path)
\ No newline at end of file
+upload_collector = UploadCollector()
@@ -0,0 +1,96 @@
+"""
+Image preprocessing for the vision model.
+
+Vision models resize every image to their own input resolution anyway, so sending a 4K
+screenshot only inflates the base64 payload and the server-side decode. Before encoding we
+crop (optional), downscale to VISION_MAX_IMAGE_SIDE and re-encode as JPEG or PNG. Pillow is
+optional: without it images are sent unchanged.
+"""
+from __future__ import annotations
+import io
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from app.core.config import settings
+
+Crop = Tuple[float, float, float, float]
+
+
+def parse_crop(value: Optional[str]) -> Optional[Crop]:
+    """
+    'left,top,right,bottom' as fractions of the image (0.0-1.0), e.g. '0,0,0.5,0.5' for the
+    top-left quarter. Raises ValueError if malformed.
+    """
+    if value is None or not value.strip():
+        return None
+    parts = [float(p) for p in value.split(",")]
+    if len(parts) != 4:
+        raise ValueError("crop must be 'left,top,right,bottom'")
+    left, top, right, bottom = parts
+    if not (0.0 <= left < right <= 1.0 and 0.0 <= top < bottom <= 1.0):
+        raise ValueError("crop values must be fractions with left < right and top < bottom")
+    return left, top, right, bottom
+
+
+def prepare_image(data: bytes, crop: Optional[Crop] = None) -> Tuple[bytes, Dict[str, Any]]:
+    """
+    Crop, downscale and re-encode image bytes for the vision model.
+    Returns (bytes to send, info); the original bytes are returned when preprocessing is
+    disabled, Pillow is missing, the image cannot be decoded, or re-encoding would not help.
+    """
+    info: Dict[str, Any] = {"original_bytes": len(data), "image_bytes": len(data), "preprocessed": False}
+    if not getattr(settings, "VISION_PREPROCESS_ENABLED", True):
+        return data, info
+    try:
+        from PIL import Image, ImageOps  # type: ignore
+    except ImportError:
+        info["skipped"] = "Pillow not installed (pip install Pillow)"
+        return data, info
+
+    t0 = time.perf_counter()
+    try:
+        img = Image.open(io.BytesIO(data))
+        img = ImageOps.exif_transpose(img)
+    except Exception:
+        info["skipped"] = "unreadable image"
+        return data, info
+    info["original_size"] = list(img.size)
+
+    changed = False
+    if crop is not None:
+        w, h = img.size
+        left, top, right, bottom = crop
+        img = img.crop((round(left * w), round(top * h), round(right * w), round(bottom * h)))
+        changed = True
+
+    max_side = getattr(settings, "VISION_MAX_IMAGE_SIDE", 1024)
+    if max_side > 0 and max(img.size) > max_side:
+        # reducing_gap: cheap integer downscale first, LANCZOS only for the last step.
+        img.thumbnail((max_side, max_side), Image.LANCZOS, reducing_gap=2.0)
+        changed = True
+
+    fmt = (getattr(settings, "VISION_IMAGE_FORMAT", "jpeg") or "jpeg").lower()
+    out = io.BytesIO()
+    if fmt == "png":
+        img.save(out, format="PNG", optimize=False)
+    else:
+        if img.mode not in ("RGB", "L"):
+            # JPEG has no alpha: flatten onto white, as the image would be displayed.
+            background = Image.new("RGB", img.size, (255, 255, 255))
+            rgba = img.convert("RGBA")
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            img = background
+        img.save(out, format="JPEG", quality=getattr(settings, "VISION_JPEG_QUALITY", 85))
+    encoded = out.getvalue()
+    if fmt != "png" and len(encoded) > len(data):
+        # Flat screenshots compress better losslessly; keep whichever is smaller.
+        png = io.BytesIO()
+        img.save(png, format="PNG")
+        if png.tell() < len(encoded):
+            encoded, fmt = png.getvalue(), "png"
+
+    info["preprocess_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    if not changed and len(encoded) >= len(data):
+        return data, info  # already small and in a fine format
+    info.update(preprocessed=True, image_bytes=len(encoded), size=list(img.size), format=fmt)
+    return encoded, info
@@ -0,0 +1,157 @@
+"""
+Model preloading and keep-alive.
+
+Ollama loads a model on its first request and unloads it after keep_alive of inactivity, so
+the first chat (or vision) request after startup or an idle period pays the whole load time.
+On startup the warmer loads the chat and vision models and prefills the chat model's static
+system prompt (so the first real request reuses its KV cache); during MODEL_ACTIVE_HOURS it
+re-checks every MODEL_REFRESH_MINUTES and reloads or extends whatever Ollama has dropped.
+"""
+from __future__ import annotations
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from app.agent.prompt_builder import static_prefix
+from app.core.config import settings
+from app.llm.ollama_client import OllamaClient
+
+
+def _parse_active_hours(spec: str) -> Optional[Tuple[int, int]]:
+    """'08:00-23:30' -> (480, 1410) minutes since midnight; '' means always active."""
+    spec = (spec or "").strip()
+    if not spec:
+        return None
+    start, end = spec.split("-", 1)
+
+    def minutes(hhmm: str) -> int:
+        h, m = hhmm.strip().split(":")
+        return int(h) * 60 + int(m)
+
+    return minutes(start), minutes(end)
+
+
+def is_active_now(now: Optional[datetime] = None) -> bool:
+    """Whether the local time falls in MODEL_ACTIVE_HOURS (ranges may wrap past midnight)."""
+    try:
+        window = _parse_active_hours(getattr(settings, "MODEL_ACTIVE_HOURS", ""))
+    except ValueError:
+        return True  # malformed setting: behave as if unset rather than never warming
+    if window is None:
+        return True
+    now = now or datetime.now()
+    current = now.hour * 60 + now.minute
+    start, end = window
+    if start <= end:
+        return start <= current < end
+    return current >= start or current < end
+
+
+def _full_name(model: str) -> str:
+    """/api/ps reports tagged names ("llava:latest" for "llava")."""
+    return model if ":" in model else f"{model}:latest"
+
+
+class ModelWarmer:
+    def __init__(self) -> None:
+        self._client: Optional[OllamaClient] = None
+        self._task: Optional[asyncio.Task] = None
+        self._models: Dict[str, Dict[str, Any]] = {}
+
+    def _configured(self) -> Dict[str, str]:
+        """model name -> role. Chat first: it is the one that gets its prompt prefilled."""
+        models = {settings.OLLAMA_MODEL: "chat"}
+        vision = getattr(settings, "OLLAMA_VISION_MODEL", "")
+        if vision and getattr(settings, "MODEL_PRELOAD_VISION", True):
+            models.setdefault(vision, "vision")
+        return models
+
+    def start(self, client: OllamaClient) -> None:
+        self._client = client  # readiness works even with preloading disabled
+        if self._task is not None or not getattr(settings, "MODEL_PRELOAD_ENABLED", True):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        # Startup warm-up always runs; later refreshes only inside active hours.
+        await self.refresh()
+        interval = max(1.0, getattr(settings, "MODEL_REFRESH_MINUTES", 10.0)) * 60
+        while True:
+            await asyncio.sleep(interval)
+            if is_active_now():
+                await self.refresh()
+
+    async def refresh(self) -> None:
+        """Load (and for chat, prefill) every configured model Ollama does not have resident; extend the rest."""
+        resident = await self._resident()
+        for model, role in self._configured().items():
+            state = self._models.setdefault(model, {"role": role, "warmups": 0})
+            t0 = time.perf_counter()
+            try:
+                if role == "chat" and _full_name(model) not in (resident or {}):
+                    await self._prefill(model)
+                    state["warmups"] += 1
+                else:
+                    # Chat requests use OLLAMA_NUM_CTX; loading with another size would reload the model.
+                    num_ctx = getattr(settings, "OLLAMA_NUM_CTX", 0) if role == "chat" else 0
+                    await self._client.load_model(model, num_ctx=max(0, num_ctx))
+                state["last_refresh_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+                state["last_refresh_at"] = datetime.utcnow().isoformat()
+                state["last_error"] = None
+            except Exception as e:
+                state["last_error"] = str(e)
+                print(f"Model warm-up failed for {model}: {e}")
+
+    async def _prefill(self, model: str) -> None:
+        # Same num_ctx as chat requests: a different value would make Ollama reload the model.
+        num_ctx = getattr(settings, "OLLAMA_NUM_CTX", 0)
+        await self._client.chat(
+            model=model,
+            messages=[{"role": "system", "content": static_prefix()}],
+            num_predict=1,
+            num_ctx=num_ctx if num_ctx > 0 else 0,
+            priority="learning",  # background class: never delays a real request
+        )
+
+    async def _resident(self) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Loaded models by name from /api/ps, or None if Ollama is unreachable."""
+        try:
+            running = await self._client.running_models()
+        except Exception:
+            return None
+        return {_full_name(m.get("name") or m.get("model") or ""): m for m in running}
+
+    async def readiness(self) -> Dict[str, Any]:
+        """Residency of each configured model; ready when the chat model is loaded."""
+        if self._client is None:
+            return {"ready": False, "reachable": False, "active_hours": is_active_now(), "models": {}}
+        resident = await self._resident()
+        models = {}
+        for model, role in self._configured().items():
+            loaded = (resident or {}).get(_full_name(model))
+            models[model] = {
+                **self._models.get(model, {"role": role, "warmups": 0}),
+                "resident": loaded is not None,
+                "expires_at": loaded.get("expires_at") if loaded else None,
+                "size_vram": loaded.get("size_vram") if loaded else None,
+            }
+        return {
+            "ready": bool(models.get(settings.OLLAMA_MODEL, {}).get("resident")),
+            "reachable": resident is not None,
+            "active_hours": is_active_now(),
+            "models": models,
+        }
+
+
+model_warmer = ModelWarmer()
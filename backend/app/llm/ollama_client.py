@@ -3,6 +3,30 @@ import json
 import httpx
 from typing import Any, AsyncIterator, Dict, Optional
 
+from app.core.config import settings
+from app.core.metrics import record_stage
+from app.llm.scheduler import llm_scheduler
+
+# Counters Ollama reports on the final response of a generation.
+_STAT_KEYS = ("prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration", "load_duration", "total_duration")
+
+
+# Ollama's durations (ns) reported as request stages (see app.core.metrics).
+_STAGE_KEYS = (("load_duration", "llm_load"), ("prompt_eval_duration", "llm_prefill"), ("eval_duration", "llm_generate"))
+
+
+def _collect_stats(data: Dict[str, Any], stats: Optional[Dict[str, Any]]) -> None:
+    """Copy Ollama's token/timing counters into the caller-supplied stats dict and the request's stage timings."""
+    for key, name in _STAGE_KEYS:
+        if data.get(key):
+            record_stage(name, data[key] / 1e6)
+    if stats is None:
+        return
+    for key in _STAT_KEYS:
+        if key in data:
+            stats[key] = data[key]
+
+
 class OllamaClient:
     def __init__(self, base_url: str):
         self.base_url = base_url.rstrip("/")
@@ -14,6 +38,13 @@ class OllamaClient:
             self._client = httpx.AsyncClient(timeout=120)
         return self._client
 
+    def _with_keep_alive(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Ask Ollama to keep the model loaded for OLLAMA_KEEP_ALIVE after this request ("" = Ollama default)."""
+        keep_alive = getattr(settings, "OLLAMA_KEEP_ALIVE", "")
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        return payload
+
     def _options(self, temperature: float, num_predict: int, num_ctx: int) -> Dict[str, Any]:
         opts: Dict[str, Any] = {"temperature": temperature, "num_predict": num_predict}
         if num_ctx > 0:
@@ -27,11 +58,15 @@ class OllamaClient:
         temperature: float = 0.4,
         num_predict: int = -1,
         num_ctx: int = 0,
+        stats: Optional[Dict[str, Any]] = None,
+        priority: str = "interactive",
     ) -> str:
         """
         Uses Ollama /api/chat.
         num_predict: max tokens to generate (-1 = no limit).
         num_ctx: context size (0 = Ollama default; smaller = faster).
+        stats: optional dict filled with Ollama's counters (prompt_eval_count, eval_count, ...).
+        priority: scheduler class ("interactive", "summarization" or "learning"); see app.llm.scheduler.
         """
         url = f"{self.base_url}/api/chat"
         payload: Dict[str, Any] = {
@@ -40,11 +75,14 @@ class OllamaClient:
             "stream": False,
             "options": self._options(temperature, num_predict, num_ctx),
         }
+        self._with_keep_alive(payload)
 
         client = await self._get_client()
-        r = await client.post(url, json=payload)
+        async with llm_scheduler.slot(model, priority):
+            r = await client.post(url, json=payload)
         r.raise_for_status()
         data = r.json()
+        _collect_stats(data, stats)
 
         # Ollama returns { message: { role: "assistant", content: "..." }, ... }
         return data["message"]["content"]
@@ -56,9 +94,13 @@ class OllamaClient:
         temperature: float = 0.4,
         num_predict: int = -1,
         num_ctx: int = 0,
+        stats: Optional[Dict[str, Any]] = None,
+        priority: str = "interactive",
     ) -> AsyncIterator[str]:
         """
         Uses Ollama /api/chat with stream=True. Yields content chunks as they arrive.
+        stats is filled from the final (done) line, so it stays empty if the stream is closed early.
+        The scheduler slot is held until the stream ends or is closed.
         """
         url = f"{self.base_url}/api/chat"
         payload: Dict[str, Any] = {
@@ -67,18 +109,42 @@ class OllamaClient:
             "stream": True,
             "options": self._options(temperature, num_predict, num_ctx),
         }
+        self._with_keep_alive(payload)
 
         client = await self._get_client()
-        async with client.stream("POST", url, json=payload) as response:
-            response.raise_for_status()
-            async for line in response.aiter_lines():
-                if not line.strip():
-                    continue
-                try:
-                    data = json.loads(line)
-                    msg = data.get("message") or {}
-                    content = msg.get("content") or ""
-                    if content:
-                        yield content
-                except json.JSONDecodeError:
-                    continue
+        async with llm_scheduler.slot(model, priority):
+            async with client.stream("POST", url, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    try:
+                        data = json.loads(line)
+                        if data.get("done"):
+                            _collect_stats(data, stats)
+                        msg = data.get("message") or {}
+                        content = msg.get("content") or ""
+                        if content:
+                            yield content
+                    except json.JSONDecodeError:
+                        continue
+
+    async def load_model(self, model: str, priority: str = "learning", num_ctx: int = 0) -> None:
+        """
+        Load model into memory (or extend its keep-alive) without generating: /api/generate with no prompt.
+        num_ctx must match the one later requests use (0 = Ollama default), or Ollama reloads the model.
+        """
+        payload: Dict[str, Any] = {"model": model}
+        if num_ctx > 0:
+            payload["options"] = {"num_ctx": num_ctx}
+        client = await self._get_client()
+        async with llm_scheduler.slot(model, priority):
+            r = await client.post(f"{self.base_url}/api/generate", json=self._with_keep_alive(payload))
+        r.raise_for_status()
+
+    async def running_models(self) -> list[dict]:
+        """Models currently loaded by Ollama (/api/ps): name, size_vram, expires_at, ..."""
+        client = await self._get_client()
+        r = await client.get(f"{self.base_url}/api/ps", timeout=5)
+        r.raise_for_status()
+        return r.json().get("models") or []
@@ -1,28 +1,48 @@
 from __future__ import annotations
+import asyncio
 import base64
+import json
+import time
 import httpx
-from typing import Any, Dict
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+
+from app.core.config import settings
+from app.core.metrics import stage
+from app.llm.image_prep import Crop, prepare_image
+from app.llm.ollama_client import _collect_stats
+from app.llm.scheduler import llm_scheduler
 
 class OllamaVisionClient:
     def __init__(self, base_url: str):
         self.base_url = base_url.rstrip("/")
+        self._client: Optional[httpx.AsyncClient] = None
 
-    async def chat_with_image(
+    async def _get_client(self) -> httpx.AsyncClient:
+        """Reuse a single HTTP client (pooled keep-alive connections) across vision calls."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=180)
+        return self._client
+
+    async def _build_payload(
         self,
         model: str,
         prompt: str,
         image_bytes: bytes,
-        temperature: float = 0.2,
-    ) -> str:
-        """
-        Uses Ollama /api/chat with images (base64).
-        """
-        url = f"{self.base_url}/api/chat"
-        image_b64 = base64.b64encode(image_bytes).decode("utf-8")
+        temperature: float,
+        crop: Optional[Crop],
+        stream: bool,
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Preprocess + base64-encode the image into an /api/chat payload. Returns (payload, stats)."""
+        with stage("image_prep"):
+            # Pillow work is CPU-bound: keep it off the event loop.
+            image_bytes, prep_info = await asyncio.to_thread(prepare_image, image_bytes, crop)
+            t0 = time.perf_counter()
+            image_b64 = base64.b64encode(image_bytes).decode("utf-8")
+            encode_ms = (time.perf_counter() - t0) * 1000
 
         payload: Dict[str, Any] = {
             "model": model,
-            "stream": False,
+            "stream": stream,
             "messages": [
                 {
                     "role": "user",
@@ -32,10 +52,85 @@ class OllamaVisionClient:
             ],
             "options": {"temperature": temperature},
         }
+        keep_alive = getattr(settings, "OLLAMA_KEEP_ALIVE", "")
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        stats = {
+            **prep_info,
+            "payload_bytes": len(image_b64) + len(prompt),
+            "encode_ms": round(encode_ms, 2),
+        }
+        return payload, stats
 
-        async with httpx.AsyncClient(timeout=180) as client:
+    async def chat_with_image(
+        self,
+        model: str,
+        prompt: str,
+        image_bytes: bytes,
+        temperature: float = 0.2,
+        crop: Optional[Crop] = None,
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Uses Ollama /api/chat with images (base64).
+        The image is cropped/downscaled/re-encoded first (see app.llm.image_prep).
+        stats: optional dict filled with payload size, preprocess/encode time, model latency
+        and Ollama's counters.
+        """
+        url = f"{self.base_url}/api/chat"
+        payload, call_stats = await self._build_payload(model, prompt, image_bytes, temperature, crop, stream=False)
+
+        client = await self._get_client()
+        async with llm_scheduler.slot(model, "interactive"):
+            t0 = time.perf_counter()
             r = await client.post(url, json=payload)
-            r.raise_for_status()
-            data = r.json()
+            model_ms = (time.perf_counter() - t0) * 1000
+        r.raise_for_status()
+        data = r.json()
+
+        if stats is not None:
+            stats.update(call_stats)
+            stats["model_ms"] = round(model_ms, 1)
+            _collect_stats(data, stats)
+
+        return data["message"]["content"]
+
+    async def chat_with_image_stream(
+        self,
+        model: str,
+        prompt: str,
+        image_bytes: bytes,
+        temperature: float = 0.2,
+        crop: Optional[Crop] = None,
+        stats: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Like chat_with_image with stream=True: yields content chunks as they arrive.
+        stats additionally gets first_chunk_ms (time to first token); model_ms and Ollama's
+        counters are filled from the final (done) line.
+        """
+        url = f"{self.base_url}/api/chat"
+        payload, call_stats = await self._build_payload(model, prompt, image_bytes, temperature, crop, stream=True)
+        if stats is not None:
+            stats.update(call_stats)
 
-        return data["message"]["content"]
\ No newline at end of file
+        client = await self._get_client()
+        async with llm_scheduler.slot(model, "interactive"):
+            t0 = time.perf_counter()
+            async with client.stream("POST", url, json=payload) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    try:
+                        data = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    content = (data.get("message") or {}).get("content") or ""
+                    if content and stats is not None and "first_chunk_ms" not in stats:
+                        stats["first_chunk_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+                    if data.get("done") and stats is not None:
+                        stats["model_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+                        _collect_stats(data, stats)
+                    if content:
+                        yield content
@@ -0,0 +1,187 @@
+"""
+Priority scheduler for requests to the local Ollama server.
+
+Ollama works through requests one (or OLLAMA_NUM_PARALLEL) at a time per model, in arrival
+order, so a background learning call queued just before a chat message delays its first
+token by a whole generation. Every OllamaClient / OllamaVisionClient request takes a slot
+here first: at most LLM_MAX_IN_FLIGHT_PER_MODEL run per model, and a freed slot goes to the
+waiting request of the highest priority class (interactive > summarization > learning),
+first-come first-served within a class. A request that has waited LLM_PRIORITY_AGING_SECONDS
+competes as interactive, so background work is delayed but never starved.
+"""
+from __future__ import annotations
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Deque, Dict, List
+
+from app.core.config import settings
+from app.core.metrics import record_stage
+
+PRIORITIES = ("interactive", "summarization", "learning")
+
+
+class OllamaBusyError(Exception):
+    """Too many interactive requests already waiting for the model; retry after retry_after seconds."""
+
+    def __init__(self, model: str, queued: int, retry_after: int) -> None:
+        super().__init__(f"Model '{model}' is busy ({queued} requests queued). Retry in {retry_after}s.")
+        self.model = model
+        self.queued = queued
+        self.retry_after = retry_after
+
+
+@dataclass
+class _Waiter:
+    future: asyncio.Future
+    priority: int
+    enqueued_at: float
+
+
+@dataclass
+class _ModelState:
+    in_flight: int = 0
+    queues: List[Deque[_Waiter]] = field(default_factory=lambda: [deque() for _ in PRIORITIES])
+    # Moving average of how long a request holds its slot, for Retry-After estimates.
+    avg_service_s: float = 2.0
+
+    def queued(self) -> int:
+        return sum(len(q) for q in self.queues)
+
+
+class _ClassStats:
+    def __init__(self) -> None:
+        self.requests = 0
+        self.rejected = 0
+        self.waited = 0  # requests that had to queue
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.recent_waits: Deque[float] = deque(maxlen=200)
+
+    def record_wait(self, wait_ms: float, queued: bool) -> None:
+        self.requests += 1
+        if queued:
+            self.waited += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        self.recent_waits.append(wait_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = sorted(self.recent_waits)
+
+        def pct(p: float) -> float:
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 1) if recent else 0.0
+
+        return {
+            "requests": self.requests,
+            "queued": self.waited,
+            "rejected": self.rejected,
+            "avg_wait_ms": round(self.total_wait_ms / self.requests, 1) if self.requests else 0.0,
+            "p50_wait_ms": pct(0.5),
+            "p95_wait_ms": pct(0.95),
+            "max_wait_ms": round(self.max_wait_ms, 1),
+        }
+
+
+class RequestScheduler:
+    def __init__(self) -> None:
+        self._models: Dict[str, _ModelState] = {}
+        self._stats: Dict[str, _ClassStats] = {p: _ClassStats() for p in PRIORITIES}
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelState()
+        return state
+
+    def _limit(self) -> int:
+        return max(1, getattr(settings, "LLM_MAX_IN_FLIGHT_PER_MODEL", 1))
+
+    def retry_after(self, model: str) -> int:
+        """Seconds until a newly queued request would likely start (at least 1)."""
+        state = self._state(model)
+        return max(1, round((state.queued() + 1) * state.avg_service_s / self._limit()))
+
+    def check_admission(self, model: str, priority: str = "interactive") -> None:
+        """
+        Raise OllamaBusyError if an interactive request would exceed LLM_MAX_QUEUE_DEPTH waiting
+        requests. Background classes are never rejected; they just wait.
+        """
+        if priority != "interactive":
+            return
+        state = self._state(model)
+        max_depth = getattr(settings, "LLM_MAX_QUEUE_DEPTH", 8)
+        if state.in_flight >= self._limit() and state.queued() >= max_depth:
+            self._stats[priority].rejected += 1
+            raise OllamaBusyError(model, state.queued(), self.retry_after(model))
+
+    @asynccontextmanager
+    async def slot(self, model: str, priority: str = "interactive") -> AsyncIterator[None]:
+        """Hold one of the model's in-flight slots for the duration of the block."""
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'")
+        state = self._state(model)
+        stats = self._stats[priority]
+        started = time.monotonic()
+
+        queued = not (state.in_flight < self._limit() and state.queued() == 0)
+        if not queued:
+            state.in_flight += 1
+        else:
+            self.check_admission(model, priority)
+            waiter = _Waiter(asyncio.get_running_loop().create_future(), PRIORITIES.index(priority), started)
+            state.queues[waiter.priority].append(waiter)
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    self._release(state)  # slot was handed over just as we were cancelled
+                elif waiter in state.queues[waiter.priority]:
+                    state.queues[waiter.priority].remove(waiter)
+                raise
+        wait_ms = (time.monotonic() - started) * 1000
+        stats.record_wait(wait_ms, queued)
+        record_stage("llm_queue", wait_ms)
+
+        acquired = time.monotonic()
+        try:
+            yield
+        finally:
+            state.avg_service_s = 0.8 * state.avg_service_s + 0.2 * (time.monotonic() - acquired)
+            self._release(state)
+
+    def _release(self, state: _ModelState) -> None:
+        state.in_flight -= 1
+        aging = getattr(settings, "LLM_PRIORITY_AGING_SECONDS", 30.0)
+        now = time.monotonic()
+        while state.in_flight < self._limit():
+            heads = [q[0] for q in state.queues if q]
+            if not heads:
+                return
+            # Effective class: waiting longer than the aging limit counts as interactive.
+            nxt = min(heads, key=lambda w: (0 if now - w.enqueued_at >= aging else w.priority, w.enqueued_at))
+            state.queues[nxt.priority].popleft()
+            if nxt.future.cancelled():
+                continue
+            state.in_flight += 1
+            nxt.future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_in_flight_per_model": self._limit(),
+            "max_queue_depth": getattr(settings, "LLM_MAX_QUEUE_DEPTH", 8),
+            "models": {
+                name: {
+                    "in_flight": s.in_flight,
+                    "queued": {p: len(s.queues[i]) for i, p in enumerate(PRIORITIES)},
+                    "avg_service_s": round(s.avg_service_s, 2),
+                }
+                for name, s in self._models.items()
+            },
+            "classes": {p: s.snapshot() for p, s in self._stats.items()},
+        }
+
+
+llm_scheduler = RequestScheduler()
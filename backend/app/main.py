@@ -1,17 +1,61 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from app.api.routes.health import router as health_router
-from app.api.routes.chat import router as chat_router
+from app.api.routes.chat import router as chat_router, ollama as chat_ollama
 from app.api.routes.vision import router as vision_router
 from app.api.routes.memory import router as memory_router
+from app.api.routes.tools import router as tools_router
 from app.tools.registry import TOOLS, ToolSpec
 from app.tools.implementations.open_app import open_app
 from app.tools.implementations.web_search import web_search
-from app.tools.implementations.file_ops import file_ops
+from app.tools.implementations.file_ops import file_ops, get_user_folders
+from app.tools.implementations.file_index import file_index
 from app.core.config import settings
+from app.core.metrics import StageTimingMiddleware
+from app.core.storage import upload_collector
+from app.llm.model_warmer import model_warmer
+from app.llm.scheduler import OllamaBusyError
+from app.memory.db import close_all as close_db_connections
 from app.memory.init_db import init_db
+from app.memory.learning_scheduler import learning_scheduler
+from app.memory.repo import shutdown_writes
+from app.tools.runtime import shutdown_tool_runtime
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="AIKA AI Backend", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: build/refresh the filename index for file_ops search_user in the background.
+    if settings.FILE_INDEX_ENABLED:
+        file_index.start(get_user_folders())
+    # Enforce upload age/size quotas in the background.
+    upload_collector.start()
+    # Preload chat/vision models and keep them resident; auto-learn worker. Both share the chat routes' Ollama client.
+    model_warmer.start(chat_ollama)
+    learning_scheduler.start(chat_ollama)
+    yield
+    # Shutdown: drain queued learning, then stop background work and tool worker pools.
+    await model_warmer.stop()
+    await learning_scheduler.stop()
+    file_index.stop()
+    upload_collector.stop()
+    shutdown_tool_runtime()
+    shutdown_writes()
+    close_db_connections()
+
+
+app = FastAPI(title="AIKA AI Backend", version="0.1.0", lifespan=lifespan)
+
+@app.exception_handler(OllamaBusyError)
+async def ollama_busy_handler(request: Request, exc: OllamaBusyError):
+    """LLM queue is full: tell the client when to retry instead of queueing without bound."""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
 
 # Initialize database
 init_db()
@@ -21,18 +65,27 @@ TOOLS["open_app"] = ToolSpec(
     name="open_app",
     description="Open an approved desktop app by name. args: {app: string}",
     handler=open_app,
+    timeout_s=10,
+    max_concurrency=2,
 )
 
 TOOLS["web_search"] = ToolSpec(
     name="web_search",
     description="Search the web for information. Use when the user asks to search, look up, or get latest/current info online. args: {query: string, max_results: int (optional, default 5)}",
     handler=web_search,
+    timeout_s=15,
+    max_concurrency=4,
+    cacheable=True,
+    cache_ttl_s=300,
+    cache_case_insensitive=("query",),
 )
 
 TOOLS["file_ops"] = ToolSpec(
     name="file_ops",
     description="File operations. Safe sandbox: op=read|write|list|mkdir with path under app data. User folders (Documents, Desktop, Downloads only): op=search_user (args: query optional filename/glob, recursive optional, max_results optional) to search; op=read_user with path=string (path relative to folder or full path) to read. Use search_user then read_user when user asks to find or read their files.",
     handler=file_ops,
+    timeout_s=30,
+    max_concurrency=2,
 )
 
 app.add_middleware(
@@ -41,12 +94,17 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Retry-After", "Server-Timing"],
 )
+# Outermost, so the timings include everything below it (off = no per-request cost at all).
+if getattr(settings, "STAGE_TIMINGS_ENABLED", True):
+    app.add_middleware(StageTimingMiddleware)
 
 app.include_router(health_router)
 app.include_router(chat_router)
 app.include_router(vision_router)
 app.include_router(memory_router)
+app.include_router(tools_router)
 
 if __name__ == "__main__":
     # Run with host/port from environment-backed settings
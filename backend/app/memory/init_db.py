@@ -1,22 +1,154 @@
 from pathlib import Path
 from datetime import datetime
-from app.memory.db import get_conn
+from typing import Any, Callable, Sequence
+from app.memory.db import open_connection
+import hashlib
+import importlib.util
 import sqlite3
+import time
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]  # apps/backend
 MIGRATIONS_DIR = PROJECT_ROOT / "app" / "memory" / "migrations"
 
+# Rows per transaction for Python backfills; small enough that a chunk never holds the write lock for long.
+BACKFILL_CHUNK_SIZE = 500
+
+
+def _version_of(path: Path) -> int:
+    """Numeric prefix of a migration file name (003_session_activity.sql -> 3)."""
+    prefix = path.name.split("_", 1)[0]
+    if not prefix.isdigit():
+        raise ValueError(f"Migration file name must start with a version number: {path.name}")
+    return int(prefix)
+
+
+def _checksum(path: Path) -> str:
+    # Line endings normalized so a CRLF/LF checkout does not look like an edited migration.
+    return hashlib.sha256(path.read_bytes().replace(b"\r\n", b"\n")).hexdigest()
+
+
+def _discover() -> list[Path]:
+    files = [p for p in MIGRATIONS_DIR.iterdir() if p.suffix in (".sql", ".py") and p.name[:1].isdigit()]
+    files.sort(key=_version_of)
+    seen: dict[int, str] = {}
+    for p in files:
+        v = _version_of(p)
+        if v in seen:
+            raise ValueError(f"Duplicate migration version {v}: {seen[v]} and {p.name}")
+        seen[v] = p.name
+    return files
+
+
+def backfill_in_chunks(
+    conn: sqlite3.Connection,
+    table: str,
+    set_clause: str,
+    where: str = "1",
+    params: Sequence[Any] = (),
+    chunk_size: int = BACKFILL_CHUNK_SIZE,
+) -> int:
+    """
+    UPDATE table SET <set_clause> WHERE <where>, walking rowid ranges of chunk_size and committing
+    after each chunk so readers and the app's writers are never blocked for long. The update must be
+    idempotent: a backfill interrupted midway is re-run from the start on the next startup.
+    Returns the number of rows updated.
+    """
+    row = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+    lo, hi = row[0], row[1]
+    if lo is None:
+        return 0
+    updated = 0
+    start = lo
+    while start <= hi:
+        end = start + chunk_size
+        cur = conn.execute(
+            f"UPDATE {table} SET {set_clause} WHERE rowid >= ? AND rowid < ? AND ({where})",
+            (start, end, *params),
+        )
+        conn.commit()
+        updated += cur.rowcount
+        start = end
+    return updated
+
+
+def _load_python_migration(path: Path) -> Callable[[sqlite3.Connection], None]:
+    spec = importlib.util.spec_from_file_location(f"app_migration_{path.stem}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    upgrade = getattr(module, "upgrade", None)
+    if not callable(upgrade):
+        raise ValueError(f"Python migration {path.name} must define upgrade(conn)")
+    return upgrade
+
+
+def _apply(conn: sqlite3.Connection, path: Path) -> None:
+    if path.suffix == ".sql":
+        # One transaction per file: a failing statement leaves no half-applied schema behind.
+        conn.executescript("BEGIN;\n" + path.read_text(encoding="utf-8"))
+        return
+    # Python migrations manage their own transactions (see backfill_in_chunks).
+    _load_python_migration(path)(conn)
+
+
 def init_db() -> None:
-    """Run all migrations in order (001_init.sql, 002_add_learned_facts.sql, etc.)."""
-    migration_files = sorted(MIGRATIONS_DIR.glob("*.sql"))
+    """
+    Run pending migrations in version order (001_init.sql, 002_add_learned_facts.sql, etc.).
+    Each applied migration is recorded in schema_version with a checksum, so only new files run
+    on startup and an edited, already-applied migration is reported instead of silently re-run.
+    A migration is either a .sql script (applied in one transaction) or a .py module defining
+    upgrade(conn), for data backfills that should run in chunks (see backfill_in_chunks).
+    """
+    migration_files = _discover()
     if not migration_files:
         return
-    
-    conn = get_conn()
+
+    # Dedicated connection: migration scripts may change per-connection PRAGMAs.
+    conn = open_connection()
     try:
-        for sql_file in migration_files:
-            sql = sql_file.read_text(encoding="utf-8")
-            conn.executescript(sql)
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS schema_version (
+                 version INTEGER PRIMARY KEY,
+                 name TEXT NOT NULL,
+                 checksum TEXT NOT NULL,
+                 applied_at TEXT NOT NULL,
+                 duration_ms REAL
+               )"""
+        )
         conn.commit()
+        applied = {
+            r["version"]: r for r in conn.execute("SELECT version, name, checksum FROM schema_version").fetchall()
+        }
+
+        started = time.perf_counter()
+        ran = 0
+        for path in migration_files:
+            version = _version_of(path)
+            checksum = _checksum(path)
+            done = applied.get(version)
+            if done is not None:
+                if done["checksum"] != checksum:
+                    print(f"Migration {path.name} changed after it was applied (checksum mismatch); not re-running it")
+                continue
+
+            t0 = time.perf_counter()
+            try:
+                _apply(conn, path)
+            except Exception:
+                if conn.in_transaction:
+                    conn.rollback()
+                print(f"Migration {path.name} failed")
+                raise
+            duration_ms = (time.perf_counter() - t0) * 1000
+            conn.execute(
+                "INSERT INTO schema_version (version, name, checksum, applied_at, duration_ms) VALUES (?, ?, ?, ?, ?)",
+                (version, path.name, checksum, datetime.utcnow().isoformat(), round(duration_ms, 2)),
+            )
+            conn.commit()
+            ran += 1
+            print(f"Applied migration {path.name} in {duration_ms:.1f} ms")
+
+        if ran:
+            print(f"Database schema at version {_version_of(migration_files[-1])} ({ran} migration(s), {(time.perf_counter() - started) * 1000:.1f} ms)")
     finally:
-        conn.close()
\ No newline at end of file
+        conn.close()
+
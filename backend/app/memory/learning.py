@@ -4,12 +4,15 @@ Uses LLM to extract structured information that should be remembered.
 """
 from __future__ import annotations
 import json
+import random
 import re
-from typing import Any, Dict, List, Optional
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 from app.core.config import settings
 from app.llm.ollama_client import OllamaClient
-from app.memory.repo import save_learned_fact, get_all_learned_facts
+from app.memory.repo import save_learned_facts, get_recent_learned_facts
 
 
 LEARNING_PROMPT = """Analyze the recent conversation and extract any facts, preferences, or context about the user that should be remembered for future conversations.
@@ -39,6 +42,86 @@ Recent conversation:
 Output JSON array only:"""
 
 
+# --- Pre-filter: skip the extraction call for turns with nothing about the user in them ---
+
+# Cues that the user is telling us something about themselves. Checked on the user message only;
+# the assistant rarely introduces facts about the user. Order matters: the first match is the reason logged.
+_PREFILTER_PATTERNS = [
+    ("remember", r"\b(?:remember|don'?t forget|note that|keep in mind)\b"),
+    ("name", r"\b(?:my name|call me|i'?m called|name'?s)\b"),
+    ("preference", r"\b(?:i (?:really |usually |always |never |don'?t |do not )?(?:prefer|like|love|hate|enjoy|dislike|use|want|need))\b|\bfavou?rite\b"),
+    ("identity", r"\b(?:i am|i'?m|im) (?:a|an|from|based|living|working|studying|learning|allergic|vegan|vegetarian|\d)"),
+    ("self_fact", r"\b(?:i (?:live|work|study|moved|was born|grew up|have|'?ve got|own|speak|play|go to))\b"),
+    ("possessive", r"\bmy (?!bad\b|pleasure\b|god\b|goodness\b)[a-z]+"),
+    ("age", r"\b\d{1,2} years old\b|\bmy birthday\b"),
+]
+_PREFILTER_RE = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern in _PREFILTER_PATTERNS),
+    re.IGNORECASE,
+)
+
+
+def prefilter_reason(user_message: str) -> Optional[str]:
+    """Name of the first self-disclosure cue in the message, or None if the turn can be skipped."""
+    if not getattr(settings, "LEARN_PREFILTER_ENABLED", True):
+        return "disabled"
+    m = _PREFILTER_RE.search(user_message)
+    return m.lastgroup if m else None
+
+
+class _PrefilterStats:
+    """Decision counters plus the most recent decisions, to weigh LLM calls saved against recall lost."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.counts = {"extract": 0, "skip": 0, "audit": 0}
+        self.reasons: Dict[str, int] = {}
+        self.audited_turns = 0
+        self.audit_calls_with_facts = 0
+        self.audit_facts = 0
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=50)
+
+    def record(self, decision: str, reason: Optional[str], user_message: str) -> None:
+        with self._lock:
+            self.counts[decision] += 1
+            if reason:
+                self.reasons[reason] = self.reasons.get(reason, 0) + 1
+            self.recent.append({"decision": decision, "reason": reason, "message": user_message[:60]})
+
+    def record_audit(self, turns: int, facts: int) -> None:
+        with self._lock:
+            self.audited_turns += turns
+            self.audit_facts += facts
+            if facts:
+                self.audit_calls_with_facts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                **self.counts,
+                "skip_rate": round((self.counts["skip"] + self.counts["audit"]) / total, 3) if total else 0.0,
+                "reasons": dict(self.reasons),
+                "audit": {
+                    "turns": self.audited_turns,
+                    "calls_with_facts": self.audit_calls_with_facts,
+                    "facts": self.audit_facts,
+                },
+                "recent": list(self.recent),
+            }
+
+
+_prefilter_stats = _PrefilterStats()
+
+
+def get_prefilter_stats() -> Dict[str, Any]:
+    return _prefilter_stats.snapshot()
+
+
+# Per-message cap in a batched extraction prompt, so several turns still fit num_ctx=2048.
+_MAX_TURN_CHARS = 600
+
+
 async def learn_from_conversation(
     user_message: str,
     assistant_reply: str,
@@ -50,26 +133,73 @@ async def learn_from_conversation(
     Analyze a conversation turn and extract learnable facts.
     Returns list of facts that were learned (or empty list).
     """
+    return await learn_from_turns([(user_message, assistant_reply)], session_id, ollama_client, model)
+
+
+async def learn_from_turns(
+    turns: List[Tuple[str, str]],
+    session_id: str,
+    ollama_client: OllamaClient,
+    model: str,
+) -> List[Dict[str, Any]]:
+    """
+    Extract learnable facts from one or more (user_message, assistant_reply) turns of a session
+    with a single LLM call. Turns the local pre-filter rejects are not sent (except an audit
+    sample, see LEARN_PREFILTER_AUDIT_RATE). Returns list of facts that were learned (or empty list).
+    """
     # Skip learning if disabled
     if not getattr(settings, "AUTO_LEARN_ENABLED", True):
         return []
     
-    # Skip if messages are too short (likely greetings or simple Q&A)
-    if len(user_message) < 20 or len(assistant_reply) < 20:
+    # Skip turns that are too short (likely greetings or simple Q&A)
+    turns = [(u, a) for u, a in turns if len(u) >= 20 and len(a) >= 20]
+    if not turns:
         return []
     
-    conversation_text = f"User: {user_message}\nAssistant: {assistant_reply}"
+    to_extract: List[Tuple[str, str]] = []
+    to_audit: List[Tuple[str, str]] = []
+    for u, a in turns:
+        reason = prefilter_reason(u)
+        if reason is not None:
+            to_extract.append((u, a))
+            _prefilter_stats.record("extract", reason, u)
+        elif random.random() < getattr(settings, "LEARN_PREFILTER_AUDIT_RATE", 0.0):
+            to_audit.append((u, a))
+            _prefilter_stats.record("audit", None, u)
+        else:
+            _prefilter_stats.record("skip", None, u)
+    
+    learned = await _extract_facts(to_extract, session_id, ollama_client, model) if to_extract else []
+    if to_audit:
+        # Skipped turns sent anyway: any fact found here is recall the pre-filter would have lost.
+        missed = await _extract_facts(to_audit, session_id, ollama_client, model)
+        _prefilter_stats.record_audit(len(to_audit), len(missed))
+        learned += missed
+    return learned
+
+
+async def _extract_facts(
+    turns: List[Tuple[str, str]],
+    session_id: str,
+    ollama_client: OllamaClient,
+    model: str,
+) -> List[Dict[str, Any]]:
+    """One extraction call over the given turns; saves and returns facts above the confidence threshold."""
+    conversation_text = "\n".join(
+        f"User: {u[:_MAX_TURN_CHARS]}\nAssistant: {a[:_MAX_TURN_CHARS]}" for u, a in turns
+    )
     
     try:
-        # Get existing facts to avoid duplicates and provide context
-        existing_facts = get_all_learned_facts()
+        # Most recently updated facts, to avoid duplicates and provide context
+        existing_facts = get_recent_learned_facts(10)
         existing_context = ""
         if existing_facts:
             existing_context = "\n\nAlready known facts:\n" + "\n".join(
-                [f"- {k}: {v}" for k, v in list(existing_facts.items())[:10]]
+                [f"- {k}: {v}" for k, v in existing_facts.items()]
             )
         
-        prompt = LEARNING_PROMPT.format(conversation=conversation_text + existing_context)
+        # str.replace, not format: the prompt contains literal JSON braces
+        prompt = LEARNING_PROMPT.replace("{conversation}", conversation_text + existing_context)
         
         # Call LLM to extract facts
         response = await ollama_client.chat(
@@ -78,14 +208,15 @@ async def learn_from_conversation(
             temperature=0.3,  # Lower temp for more consistent extraction
             num_predict=512,  # Short response expected
             num_ctx=2048,
+            priority="learning",  # yields to chat and vision requests in the LLM scheduler
         )
         
         # Parse JSON from response
         facts = _parse_facts_from_response(response)
         
-        # Save facts that meet confidence threshold
-        learned = []
+        # Save facts that meet confidence threshold, all in one transaction
         confidence_threshold = getattr(settings, "AUTO_LEARN_CONFIDENCE_THRESHOLD", 0.7)
+        to_save = []
         
         for fact in facts:
             key = fact.get("key", "").strip()
@@ -96,9 +227,9 @@ async def learn_from_conversation(
                 continue
             
             if confidence >= confidence_threshold:
-                save_learned_fact(key, value, session_id, confidence)
-                learned.append({"key": key, "value": value, "confidence": confidence})
+                to_save.append((key, value, confidence))
         
+        learned = save_learned_facts(to_save, session_id)
         return learned
         
     except Exception as e:
@@ -0,0 +1,187 @@
+"""
+Background scheduler for auto-learning.
+
+Chat routes submit finished turns here instead of firing one extraction call per turn.
+Turns are buffered per session and debounced, so a burst of turns becomes one extraction
+prompt, and extraction only starts when no interactive generation is in flight (plus a short
+grace period), so learning never competes with the user's next message for Ollama.
+"""
+from __future__ import annotations
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.llm.ollama_client import OllamaClient
+from app.memory.learning import get_prefilter_stats, learn_from_turns
+
+
+@dataclass
+class _SessionBuffer:
+    turns: List[Tuple[str, str]] = field(default_factory=list)
+    first_at: float = 0.0  # monotonic time the oldest buffered turn arrived
+    last_at: float = 0.0
+
+
+class LearningScheduler:
+    def __init__(self) -> None:
+        self._buffers: Dict[str, _SessionBuffer] = {}
+        self._queued = 0
+        self._in_flight = 0
+        self._last_interactive_end = 0.0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._client: Optional[OllamaClient] = None
+        self._stats = {"submitted": 0, "dropped": 0, "batches": 0, "turns_processed": 0, "facts_learned": 0}
+        self._last_batch_ms: Optional[float] = None
+        self._last_lag_s: Optional[float] = None
+
+    # --- lifecycle ---
+
+    def start(self, client: OllamaClient) -> None:
+        """Start the worker on the running loop (called from the app lifespan)."""
+        if self._task is not None:
+            return
+        self._client = client
+        self._stopping = False
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Process everything still buffered (ignoring debounce), bounded by LEARN_DRAIN_TIMEOUT_SECONDS."""
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        try:
+            await asyncio.wait_for(self._task, timeout=getattr(settings, "LEARN_DRAIN_TIMEOUT_SECONDS", 15.0))
+        except asyncio.TimeoutError:
+            print(f"Learning drain timed out; {self._queued} turn(s) not processed")
+        finally:
+            self._task = None
+
+    # --- producers ---
+
+    def submit(self, session_id: str, user_message: str, assistant_reply: str) -> None:
+        """Queue a finished turn for learning. Drops the oldest queued turn when the queue is full."""
+        if not getattr(settings, "AUTO_LEARN_ENABLED", True) or self._stopping:
+            return
+        now = time.monotonic()
+        buf = self._buffers.get(session_id)
+        if buf is None:
+            buf = self._buffers[session_id] = _SessionBuffer(first_at=now)
+        buf.turns.append((user_message, assistant_reply))
+        buf.last_at = now
+        self._queued += 1
+        self._stats["submitted"] += 1
+        max_queued = getattr(settings, "LEARN_QUEUE_MAX_TURNS", 200)
+        while self._queued > max_queued:
+            self._drop_oldest()
+        if self._wake is not None:
+            self._wake.set()
+
+    @asynccontextmanager
+    async def interactive(self) -> AsyncIterator[None]:
+        """Mark an interactive generation as in flight; learning waits until none are."""
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._last_interactive_end = time.monotonic()
+            if self._in_flight == 0 and self._wake is not None:
+                self._wake.set()
+
+    # --- stats ---
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        oldest = min((b.first_at for b in self._buffers.values()), default=None)
+        return {
+            "running": self._task is not None,
+            "queued_turns": self._queued,
+            "queued_sessions": len(self._buffers),
+            "max_queued_turns": getattr(settings, "LEARN_QUEUE_MAX_TURNS", 200),
+            "oldest_queued_age_s": round(now - oldest, 2) if oldest is not None else None,
+            "last_batch_lag_s": self._last_lag_s,
+            "last_batch_ms": self._last_batch_ms,
+            "interactive_in_flight": self._in_flight,
+            **self._stats,
+            "prefilter": get_prefilter_stats(),
+        }
+
+    # --- internals ---
+
+    def _drop_oldest(self) -> None:
+        session_id = min(self._buffers, key=lambda s: self._buffers[s].first_at)
+        buf = self._buffers[session_id]
+        buf.turns.pop(0)
+        self._queued -= 1
+        self._stats["dropped"] += 1
+        if not buf.turns:
+            del self._buffers[session_id]
+
+    def _due_at(self, buf: _SessionBuffer) -> float:
+        if self._stopping or len(buf.turns) >= getattr(settings, "LEARN_MAX_TURNS_PER_BATCH", 6):
+            return 0.0
+        return buf.last_at + getattr(settings, "LEARN_DEBOUNCE_SECONDS", 20.0)
+
+    def _idle_at(self) -> Optional[float]:
+        """When interactive traffic allows learning to start; None while a generation is in flight."""
+        if self._stopping:
+            return 0.0
+        if self._in_flight:
+            return None
+        return self._last_interactive_end + getattr(settings, "LEARN_IDLE_GRACE_SECONDS", 2.0)
+
+    async def _sleep_until(self, deadline: Optional[float]) -> None:
+        self._wake.clear()
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            if not self._buffers:
+                if self._stopping:
+                    return
+                await self._sleep_until(None)
+                continue
+
+            # Session that is due first; among due ones the oldest, so a busy session cannot starve the others.
+            session_id = min(self._buffers, key=lambda s: (self._due_at(self._buffers[s]), self._buffers[s].first_at))
+            buf = self._buffers[session_id]
+            idle_at = self._idle_at()
+            start_at = None if idle_at is None else max(idle_at, self._due_at(buf))
+            if start_at is None or start_at > time.monotonic():
+                await self._sleep_until(start_at)
+                continue
+
+            max_batch = getattr(settings, "LEARN_MAX_TURNS_PER_BATCH", 6)
+            turns, buf.turns = buf.turns[:max_batch], buf.turns[max_batch:]
+            self._queued -= len(turns)
+            lag = time.monotonic() - buf.first_at
+            if buf.turns:
+                buf.first_at = time.monotonic()
+            else:
+                del self._buffers[session_id]
+
+            t0 = time.perf_counter()
+            try:
+                learned = await learn_from_turns(turns, session_id, self._client, settings.OLLAMA_MODEL)
+            except Exception as e:
+                print(f"Learning failed: {e}")
+                learned = []
+            self._last_batch_ms = round((time.perf_counter() - t0) * 1000, 1)
+            self._last_lag_s = round(lag, 2)
+            self._stats["batches"] += 1
+            self._stats["turns_processed"] += len(turns)
+            self._stats["facts_learned"] += len(learned)
+
+
+learning_scheduler = LearningScheduler()
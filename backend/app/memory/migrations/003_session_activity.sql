@@ -0,0 +1,22 @@
+-- Denormalized session activity so list_sessions does not scan messages, plus the
+-- (session_id, id) index every per-session message query needs.
+ALTER TABLE sessions ADD COLUMN last_message_at TEXT;
+ALTER TABLE sessions ADD COLUMN preview TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_messages_session_id ON messages(session_id, id);
+
+UPDATE sessions SET
+  last_message_at = COALESCE(
+    (SELECT m.created_at FROM messages m WHERE m.session_id = sessions.id ORDER BY m.id DESC LIMIT 1),
+    created_at
+  ),
+  preview = (SELECT substr(m.content, 1, 200) FROM messages m WHERE m.session_id = sessions.id ORDER BY m.id DESC LIMIT 1);
+
+CREATE INDEX IF NOT EXISTS idx_sessions_activity ON sessions(last_message_at DESC, id DESC);
+
+-- Keep activity columns current for every message insert.
+CREATE TRIGGER IF NOT EXISTS trg_messages_session_activity AFTER INSERT ON messages BEGIN
+  UPDATE sessions
+  SET last_message_at = NEW.created_at, preview = substr(NEW.content, 1, 200)
+  WHERE id = NEW.session_id;
+END;
@@ -0,0 +1,2 @@
+-- Bounded "recent facts" lookup for the learning prompt (ORDER BY updated_at DESC LIMIT n)
+CREATE INDEX IF NOT EXISTS idx_learned_facts_updated ON learned_facts(updated_at DESC);
@@ -0,0 +1,13 @@
+-- Vision replies cached by image content id, model and request (prompt + options)
+CREATE TABLE IF NOT EXISTS vision_cache (
+  image_id TEXT NOT NULL,           -- content id of the upload (see app.core.storage.content_id)
+  model TEXT NOT NULL,
+  request_key TEXT NOT NULL,        -- hash of prompt, crop and temperature
+  reply TEXT NOT NULL,
+  created_at TEXT NOT NULL,
+  last_used_at TEXT NOT NULL,
+  hits INTEGER NOT NULL DEFAULT 0,
+  PRIMARY KEY (image_id, model, request_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_vision_cache_last_used ON vision_cache(last_used_at DESC);
@@ -0,0 +1,11 @@
+-- Upload metadata: O(1) lookup by image_id and LRU order for the upload collector
+CREATE TABLE IF NOT EXISTS uploads (
+  id TEXT PRIMARY KEY,              -- image_id (content hash; legacy uploads keep their timestamp id)
+  path TEXT NOT NULL,               -- file name relative to UPLOAD_DIR
+  size INTEGER NOT NULL,
+  mime TEXT,
+  created_at TEXT NOT NULL,
+  last_used_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_uploads_last_used ON uploads(last_used_at);
@@ -0,0 +1,29 @@
+"""Index the files already in the upload directory into the uploads table (006)."""
+import mimetypes
+import os
+from datetime import datetime
+
+from app.core.storage import UPLOAD_DIR
+from app.memory.init_db import BACKFILL_CHUNK_SIZE
+
+_INSERT = (
+    "INSERT OR IGNORE INTO uploads (id, path, size, mime, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def upgrade(conn):
+    batch = []
+    for entry in os.scandir(UPLOAD_DIR):
+        if not entry.is_file() or entry.name.startswith("."):
+            continue
+        st = entry.stat()
+        image_id = os.path.splitext(entry.name)[0]
+        ts = datetime.utcfromtimestamp(st.st_mtime).isoformat()
+        batch.append((image_id, entry.name, st.st_size, mimetypes.guess_type(entry.name)[0], ts, ts))
+        if len(batch) >= BACKFILL_CHUNK_SIZE:
+            conn.executemany(_INSERT, batch)
+            conn.commit()
+            batch = []
+    if batch:
+        conn.executemany(_INSERT, batch)
+        conn.commit()
@@ -1,101 +1,444 @@
 from __future__ import annotations
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import Callable, Iterator, List, Dict, Any, Optional, Tuple
+import asyncio
+import base64
 import json
+import sqlite3
+import threading
+import time
 
-from app.memory.db import get_conn
+from app.core.config import settings
+from app.core.metrics import stage
+from app.memory.db import connection
+from app.memory.retrieval import MemoryIndex, estimate_tokens, memory_prompt
 
 def _now() -> str:
     return datetime.utcnow().isoformat()
 
+
+# ---------- In-process memory cache ----------
+# Preferences and learned facts are read on every chat turn but change rarely. Reads are
+# served from process memory; every writer in this module bumps _memory_version, which
+# invalidates all cached entries (including the rendered prompt block) at once.
+
+_memory_version = 0
+_memory_cache: Dict[str, Any] = {}
+_memory_cache_version = -1
+_memory_lock = threading.Lock()
+
+
+def _bump_memory_version() -> None:
+    global _memory_version
+    with _memory_lock:
+        _memory_version += 1
+
+
+def get_memory_version() -> int:
+    """Current memory version; changes whenever preferences or learned facts are written."""
+    return _memory_version
+
+
+def _cached(name: str, load: Callable[[], Any]) -> Any:
+    global _memory_cache_version
+    with _memory_lock:
+        version = _memory_version
+        if _memory_cache_version != version:
+            _memory_cache.clear()
+            _memory_cache_version = version
+        if name in _memory_cache:
+            return _memory_cache[name]
+    value = load()
+    with _memory_lock:
+        # Only store if no write happened while loading; otherwise the value may be stale.
+        if _memory_cache_version == version == _memory_version:
+            _memory_cache[name] = value
+    return value
+
+
+# ---------- Write-behind queue ----------
+# Messages and tool logs are written on the request path of every chat turn. Depending on
+# DB_WRITE_MODE they are written immediately ("sync"), or queued and committed by a
+# background thread in one transaction per DB_FLUSH_INTERVAL_MS window: "group" waits for
+# that commit before returning (durable, but many writers share one fsync; the default), "async"
+# returns at once (up to one window of acknowledged writes can be lost on a crash).
+
+_Statements = List[Tuple[str, tuple]]
+# (statements, session id, message visible to get_recent_messages until committed)
+_Write = Tuple[_Statements, Optional[str], Optional[Dict[str, str]]]
+# Called by the writer thread once the write is committed (or has failed).
+_Done = Callable[[], None]
+
+
+def _resolve(fut: "asyncio.Future[None]") -> None:
+    if not fut.done():  # the waiting request may have been cancelled
+        fut.set_result(None)
+
+
+class _WriteBehind:
+    def __init__(self) -> None:
+        self._cond = threading.Condition()
+        self._queue: List[Tuple[_Write, Optional[_Done]]] = []
+        # Batches taken off the queue by the writer but not committed yet.
+        self._in_flight = 0
+        # Messages queued but not committed yet, per session (read-your-writes).
+        self._pending: Dict[str, List[Dict[str, str]]] = {}
+        # Held while a batch commits and while readers merge DB rows with pending messages,
+        # so a message is never seen twice or missed.
+        self.commit_lock = threading.RLock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.stats = {"writes": 0, "batches": 0, "max_batch": 0, "errors": 0}
+
+    def submit(self, statements: _Statements, session_id: Optional[str], message: Optional[Dict[str, str]], done: Optional[_Done]) -> bool:
+        """Queue a write; done is called once it is committed. False if it was executed right away (shutdown)."""
+        with self._cond:
+            if self._stopping:
+                self._execute_now(statements)
+                return False
+            self._ensure_thread()
+            self._queue.append(((statements, session_id, message), done))
+            if session_id is not None and message is not None:
+                self._pending.setdefault(session_id, []).append(message)
+            self._cond.notify()
+            return True
+
+    def pending_messages(self, session_id: str) -> List[Dict[str, str]]:
+        with self._cond:
+            return list(self._pending.get(session_id, ()))
+
+    def has_pending(self) -> bool:
+        """Whether anything is queued or being committed right now."""
+        return bool(self._queue) or self._in_flight > 0
+
+    def add_marker(self, done: _Done) -> bool:
+        """
+        Queue an empty write whose done fires after everything queued or in flight so far is
+        committed (batches commit in order). False if there is nothing to wait for.
+        """
+        with self._cond:
+            if self._thread is None or not (self._queue or self._in_flight):
+                return False
+            self._queue.append((([], None, None), done))
+            self._cond.notify()
+            return True
+
+    def flush(self) -> None:
+        """Block until everything queued so far is committed. Async code uses flush_writes_async."""
+        done = threading.Event()
+        if self.add_marker(done.set):
+            done.wait()
+
+    def stop(self) -> None:
+        """Commit what is queued and stop the writer thread (app shutdown)."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        interval = max(0, getattr(settings, "DB_FLUSH_INTERVAL_MS", 50)) / 1000
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue and self._stopping:
+                    return
+            # Let concurrent writers join this batch.
+            if interval and not self._stopping:
+                time.sleep(interval)
+            with self._cond:
+                batch, self._queue = self._queue, []
+                self._in_flight += 1
+            self._commit(batch)
+
+    def _commit(self, batch: List[Tuple[_Write, Optional[_Done]]]) -> None:
+        writes = [w for w, _ in batch if w[0]]
+        try:
+            with self.commit_lock:
+                try:
+                    with connection() as conn:
+                        for statements, _, _ in writes:
+                            for sql, params in statements:
+                                conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    # One bad row must not lose the batch: retry each write on its own.
+                    print(f"Batched DB write failed ({e}); retrying writes individually")
+                    for statements, _, _ in writes:
+                        try:
+                            self._execute_now(statements)
+                        except sqlite3.Error as e2:
+                            self.stats["errors"] += 1
+                            print(f"DB write dropped: {e2}")
+                finally:
+                    # Still under commit_lock: a reader sees each message as a row or as pending, never both.
+                    self._drop_pending(writes)
+            self.stats["writes"] += len(writes)
+            self.stats["batches"] += 1
+            self.stats["max_batch"] = max(self.stats["max_batch"], len(writes))
+        except Exception as e:
+            # Anything else must not kill the writer thread or leave waiters hanging.
+            self.stats["errors"] += 1
+            print(f"DB write batch dropped: {e}")
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+            for _, done in batch:
+                if done is not None:
+                    try:
+                        done()
+                    except Exception as e:
+                        print(f"DB write callback failed: {e}")
+
+    def _drop_pending(self, writes: List[_Write]) -> None:
+        with self._cond:
+            for _, session_id, message in writes:
+                msgs = self._pending.get(session_id) if message is not None else None
+                if msgs:
+                    msgs.pop(0)  # committed in FIFO order
+                    if not msgs:
+                        del self._pending[session_id]
+
+    @staticmethod
+    def _execute_now(statements: _Statements) -> None:
+        with connection() as conn:
+            for sql, params in statements:
+                conn.execute(sql, params)
+
+
+_writer = _WriteBehind()
+
+
+def _async_done() -> Tuple["asyncio.Future[None]", _Done]:
+    """Future on the running loop plus a thread-safe callback that completes it."""
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    return fut, lambda: loop.call_soon_threadsafe(_resolve, fut)
+
+
+def _write(statements: _Statements, session_id: Optional[str] = None, message: Optional[Dict[str, str]] = None) -> None:
+    """
+    Run statements in one transaction, now or via the write-behind queue (DB_WRITE_MODE).
+    Blocks in "group" mode: async code must use _write_async.
+    """
+    mode = getattr(settings, "DB_WRITE_MODE", "group")
+    with stage("db_write"):
+        if mode == "sync":
+            _WriteBehind._execute_now(statements)
+        elif mode == "group":
+            done = threading.Event()
+            if _writer.submit(statements, session_id, message, done.set):
+                done.wait()
+        else:
+            _writer.submit(statements, session_id, message, None)
+
+
+async def _write_async(statements: _Statements, session_id: Optional[str] = None, message: Optional[Dict[str, str]] = None) -> None:
+    """_write for the event loop: in "group" mode the commit is awaited, not waited for on the loop."""
+    mode = getattr(settings, "DB_WRITE_MODE", "group")
+    with stage("db_write"):
+        if mode == "sync":
+            _WriteBehind._execute_now(statements)
+        elif mode == "group":
+            fut, done = _async_done()
+            if _writer.submit(statements, session_id, message, done):
+                await fut
+        else:
+            _writer.submit(statements, session_id, message, None)
+
+
+def flush_writes() -> None:
+    """Commit all queued writes now (used before reads that must see them). Blocks: async code uses flush_writes_async."""
+    if _writer.has_pending():
+        with stage("db_flush"):
+            _writer.flush()
+
+
+async def flush_writes_async() -> None:
+    """flush_writes for the event loop: awaits the commit instead of blocking the loop."""
+    if _writer.has_pending():
+        with stage("db_flush"):
+            fut, done = _async_done()
+            if _writer.add_marker(done):
+                await fut
+
+
+def shutdown_writes() -> None:
+    """Flush queued writes and stop the writer thread."""
+    _writer.stop()
+
+
+def get_write_stats() -> Dict[str, Any]:
+    return {"mode": getattr(settings, "DB_WRITE_MODE", "group"), "queued": len(_writer._queue), **_writer.stats}
+
+
 def ensure_session(session_id: str) -> None:
-    conn = get_conn()
-    try:
+    now = _now()
+    with connection() as conn:
         conn.execute(
-            "INSERT OR IGNORE INTO sessions (id, created_at) VALUES (?, ?)",
-            (session_id, _now()),
+            "INSERT OR IGNORE INTO sessions (id, created_at, last_message_at) VALUES (?, ?, ?)",
+            (session_id, now, now),
         )
-        conn.commit()
-    finally:
-        conn.close()
 
-def add_message(session_id: str, role: str, content: str) -> None:
-    ensure_session(session_id)
-    conn = get_conn()
-    try:
-        conn.execute(
+def _message_statements(session_id: str, role: str, content: str) -> _Statements:
+    now = _now()
+    return [
+        # The messages insert trigger updates sessions.last_message_at and preview.
+        ("INSERT OR IGNORE INTO sessions (id, created_at, last_message_at) VALUES (?, ?, ?)", (session_id, now, now)),
+        (
             "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
-            (session_id, role, content, _now()),
-        )
-        conn.commit()
-    finally:
-        conn.close()
+            (session_id, role, content, now),
+        ),
+    ]
+
+def add_message(session_id: str, role: str, content: str) -> None:
+    """Insert a message, creating its session if needed, in one transaction (see DB_WRITE_MODE)."""
+    _write(_message_statements(session_id, role, content), session_id, {"role": role, "content": content})
+
+async def add_message_async(session_id: str, role: str, content: str) -> None:
+    """add_message for async routes (never blocks the event loop, also in "group" mode)."""
+    await _write_async(_message_statements(session_id, role, content), session_id, {"role": role, "content": content})
 
 def get_recent_messages(session_id: str, limit: int = 12) -> List[Dict[str, str]]:
     """
     Returns messages in chronological order (oldest -> newest) limited by last N.
+    Includes messages of this session still waiting in the write-behind queue.
     """
-    conn = get_conn()
-    try:
+    with _writer.commit_lock, connection() as conn:
         rows = conn.execute(
             "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
             (session_id, limit),
         ).fetchall()
-        rows = list(reversed(rows))
-        return [{"role": r["role"], "content": r["content"]} for r in rows]
-    finally:
-        conn.close()
+        pending = _writer.pending_messages(session_id)
+    rows = list(reversed(rows))
+    out = [{"role": r["role"], "content": r["content"]} for r in rows] + pending
+    return out[-limit:] if limit > 0 else out
+
+async def get_recent_messages_async(session_id: str, limit: int = 12) -> List[Dict[str, str]]:
+    """get_recent_messages for async routes: waits for an in-progress batch commit off the event loop."""
+    return await asyncio.to_thread(get_recent_messages, session_id, limit)
+
+
+def get_session_messages(
+    session_id: str,
+    limit: int = 100,
+    before: int | None = None,
+    after: int | None = None,
+    flush: bool = True,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    One page of a session's messages (with id and created_at), in chronological order.
+    Returns (messages, has_more).
+    - default: the newest `limit` messages; has_more means older ones exist
+    - before=<id>: the `limit` messages just older than id (scrollback)
+    - after=<id>: the `limit` messages just newer than id
+    flush=False when the caller already awaited flush_writes_async().
+    """
+    if flush:
+        flush_writes()
+    if after is not None:
+        sql = "SELECT id, role, content, created_at FROM messages WHERE session_id = ? AND id > ? ORDER BY id ASC LIMIT ?"
+        params: tuple = (session_id, after, limit + 1)
+    elif before is not None:
+        sql = "SELECT id, role, content, created_at FROM messages WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?"
+        params = (session_id, before, limit + 1)
+    else:
+        sql = "SELECT id, role, content, created_at FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?"
+        params = (session_id, limit + 1)
+    with connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if after is None:
+        rows.reverse()
+    return [
+        {"id": r["id"], "role": r["role"], "content": r["content"], "created_at": r["created_at"]}
+        for r in rows
+    ], has_more
+
+
+def iter_session_messages(session_id: str, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+    """Yield every message of a session, oldest first, one keyset page in memory at a time."""
+    flush_writes()
+    last_id = 0
+    while True:
+        with connection() as conn:
+            rows = conn.execute(
+                "SELECT id, role, content, created_at FROM messages WHERE session_id = ? AND id > ? ORDER BY id ASC LIMIT ?",
+                (session_id, last_id, page_size),
+            ).fetchall()
+        for r in rows:
+            yield {"id": r["id"], "role": r["role"], "content": r["content"], "created_at": r["created_at"]}
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1]["id"]
+
+
+def _encode_cursor(last_message_at: str, session_id: str) -> str:
+    raw = json.dumps([last_message_at, session_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
 
 
-def get_session_messages(session_id: str, limit: int = 100) -> List[Dict[str, Any]]:
-    """Returns messages for a session with created_at, in chronological order."""
-    conn = get_conn()
+def _decode_cursor(cursor: str) -> Tuple[str, str]:
     try:
-        rows = conn.execute(
-            "SELECT role, content, created_at FROM messages WHERE session_id = ? ORDER BY id ASC LIMIT ?",
-            (session_id, limit),
-        ).fetchall()
-        return [{"role": r["role"], "content": r["content"], "created_at": r["created_at"]} for r in rows]
-    finally:
-        conn.close()
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        last_message_at, session_id = json.loads(raw)
+        return str(last_message_at), str(session_id)
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor.") from e
 
 
-def list_sessions(limit: int = 50) -> List[Dict[str, Any]]:
+def list_sessions(limit: int = 50, cursor: str | None = None, flush: bool = True) -> Tuple[List[Dict[str, Any]], Optional[str]]:
     """
-    Returns sessions ordered by last activity (most recent first).
+    Returns (sessions, next_cursor): sessions ordered by last activity (most recent first).
     Each session has: id, created_at, updated_at (last message time or created_at), preview (last message content truncated).
+    Pass next_cursor back to get the following page; it is None on the last page.
+    Keyset pagination over sessions(last_message_at, id), so cost does not grow with message count.
+    flush=False when the caller already awaited flush_writes_async().
     """
-    conn = get_conn()
-    try:
+    if flush:
+        flush_writes()
+    params: List[Any] = []
+    where = ""
+    if cursor:
+        after_at, after_id = _decode_cursor(cursor)
+        where = "WHERE (last_message_at, id) < (?, ?)"
+        params.extend([after_at, after_id])
+    params.append(limit + 1)
+    with connection() as conn:
         rows = conn.execute(
-            """
-            SELECT s.id, s.created_at,
-                   (SELECT m.content FROM messages m WHERE m.session_id = s.id ORDER BY m.id DESC LIMIT 1) AS preview,
-                   (SELECT m.created_at FROM messages m WHERE m.session_id = s.id ORDER BY m.id DESC LIMIT 1) AS last_at
-            FROM sessions s
-            ORDER BY COALESCE(
-                (SELECT m.created_at FROM messages m WHERE m.session_id = s.id ORDER BY m.id DESC LIMIT 1),
-                s.created_at
-            ) DESC
+            f"""
+            SELECT id, created_at, last_message_at, preview
+            FROM sessions
+            {where}
+            ORDER BY last_message_at DESC, id DESC
             LIMIT ?
             """,
-            (limit,),
+            params,
         ).fetchall()
-        out = []
-        for r in rows:
-            preview = (r["preview"] or "").strip()
-            if len(preview) > 120:
-                preview = preview[:117] + "..."
-            updated_at = r["last_at"] or r["created_at"]
-            out.append({
-                "id": r["id"],
-                "created_at": r["created_at"],
-                "updated_at": updated_at,
-                "preview": preview or "No messages yet.",
-            })
-        return out
-    finally:
-        conn.close()
+    out = []
+    for r in rows[:limit]:
+        preview = (r["preview"] or "").strip()
+        if len(preview) > 120:
+            preview = preview[:117] + "..."
+        out.append({
+            "id": r["id"],
+            "created_at": r["created_at"],
+            "updated_at": r["last_message_at"] or r["created_at"],
+            "preview": preview or "No messages yet.",
+        })
+    next_cursor = None
+    if len(rows) > limit and out:
+        last = rows[limit - 1]
+        next_cursor = _encode_cursor(last["last_message_at"], last["id"])
+    return out, next_cursor
 
 
 # ---------- Preferences (long-term memory) ----------
@@ -103,8 +446,7 @@ def list_sessions(limit: int = 50) -> List[Dict[str, Any]]:
 
 def set_preference(key: str, value: str) -> None:
     key = key.strip()
-    conn = get_conn()
-    try:
+    with connection() as conn:
         conn.execute(
             """
             INSERT INTO preferences (key, value, updated_at)
@@ -113,30 +455,27 @@ def set_preference(key: str, value: str) -> None:
             """,
             (key, value, _now()),
         )
-        conn.commit()
-    finally:
-        conn.close()
+    _bump_memory_version()
+    _memory_index.upsert(f"pref:{key}", f"{key} {value}")
 
 
 def get_preference(key: str) -> Optional[str]:
-    conn = get_conn()
-    try:
+    with connection() as conn:
         row = conn.execute(
             "SELECT value FROM preferences WHERE key = ?",
             (key.strip(),),
         ).fetchone()
         return row["value"] if row else None
-    finally:
-        conn.close()
 
 
-def get_all_preferences() -> Dict[str, str]:
-    conn = get_conn()
-    try:
+def _load_all_preferences() -> Dict[str, str]:
+    with connection() as conn:
         rows = conn.execute("SELECT key, value FROM preferences").fetchall()
         return {r["key"]: r["value"] for r in rows}
-    finally:
-        conn.close()
+
+
+def get_all_preferences() -> Dict[str, str]:
+    return dict(_cached("preferences", _load_all_preferences))
 
 
 # ---------- Learned Facts (smart memory) ----------
@@ -144,77 +483,279 @@ def get_all_preferences() -> Dict[str, str]:
 
 def save_learned_fact(fact_key: str, fact_value: str, session_id: str | None = None, confidence: float = 1.0) -> None:
     """Save or update a learned fact. If fact_key exists, update if confidence is higher."""
-    conn = get_conn()
-    try:
-        existing = conn.execute(
-            "SELECT confidence FROM learned_facts WHERE fact_key = ?",
-            (fact_key.strip(),),
-        ).fetchone()
-        
-        if existing and existing["confidence"] >= confidence:
-            # Existing fact has equal or higher confidence, skip update
-            return
-        
-        conn.execute(
-            """
-            INSERT INTO learned_facts (fact_key, fact_value, confidence, source_session_id, created_at, updated_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-            ON CONFLICT(fact_key) DO UPDATE SET
-                fact_value = excluded.fact_value,
-                confidence = excluded.confidence,
-                source_session_id = excluded.source_session_id,
-                updated_at = excluded.updated_at
-            """,
-            (fact_key.strip(), fact_value.strip(), confidence, session_id, _now(), _now()),
-        )
-        conn.commit()
-    finally:
-        conn.close()
+    save_learned_facts([(fact_key, fact_value, confidence)], session_id)
+
+
+def save_learned_facts(
+    facts: List[Tuple[str, str, float]],
+    session_id: str | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Upsert (fact_key, fact_value, confidence) tuples in one transaction. An existing fact is only
+    replaced by a strictly higher confidence; that rule is applied in SQL, so there is no read first.
+    Returns the facts that were actually written.
+    """
+    # Within one batch the most confident value per key wins.
+    best: Dict[str, Tuple[str, float]] = {}
+    for key, value, confidence in facts:
+        key, value = key.strip(), value.strip()
+        if key and value and (key not in best or confidence > best[key][1]):
+            best[key] = (value, confidence)
+    if not best:
+        return []
+
+    now = _now()
+    written: List[Dict[str, Any]] = []
+    with connection() as conn:
+        for key, (value, confidence) in best.items():
+            row = conn.execute(
+                """
+                INSERT INTO learned_facts (fact_key, fact_value, confidence, source_session_id, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(fact_key) DO UPDATE SET
+                    fact_value = excluded.fact_value,
+                    confidence = excluded.confidence,
+                    source_session_id = excluded.source_session_id,
+                    updated_at = excluded.updated_at
+                WHERE excluded.confidence > learned_facts.confidence
+                RETURNING fact_key
+                """,
+                (key, value, confidence, session_id, now, now),
+            ).fetchone()
+            if row is not None:
+                written.append({"key": key, "value": value, "confidence": confidence})
+    if written:
+        _bump_memory_version()
+        for fact in written:
+            _memory_index.upsert(f"fact:{fact['key']}", f"{fact['key']} {fact['value']}")
+    return written
 
 
 def get_learned_fact(fact_key: str) -> Optional[str]:
     """Get a learned fact by key."""
-    conn = get_conn()
-    try:
+    with connection() as conn:
         row = conn.execute(
             "SELECT fact_value FROM learned_facts WHERE fact_key = ?",
             (fact_key.strip(),),
         ).fetchone()
         return row["fact_value"] if row else None
-    finally:
-        conn.close()
+
+
+def _load_all_learned_facts() -> Dict[str, str]:
+    with connection() as conn:
+        rows = conn.execute("SELECT fact_key, fact_value FROM learned_facts ORDER BY fact_key").fetchall()
+        return {r["fact_key"]: r["fact_value"] for r in rows}
 
 
 def get_all_learned_facts() -> Dict[str, str]:
     """Get all learned facts as a dict."""
-    conn = get_conn()
-    try:
-        rows = conn.execute("SELECT fact_key, fact_value FROM learned_facts ORDER BY fact_key").fetchall()
+    return dict(_cached("learned_facts", _load_all_learned_facts))
+
+
+def get_recent_learned_facts(limit: int = 10) -> Dict[str, str]:
+    """The most recently updated learned facts (newest first), without reading the whole table."""
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT fact_key, fact_value FROM learned_facts ORDER BY updated_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
         return {r["fact_key"]: r["fact_value"] for r in rows}
-    finally:
-        conn.close()
 
 
 def delete_learned_fact(fact_key: str) -> None:
     """Delete a learned fact."""
-    conn = get_conn()
-    try:
+    with connection() as conn:
         conn.execute("DELETE FROM learned_facts WHERE fact_key = ?", (fact_key.strip(),))
-        conn.commit()
-    finally:
-        conn.close()
+    _bump_memory_version()
+    _memory_index.remove(f"fact:{fact_key.strip()}")
+
+
+def _render_memory_text() -> str:
+    prefs = _cached("preferences", _load_all_preferences)
+    learned_facts = _cached("learned_facts", _load_all_learned_facts)
+    prefs_text = "\n".join([f"- {k}: {v}" for k, v in prefs.items()]) if prefs else "None"
+    facts_text = "\n".join([f"- {k}: {v}" for k, v in learned_facts.items()]) if learned_facts else "None"
+    return f"User preferences:\n{prefs_text}\n\nLearned facts:\n{facts_text}"
+
+
+def get_memory_text() -> str:
+    """Preferences and learned facts rendered as the prompt's long-term memory block (cached)."""
+    return _cached("memory_text", _render_memory_text)
+
+
+# ---------- Memory retrieval ----------
+# Relevance index over preferences and learned facts. Loaded from the DB once, then kept
+# current by the writers above (doc ids "pref:<key>" / "fact:<key>").
+
+_memory_index = MemoryIndex()
+
+
+def _ensure_memory_index() -> None:
+    while not _memory_index.loaded:
+        version = get_memory_version()
+        with connection() as conn:
+            prefs = conn.execute("SELECT key, value FROM preferences ORDER BY updated_at").fetchall()
+            facts = conn.execute("SELECT fact_key, fact_value FROM learned_facts ORDER BY updated_at").fetchall()
+        # Preferences are loaded last so they win ties (explicit user settings beat guesses).
+        entries = [(f"fact:{r['fact_key']}", f"{r['fact_key']} {r['fact_value']}") for r in facts]
+        entries += [(f"pref:{r['key']}", f"{r['key']} {r['value']}") for r in prefs]
+        _memory_index.load(entries)
+        if get_memory_version() != version:
+            # A write raced the load; rebuild so it is not lost.
+            _memory_index.loaded = False
+
+
+def get_relevant_memory_text(query: str, top_k: int, token_budget: int) -> str:
+    """
+    Long-term memory block limited to the top_k entries most relevant to query that fit
+    in token_budget. When everything fits, returns the full (cached) block unchanged, which
+    keeps the prompt stable across turns.
+    """
+    full = get_memory_text()
+    if token_budget <= 0 or estimate_tokens(memory_prompt(full)) <= token_budget:
+        return full
+    _ensure_memory_index()
+    prefs = _cached("preferences", _load_all_preferences)
+    facts = _cached("learned_facts", _load_all_learned_facts)
+    picked: Dict[str, List[str]] = {"pref": [], "fact": []}
+    for doc_id, _score in _memory_index.rank(query):
+        if len(picked["pref"]) + len(picked["fact"]) >= top_k:
+            break
+        kind, key = doc_id.split(":", 1)
+        value = (prefs if kind == "pref" else facts).get(key)
+        if value is None:
+            continue
+        picked[kind].append(f"- {key}: {value}")
+        # Cost of the message as sent, headers and counts included.
+        if estimate_tokens(memory_prompt(_relevant_memory_block(picked, len(prefs), len(facts)))) > token_budget:
+            picked[kind].pop()
+    return _relevant_memory_block(picked, len(prefs), len(facts))
+
+
+def _relevant_memory_block(picked: Dict[str, List[str]], total_prefs: int, total_facts: int) -> str:
+    prefs_text = "\n".join(picked["pref"]) if picked["pref"] else "None"
+    facts_text = "\n".join(picked["fact"]) if picked["fact"] else "None"
+    return (
+        f"User preferences (most relevant {len(picked['pref'])} of {total_prefs}):\n{prefs_text}\n\n"
+        f"Learned facts (most relevant {len(picked['fact'])} of {total_facts}):\n{facts_text}"
+    )
 
 
 # ---------- Tool logs ----------
 
 
+def _tool_log_statements(session_id: str, tool_name: str, args: Dict[str, Any], result: Dict[str, Any]) -> _Statements:
+    return [(
+        "INSERT INTO tool_logs (session_id, tool_name, args_json, result_json, created_at) VALUES (?, ?, ?, ?, ?)",
+        (session_id, tool_name, json.dumps(args), json.dumps(result), _now()),
+    )]
+
+
 def log_tool(session_id: str, tool_name: str, args: Dict[str, Any], result: Dict[str, Any]) -> None:
-    conn = get_conn()
-    try:
+    _write(_tool_log_statements(session_id, tool_name, args, result))
+
+
+async def log_tool_async(session_id: str, tool_name: str, args: Dict[str, Any], result: Dict[str, Any]) -> None:
+    await _write_async(_tool_log_statements(session_id, tool_name, args, result))
+
+
+# ---------- Vision result cache ----------
+
+
+def get_vision_result(image_id: str, model: str, request_key: str) -> Optional[str]:
+    """Cached reply for the same image content, model and request (prompt + options), if any."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT reply FROM vision_cache WHERE image_id = ? AND model = ? AND request_key = ?",
+            (image_id, model, request_key),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE vision_cache SET last_used_at = ?, hits = hits + 1 WHERE image_id = ? AND model = ? AND request_key = ?",
+            (_now(), image_id, model, request_key),
+        )
+        return row["reply"]
+
+
+def save_vision_result(image_id: str, model: str, request_key: str, reply: str, max_entries: int) -> None:
+    """Store a vision reply; keeps at most max_entries rows, dropping the least recently used."""
+    now = _now()
+    with connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO vision_cache (image_id, model, request_key, reply, created_at, last_used_at, hits)
+            VALUES (?, ?, ?, ?, ?, ?, 0)
+            ON CONFLICT(image_id, model, request_key) DO UPDATE SET reply = excluded.reply, last_used_at = excluded.last_used_at
+            """,
+            (image_id, model, request_key, reply, now, now),
+        )
+        conn.execute(
+            """
+            DELETE FROM vision_cache WHERE rowid IN (
+                SELECT rowid FROM vision_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )
+            """,
+            (max(0, max_entries),),
+        )
+
+
+# ---------- Uploads ----------
+
+
+def get_upload(image_id: str) -> Optional[Dict[str, Any]]:
+    """Upload metadata by image_id (primary-key lookup), or None."""
+    with connection() as conn:
+        row = conn.execute(
+            "SELECT id, path, size, mime, created_at, last_used_at FROM uploads WHERE id = ?",
+            (image_id,),
+        ).fetchone()
+        return dict(row) if row else None
+
+
+def register_upload(image_id: str, path: str, size: int, mime: str | None) -> None:
+    """Record a stored upload (path relative to the upload directory)."""
+    now = _now()
+    with connection() as conn:
         conn.execute(
-            "INSERT INTO tool_logs (session_id, tool_name, args_json, result_json, created_at) VALUES (?, ?, ?, ?, ?)",
-            (session_id, tool_name, json.dumps(args), json.dumps(result), _now()),
+            """
+            INSERT INTO uploads (id, path, size, mime, created_at, last_used_at) VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(id) DO UPDATE SET path = excluded.path, size = excluded.size, last_used_at = excluded.last_used_at
+            """,
+            (image_id, path, size, mime, now, now),
         )
-        conn.commit()
-    finally:
-        conn.close()
\ No newline at end of file
+
+
+def touch_upload(image_id: str) -> None:
+    with connection() as conn:
+        conn.execute("UPDATE uploads SET last_used_at = ? WHERE id = ?", (_now(), image_id))
+
+
+def delete_uploads(image_ids: List[str]) -> None:
+    if not image_ids:
+        return
+    with connection() as conn:
+        conn.executemany("DELETE FROM uploads WHERE id = ?", [(i,) for i in image_ids])
+
+
+def get_upload_totals() -> Tuple[int, int]:
+    """(number of uploads, total bytes)."""
+    with connection() as conn:
+        row = conn.execute("SELECT COUNT(*) AS n, COALESCE(SUM(size), 0) AS total FROM uploads").fetchone()
+        return row["n"], row["total"]
+
+
+def get_uploads_lru(limit: int, used_before: str | None = None) -> List[Dict[str, Any]]:
+    """Least recently used uploads first; only those last used before used_before if given."""
+    with connection() as conn:
+        if used_before is None:
+            rows = conn.execute(
+                "SELECT id, path, size, last_used_at FROM uploads ORDER BY last_used_at ASC LIMIT ?",
+                (limit,),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT id, path, size, last_used_at FROM uploads WHERE last_used_at < ? ORDER BY last_used_at ASC LIMIT ?",
+                (used_before, limit),
+            ).fetchall()
+        return [dict(r) for r in rows]
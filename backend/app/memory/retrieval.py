@@ -0,0 +1,124 @@
+"""
+Local relevance index over long-term memory (preferences and learned facts).
+Okapi BM25 over word tokens of each entry's key and value, kept up to date incrementally
+by the writers in app.memory.repo so a query never rescans the table.
+"""
+from __future__ import annotations
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "for", "from", "how", "i", "in",
+    "is", "it", "me", "my", "of", "on", "or", "so", "that", "the", "this", "to", "was",
+    "what", "when", "where", "who", "with", "you", "your",
+}
+
+# BM25 parameters (standard defaults).
+_K1 = 1.2
+_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens; snake_case keys split into words, plural 's' stripped."""
+    tokens = []
+    for tok in _TOKEN_RE.findall((text or "").replace("_", " ").lower()):
+        if tok in _STOPWORDS:
+            continue
+        if len(tok) > 3 and tok.endswith("s") and not tok.endswith("ss"):
+            tok = tok[:-1]
+        tokens.append(tok)
+    return tokens
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough model-token count (about 4 characters per token for English)."""
+    return len(text) // 4 + 1
+
+
+def memory_prompt(memory_text: str) -> str:
+    """The long-term memory block as the system message content sent to the model."""
+    return f"Long-term memory:\n{memory_text}"
+
+
+class MemoryIndex:
+    """BM25 index keyed by doc id (e.g. "fact:user_name"). Thread-safe."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._docs: Dict[str, Tuple[Counter, int, int]] = {}  # doc_id -> (term counts, length, seq)
+        self._df: Counter = Counter()
+        self._total_len = 0
+        self._seq = 0
+        self.loaded = False
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def load(self, entries: Iterable[Tuple[str, str]]) -> None:
+        """Replace the index contents with (doc_id, text) pairs, oldest first."""
+        with self._lock:
+            self._docs.clear()
+            self._df.clear()
+            self._total_len = 0
+            for doc_id, text in entries:
+                self._upsert_locked(doc_id, text)
+            self.loaded = True
+
+    def upsert(self, doc_id: str, text: str) -> None:
+        with self._lock:
+            self._upsert_locked(doc_id, text)
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            self._remove_locked(doc_id)
+
+    def _upsert_locked(self, doc_id: str, text: str) -> None:
+        self._remove_locked(doc_id)
+        terms = Counter(tokenize(text))
+        length = sum(terms.values())
+        self._seq += 1
+        self._docs[doc_id] = (terms, length, self._seq)
+        self._df.update(terms.keys())
+        self._total_len += length
+
+    def _remove_locked(self, doc_id: str) -> None:
+        old = self._docs.pop(doc_id, None)
+        if old is None:
+            return
+        terms, length, _ = old
+        self._df.subtract(terms.keys())
+        for term in terms:
+            if self._df[term] <= 0:
+                del self._df[term]
+        self._total_len -= length
+
+    def rank(self, query: str) -> List[Tuple[str, float]]:
+        """
+        All doc ids ordered by BM25 score for query (best first). A term repeated in the
+        query counts that many times. Entries that share no terms with the query follow,
+        most recently written first.
+        """
+        q_terms = Counter(tokenize(query))
+        with self._lock:
+            n = len(self._docs)
+            if n == 0:
+                return []
+            avg_len = (self._total_len / n) or 1.0
+            idf = {
+                t: q_terms[t] * math.log(1 + (n - self._df[t] + 0.5) / (self._df[t] + 0.5))
+                for t in q_terms if t in self._df
+            }
+            scored = []
+            for doc_id, (terms, length, seq) in self._docs.items():
+                score = 0.0
+                for t, w in idf.items():
+                    tf = terms.get(t)
+                    if tf:
+                        score += w * tf * (_K1 + 1) / (tf + _K1 * (1 - _B + _B * length / avg_len))
+                scored.append((score, seq, doc_id))
+        scored.sort(reverse=True)
+        return [(doc_id, score) for score, _, doc_id in scored]
@@ -0,0 +1,87 @@
+"""
+TTL + LRU cache for tool results, keyed on tool name and normalized args.
+Only successful results ({"ok": True, ...}) are stored. Tools opt in via ToolSpec.cacheable.
+"""
+from __future__ import annotations
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+def _normalize(value: Any, fold: bool) -> Any:
+    """Drop None values; with fold, strings are also trimmed, single-spaced and case-folded."""
+    if isinstance(value, str):
+        return " ".join(value.split()).casefold() if fold else value
+    if isinstance(value, dict):
+        return {str(k): _normalize(v, fold) for k, v in value.items() if v is not None}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v, fold) for v in value]
+    return value
+
+
+def make_key(tool_name: str, args: Dict[str, Any], case_insensitive: Iterable[str] = ()) -> str:
+    """Cache key; only the args named in case_insensitive are folded (paths and such stay exact)."""
+    fold = set(case_insensitive)
+    normalized = {str(k): _normalize(v, k in fold) for k, v in (args or {}).items() if v is not None}
+    return tool_name + ":" + json.dumps(normalized, sort_keys=True, default=str)
+
+
+class ToolResultCache:
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _count(self, tool_name: str, field: str) -> None:
+        per_tool = self._stats.setdefault(
+            tool_name, {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "expired": 0}
+        )
+        per_tool[field] += 1
+
+    def get(self, tool_name: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._count(tool_name, "misses")
+                return None
+            expires_at, result = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._count(tool_name, "expired")
+                self._count(tool_name, "misses")
+                return None
+            self._data.move_to_end(key)
+            self._count(tool_name, "hits")
+        return copy.deepcopy(result)
+
+    def record_coalesced(self, tool_name: str) -> None:
+        """A miss that was served by joining an identical call already in flight."""
+        with self._lock:
+            self._count(tool_name, "coalesced")
+
+    def put(self, tool_name: str, key: str, result: Dict[str, Any], ttl_s: float) -> None:
+        if ttl_s <= 0 or self.max_entries <= 0 or not result.get("ok"):
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl_s, copy.deepcopy(result))
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                evicted_key, _ = self._data.popitem(last=False)
+                self._count(evicted_key.split(":", 1)[0], "evictions")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            per_tool = {name: dict(counts) for name, counts in self._stats.items()}
+            size = len(self._data)
+        for counts in per_tool.values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = round(counts["hits"] / lookups, 3) if lookups else 0.0
+        return {"size": size, "max_entries": self.max_entries, "tools": per_tool}
@@ -0,0 +1,315 @@
+"""
+Persistent filename index for file_ops search_user.
+
+A background thread keeps a SQLite table of every file under the allowed user folders
+(path, name, size, mtime). Refreshes are incremental: a directory is only re-listed when its
+mtime changed (entries added, removed or renamed), otherwise its known subdirectories are
+visited without touching its files. Names are searchable through an FTS5 trigram index
+when SQLite supports it, and results are ranked by match quality and recency.
+"""
+from __future__ import annotations
+import math
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+
+_BACKEND_ROOT = Path(__file__).resolve().parents[3]
+INDEX_DB_PATH = (
+    Path(settings.FILE_INDEX_DB_PATH) if getattr(settings, "FILE_INDEX_DB_PATH", None)
+    else _BACKEND_ROOT / "data" / "sqlite" / "file_index.db"
+)
+
+# Commit the builder's work every N directories so searches see progress and locks stay short.
+_COMMIT_EVERY_DIRS = 200
+# Max rows pulled from SQL before re-ranking in Python.
+_CANDIDATE_LIMIT = 2000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+  id INTEGER PRIMARY KEY,
+  path TEXT NOT NULL UNIQUE,
+  name TEXT NOT NULL,
+  dir TEXT NOT NULL,
+  root TEXT NOT NULL,
+  size INTEGER NOT NULL,
+  mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_dir ON files(dir);
+CREATE INDEX IF NOT EXISTS idx_files_mtime ON files(mtime);
+CREATE TABLE IF NOT EXISTS dirs (
+  path TEXT PRIMARY KEY,
+  parent TEXT,
+  root TEXT NOT NULL,
+  mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+  name, content='files', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+  INSERT INTO files_fts(rowid, name) VALUES (new.id, new.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+  INSERT INTO files_fts(files_fts, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+CREATE TRIGGER IF NOT EXISTS files_au AFTER UPDATE OF name ON files BEGIN
+  INSERT INTO files_fts(files_fts, rowid, name) VALUES ('delete', old.id, old.name);
+  INSERT INTO files_fts(rowid, name) VALUES (new.id, new.name);
+END;
+"""
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(INDEX_DB_PATH, timeout=10)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class FileIndex:
+    def __init__(self) -> None:
+        self.has_fts = False
+        self.ready = False
+        self.last_refresh: Dict[str, Any] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- lifecycle ----------
+
+    def open(self) -> None:
+        INDEX_DB_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = _connect()
+        try:
+            conn.executescript(_SCHEMA)
+            try:
+                conn.executescript(_FTS_SCHEMA)
+                self.has_fts = True
+            except sqlite3.OperationalError:
+                # SQLite without FTS5/trigram (< 3.34): fall back to substring scans of the name column.
+                self.has_fts = False
+            conn.commit()
+            row = conn.execute("SELECT value FROM meta WHERE key = 'built_at'").fetchone()
+            # A previous run's index is good enough to answer while the refresh catches up.
+            self.ready = row is not None
+        finally:
+            conn.close()
+
+    def start(self, roots: List[Path]) -> None:
+        """Open the index and refresh it in a daemon thread every FILE_INDEX_REFRESH_SECONDS."""
+        if self._thread is not None:
+            return
+        self.open()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(roots,), name="file-index", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self, roots: List[Path]) -> None:
+        interval = max(10, getattr(settings, "FILE_INDEX_REFRESH_SECONDS", 300))
+        while not self._stop.is_set():
+            try:
+                self.refresh(roots)
+            except Exception as e:
+                print(f"File index refresh failed: {e}")
+            self._stop.wait(interval)
+
+    # ---------- building ----------
+
+    def refresh(self, roots: List[Path]) -> Dict[str, Any]:
+        """Bring the index up to date with the file system. Returns counters for this pass."""
+        started = time.perf_counter()
+        counts = {"dirs_seen": 0, "dirs_rescanned": 0, "files_upserted": 0, "files_removed": 0}
+        conn = _connect()
+        try:
+            root_strs = []
+            for root in roots:
+                if self._stop.is_set():
+                    return counts
+                if not root.is_dir():
+                    continue
+                root_str = str(root)
+                root_strs.append(root_str)
+                self._refresh_tree(conn, root_str, counts)
+            # Roots removed from FILE_OPS_USER_FOLDERS.
+            placeholders = ",".join("?" * len(root_strs)) or "''"
+            cur = conn.execute(f"DELETE FROM files WHERE root NOT IN ({placeholders})", root_strs)
+            counts["files_removed"] += cur.rowcount
+            conn.execute(f"DELETE FROM dirs WHERE root NOT IN ({placeholders})", root_strs)
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('built_at', ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (str(time.time()),),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        self.ready = True
+        counts["seconds"] = round(time.perf_counter() - started, 3)
+        self.last_refresh = counts
+        return counts
+
+    def _refresh_tree(self, conn: sqlite3.Connection, root: str, counts: Dict[str, Any]) -> None:
+        stack: List[Tuple[str, Optional[str]]] = [(root, None)]
+        while stack and not self._stop.is_set():
+            dir_path, parent = stack.pop()
+            counts["dirs_seen"] += 1
+            try:
+                mtime = os.stat(dir_path).st_mtime
+            except OSError:
+                self._drop_tree(conn, dir_path, counts)
+                continue
+            row = conn.execute("SELECT mtime FROM dirs WHERE path = ?", (dir_path,)).fetchone()
+            if row is not None and row["mtime"] == mtime:
+                # Listing unchanged: only descend into the subdirectories we already know.
+                for sub in conn.execute("SELECT path FROM dirs WHERE parent = ?", (dir_path,)).fetchall():
+                    stack.append((sub["path"], dir_path))
+                continue
+            subdirs = self._rescan_dir(conn, dir_path, root, counts)
+            conn.execute(
+                "INSERT INTO dirs (path, parent, root, mtime) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime",
+                (dir_path, parent, root, mtime),
+            )
+            stack.extend((sub, dir_path) for sub in subdirs)
+            counts["dirs_rescanned"] += 1
+            if counts["dirs_rescanned"] % _COMMIT_EVERY_DIRS == 0:
+                conn.commit()
+
+    def _rescan_dir(self, conn: sqlite3.Connection, dir_path: str, root: str, counts: Dict[str, Any]) -> List[str]:
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_symlink():
+                            continue  # never follow links out of the allowed folders
+                        if entry.is_dir():
+                            subdirs.append(entry.path)
+                        elif entry.is_file():
+                            st = entry.stat()
+                            files.append((entry.path, entry.name, dir_path, root, st.st_size, st.st_mtime))
+                    except OSError:
+                        continue
+        except OSError:
+            return []
+        conn.executemany(
+            "INSERT INTO files (path, name, dir, root, size, mtime) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime = excluded.mtime "
+            "WHERE size != excluded.size OR mtime != excluded.mtime",
+            files,
+        )
+        counts["files_upserted"] += len(files)
+        present = {f[0] for f in files}
+        stale = [
+            r["path"] for r in conn.execute("SELECT path FROM files WHERE dir = ?", (dir_path,)).fetchall()
+            if r["path"] not in present
+        ]
+        if stale:
+            conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in stale])
+            counts["files_removed"] += len(stale)
+        current = set(subdirs)
+        for r in conn.execute("SELECT path FROM dirs WHERE parent = ?", (dir_path,)).fetchall():
+            if r["path"] not in current:
+                self._drop_tree(conn, r["path"], counts)
+        return subdirs
+
+    def _drop_tree(self, conn: sqlite3.Connection, dir_path: str, counts: Dict[str, Any]) -> None:
+        prefix = dir_path.rstrip(os.sep) + os.sep
+        like = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        cur = conn.execute("DELETE FROM files WHERE dir = ? OR dir LIKE ? ESCAPE '\\'", (dir_path, like))
+        counts["files_removed"] += cur.rowcount
+        conn.execute("DELETE FROM dirs WHERE path = ? OR path LIKE ? ESCAPE '\\'", (dir_path, like))
+
+    # ---------- searching ----------
+
+    def search(self, query: str, recursive: bool, max_results: int, roots: List[Path]) -> Optional[List[Dict[str, Any]]]:
+        """Best matches for query (substring or glob), or None if the index is not built yet."""
+        if not self.ready:
+            return None
+        q = query.lower()
+        root_strs = [str(r) for r in roots]
+        if not root_strs:
+            return []
+        params: List[Any] = []
+        where = [f"f.root IN ({','.join('?' * len(root_strs))})"]
+        params.extend(root_strs)
+        if not recursive:
+            where.append("f.dir = f.root")
+        source = "files f"
+        if not q:
+            pass
+        elif "*" in q or "?" in q:
+            where.append("lower(f.name) GLOB ?")
+            params.append(q)
+        elif self.has_fts and len(q) >= 3:
+            source = "files_fts JOIN files f ON f.id = files_fts.rowid"
+            where.append("files_fts MATCH ?")
+            params.append('"' + q.replace('"', '""') + '"')
+        else:
+            where.append("instr(lower(f.name), ?) > 0")
+            params.append(q)
+        sql = (
+            f"SELECT f.path, f.name, f.root, f.size, f.mtime FROM {source} WHERE {' AND '.join(where)} "
+            "ORDER BY (lower(f.name) = ?) DESC, f.mtime DESC LIMIT ?"
+        )
+        params.extend([q, _CANDIDATE_LIMIT])
+        conn = _connect()
+        try:
+            rows = conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+        now = time.time()
+        ranked = sorted(rows, key=lambda r: _score(r["name"], q, r["mtime"], now), reverse=True)
+        items: List[Dict[str, Any]] = []
+        for r in ranked:
+            if len(items) >= max_results:
+                break
+            if not os.path.isfile(r["path"]):
+                continue  # deleted since the last refresh
+            items.append({
+                "path": r["path"],
+                "name": r["name"],
+                "folder": Path(r["root"]).name,
+                "size": r["size"],
+            })
+        return items
+
+
+def _score(name: str, q: str, mtime: float, now: float) -> float:
+    """Match quality (exact > stem > prefix > word start > substring) plus a recency bonus."""
+    n = name.lower()
+    if not q or "*" in q or "?" in q:
+        match = 1.0
+    elif n == q:
+        match = 5.0
+    elif os.path.splitext(n)[0] == q:
+        match = 4.0
+    elif n.startswith(q):
+        match = 3.0
+    elif any(n[i - 1] in " _-." and n.startswith(q, i) for i in range(1, len(n))):
+        match = 2.0
+    else:
+        match = 1.0
+    age_days = max(0.0, (now - mtime) / 86400)
+    recency = 1.0 / (1.0 + math.log1p(age_days / 7))
+    return match + recency - len(n) / 1000
+
+
+file_index = FileIndex()
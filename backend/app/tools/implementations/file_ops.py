@@ -4,6 +4,7 @@ from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 from app.core.config import settings
+from app.tools.implementations.file_index import file_index
 
 _BACKEND_ROOT = Path(__file__).resolve().parents[3]
 _SAFE_BASE_DIR_OVERRIDE = settings.FILE_OPS_SAFE_BASE_DIR
@@ -11,6 +12,10 @@ SAFE_BASE_DIR = Path(_SAFE_BASE_DIR_OVERRIDE) if _SAFE_BASE_DIR_OVERRIDE else _B
 SAFE_BASE_DIR.mkdir(parents=True, exist_ok=True)
 
 
+def get_user_folders() -> List[Path]:
+    """Allowed user folders (FILE_OPS_USER_FOLDERS under the home directory)."""
+    return _get_user_folders()
+
 def _get_user_folders() -> List[Path]:
     home = Path.home()
     raw = (settings.FILE_OPS_USER_FOLDERS or "Documents,Desktop,Downloads").strip()
@@ -104,6 +109,18 @@ def file_ops(args: Dict[str, Any]) -> Dict[str, Any]:
                 max_results = max(1, min(cap, int(args.get("max_results", default_max))))
             except (TypeError, ValueError):
                 max_results = default_max
+            indexed = file_index.search(query, bool(recursive), max_results, _get_user_folders())
+            if indexed is not None:
+                return {
+                    "ok": True,
+                    "scope": "Documents, Desktop, Downloads",
+                    "query": query or "(all files)",
+                    "count": len(indexed),
+                    "max_results": max_results,
+                    "items": indexed,
+                    "source": "index",
+                }
+            # Index not built yet: walk the folders (slow on large trees).
             items: List[Dict[str, Any]] = []
             for root in _get_user_folders():
                 if not root.exists() or not root.is_dir():
@@ -149,6 +166,7 @@ def file_ops(args: Dict[str, Any]) -> Dict[str, Any]:
                 "count": len(items),
                 "max_results": max_results,
                 "items": items,
+                "source": "scan",
             }
 
         if op == "read_user":
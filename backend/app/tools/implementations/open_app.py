@@ -14,6 +14,11 @@ _DEFAULT_APPS = {
 }
 
 
+def get_allowed_apps() -> Dict[str, str]:
+    """Allowed app names (lowercase) -> executable path."""
+    return _get_allowed_apps()
+
+
 def _get_allowed_apps() -> Dict[str, str]:
     # File path takes precedence over env JSON
     file_path = (settings.ALLOWED_APPS_FILE or "").strip()
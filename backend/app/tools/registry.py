@@ -1,11 +1,25 @@
 from __future__ import annotations
 from dataclasses import dataclass
-from typing import Any, Callable, Dict
+from typing import Any, Callable, Dict, Optional, Tuple
 
 @dataclass
 class ToolSpec:
     name: str
     description: str
     handler: Callable[[Dict[str, Any]], Dict[str, Any]]
+    # Where the (sync) handler runs: "thread" pool, "process" pool (handler must be a
+    # picklable module-level function), or "inline" on the event loop (only for trivial work).
+    executor: str = "thread"
+    # Seconds before the call is abandoned with a timeout error (None = TOOL_DEFAULT_TIMEOUT).
+    timeout_s: Optional[float] = None
+    # Max concurrent runs of this tool; extra calls wait for a slot.
+    max_concurrency: int = 4
+    # Result caching (successful results only), off unless the tool opts in: only for tools
+    # without side effects whose results may be a little stale. cache_ttl_s None =
+    # TOOL_CACHE_DEFAULT_TTL. Args named in cache_case_insensitive are matched ignoring case
+    # and extra whitespace ("Python  Asyncio" == "python asyncio"); all others exactly.
+    cacheable: bool = False
+    cache_ttl_s: Optional[float] = None
+    cache_case_insensitive: Tuple[str, ...] = ()
 
 TOOLS: Dict[str, ToolSpec] = {}
\ No newline at end of file
@@ -1,9 +1,66 @@
 from __future__ import annotations
+import asyncio
 from typing import Any, Dict
+from app.core.config import settings
+from app.core.metrics import stage
+from app.tools.cache import ToolResultCache, make_key
 from app.tools.registry import TOOLS
+from app.tools.runtime import run_tool
+
+tool_cache = ToolResultCache(max_entries=getattr(settings, "TOOL_CACHE_MAX_ENTRIES", 256))
+# Identical calls already running (e.g. a client retry while the first search is in flight).
+_in_flight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
 
 def execute_tool(tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a tool synchronously in the calling thread. Async code should use execute_tool_async."""
+    tool = TOOLS.get(tool_name)
+    if not tool:
+        return {"ok": False, "error": f"Unknown tool: {tool_name}"}
+    return tool.handler(args)
+
+async def execute_tool_async(tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run a tool off the event loop with its ToolSpec timeout and concurrency limit.
+    Cacheable tools are served from tool_cache when an identical call succeeded recently.
+    """
+    with stage("tool"):
+        return await _execute_tool_async(tool_name, args)
+
+async def _execute_tool_async(tool_name: str, args: Dict[str, Any]) -> Dict[str, Any]:
     tool = TOOLS.get(tool_name)
     if not tool:
         return {"ok": False, "error": f"Unknown tool: {tool_name}"}
-    return tool.handler(args)
\ No newline at end of file
+    if not tool.cacheable:
+        return await run_tool(tool, args)
+
+    key = make_key(tool_name, args, tool.cache_case_insensitive)
+    cached = tool_cache.get(tool_name, key)
+    if cached is not None:
+        return cached
+    pending = _in_flight.get(key)
+    if pending is not None:
+        tool_cache.record_coalesced(tool_name)
+        try:
+            return dict(await asyncio.shield(pending))
+        except asyncio.CancelledError:
+            if not pending.cancelled():
+                raise
+            return await run_tool(tool, args)  # the first caller was cancelled; run it ourselves
+
+    fut: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+    _in_flight[key] = fut
+    try:
+        result = await run_tool(tool, args)
+        ttl = tool.cache_ttl_s if tool.cache_ttl_s is not None else getattr(settings, "TOOL_CACHE_DEFAULT_TTL", 120.0)
+        tool_cache.put(tool_name, key, result, ttl)
+        fut.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except Exception as e:
+        fut.set_exception(e)
+        fut.exception()  # waiters re-raise it; don't warn when there are none
+        raise
+    finally:
+        _in_flight.pop(key, None)
\ No newline at end of file
@@ -0,0 +1,110 @@
+"""
+Async runtime for tool handlers. Handlers stay plain sync functions; this module runs them
+off the event loop (thread or process pool, per ToolSpec.executor) with a per-tool timeout
+and concurrency cap, so a slow web search or file walk never blocks other requests.
+"""
+from __future__ import annotations
+import asyncio
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from app.core.config import settings
+from app.tools.registry import ToolSpec
+
+_thread_pool: Optional[ThreadPoolExecutor] = None
+_process_pool: Optional[ProcessPoolExecutor] = None
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def _get_pool(kind: str) -> Executor:
+    global _thread_pool, _process_pool
+    if kind == "process":
+        if _process_pool is None:
+            _process_pool = ProcessPoolExecutor(max_workers=getattr(settings, "TOOL_PROCESS_WORKERS", 2))
+        return _process_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(
+            max_workers=getattr(settings, "TOOL_THREAD_WORKERS", 8),
+            thread_name_prefix="tool",
+        )
+    return _thread_pool
+
+
+def _get_semaphore(spec: ToolSpec) -> asyncio.Semaphore:
+    sem = _semaphores.get(spec.name)
+    if sem is None:
+        sem = asyncio.Semaphore(max(1, spec.max_concurrency))
+        _semaphores[spec.name] = sem
+    return sem
+
+
+async def run_tool(spec: ToolSpec, args: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Run spec.handler(args) without blocking the event loop.
+    The timeout covers waiting for a concurrency slot and the run itself; on timeout returns
+    {"ok": False, "error": ...}. The handler's slot is only freed once it really finishes
+    (a running thread cannot be interrupted). If the awaiting task is cancelled, a call still
+    waiting in the pool queue is dropped.
+    """
+    timeout = spec.timeout_s if spec.timeout_s is not None else getattr(settings, "TOOL_DEFAULT_TIMEOUT", 30.0)
+    limit = timeout if timeout and timeout > 0 else None
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + limit if limit is not None else None
+    sem = _get_semaphore(spec)
+    try:
+        await asyncio.wait_for(sem.acquire(), timeout=limit)
+    except asyncio.TimeoutError:
+        return _timed_out(spec, timeout)
+
+    if spec.executor == "inline":
+        try:
+            return spec.handler(args)
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+        finally:
+            sem.release()
+
+    try:
+        cf = _get_pool(spec.executor).submit(spec.handler, args)
+    except Exception:
+        sem.release()
+        raise
+
+    def _on_done(f: Future) -> None:
+        # Runs in the worker thread (or pool manager thread): hop back to the loop.
+        try:
+            loop.call_soon_threadsafe(sem.release)
+        except RuntimeError:
+            pass  # loop already closed (shutdown while an abandoned call was still running)
+        if not f.cancelled():
+            f.exception()  # mark retrieved so abandoned failures are not logged as unhandled
+
+    cf.add_done_callback(_on_done)
+    try:
+        return await asyncio.wait_for(
+            asyncio.shield(asyncio.wrap_future(cf)),
+            timeout=max(0.0, deadline - loop.time()) if deadline is not None else None,
+        )
+    except asyncio.TimeoutError:
+        cf.cancel()
+        return _timed_out(spec, timeout)
+    except asyncio.CancelledError:
+        cf.cancel()
+        raise
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+
+def _timed_out(spec: ToolSpec, timeout: float) -> Dict[str, Any]:
+    return {"ok": False, "error": f"Tool '{spec.name}' timed out after {timeout:g}s."}
+
+
+def shutdown_tool_runtime() -> None:
+    """Stop the worker pools (called on app shutdown). Queued calls are dropped."""
+    global _thread_pool, _process_pool
+    if _thread_pool is not None:
+        _thread_pool.shutdown(wait=False, cancel_futures=True)
+        _thread_pool = None
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _process_pool = None
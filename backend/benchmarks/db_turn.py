@@ -0,0 +1,134 @@
+"""
+Per-turn SQLite overhead of app.memory: the legacy pattern (a fresh connection per repo
+call, default journal) versus the pooled, tuned connections in app.memory.db.
+
+A "turn" is what /chat does against the DB: load recent history, add the user message,
+read preferences and learned facts, add the assistant reply and log a tool call.
+
+Run from backend/:  python -m benchmarks.db_turn --turns 500
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+_BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_BACKEND_ROOT))
+
+
+def _legacy_turn(db_path: Path, session_id: str, i: int) -> None:
+    """The baseline repo behaviour: every call connects, commits and closes on its own."""
+    def conn() -> sqlite3.Connection:
+        c = sqlite3.connect(db_path)
+        c.row_factory = sqlite3.Row
+        return c
+
+    def now() -> str:
+        return datetime.utcnow().isoformat()
+
+    def add_message(role: str, content: str) -> None:
+        c = conn()
+        c.execute("INSERT OR IGNORE INTO sessions (id, created_at) VALUES (?, ?)", (session_id, now()))
+        c.commit()
+        c.close()
+        c = conn()
+        c.execute(
+            "INSERT INTO messages (session_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+            (session_id, role, content, now()),
+        )
+        c.commit()
+        c.close()
+
+    c = conn()
+    c.execute("SELECT role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT 8", (session_id,)).fetchall()
+    c.close()
+    add_message("user", f"user message {i}")
+    c = conn()
+    c.execute("SELECT key, value FROM preferences").fetchall()
+    c.close()
+    c = conn()
+    c.execute("SELECT fact_key, fact_value FROM learned_facts ORDER BY fact_key").fetchall()
+    c.close()
+    add_message("assistant", f"assistant reply {i}")
+    c = conn()
+    c.execute(
+        "INSERT INTO tool_logs (session_id, tool_name, args_json, result_json, created_at) VALUES (?, ?, ?, ?, ?)",
+        (session_id, "web_search", "{}", "{}", now()),
+    )
+    c.commit()
+    c.close()
+
+
+def _current_turn(session_id: str, i: int) -> None:
+    from app.memory import repo
+
+    repo.get_recent_messages(session_id, limit=8)
+    repo.add_message(session_id, "user", f"user message {i}")
+    # The uncached loaders: this measures connection reuse, not the in-memory memory cache.
+    repo._load_all_preferences()
+    repo._load_all_learned_facts()
+    repo.add_message(session_id, "assistant", f"assistant reply {i}")
+    repo.log_tool(session_id, "web_search", {}, {})
+
+
+def _measure(fn: Callable[[int], None], turns: int) -> Dict[str, float]:
+    samples: List[float] = []
+    for i in range(turns):
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {
+        "turns": turns,
+        "mean_ms": round(statistics.fmean(samples), 3),
+        "p50_ms": round(samples[len(samples) // 2], 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "total_s": round(sum(samples) / 1000, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=300)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+
+    tmp = Path(tempfile.mkdtemp(prefix="aika-bench-"))
+    legacy_db = tmp / "legacy.db"
+    os.environ["DB_PATH"] = str(tmp / "pooled.db")
+    # Commit inline like the legacy turn; write-behind would only time the enqueue.
+    os.environ["DB_WRITE_MODE"] = "sync"
+
+    from app.memory.init_db import init_db, MIGRATIONS_DIR
+
+    init_db()
+    legacy = sqlite3.connect(legacy_db)
+    for sql_file in sorted(MIGRATIONS_DIR.glob("*.sql")):
+        legacy.executescript(sql_file.read_text(encoding="utf-8"))
+    legacy.commit()
+    legacy.close()
+
+    results = {
+        "legacy": _measure(lambda i: _legacy_turn(legacy_db, "bench", i), args.turns),
+        "pooled": _measure(lambda i: _current_turn("bench", i), args.turns),
+    }
+    results["speedup"] = round(results["legacy"]["mean_ms"] / max(results["pooled"]["mean_ms"], 1e-9), 1)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name in ("legacy", "pooled"):
+        r = results[name]
+        print(f"{name:>7}: mean {r['mean_ms']:.3f} ms  p50 {r['p50_ms']:.3f} ms  p95 {r['p95_ms']:.3f} ms  ({r['turns']} turns)")
+    print(f"speedup: {results['speedup']}x per turn")
+
+
+if __name__ == "__main__":
+    main()
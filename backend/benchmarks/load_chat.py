@@ -0,0 +1,468 @@
+"""
+End-to-end load benchmark for /chat, /chat/stream, /chat/sessions and /vision.
+
+Concurrent virtual users each run --turns turns against the backend; every turn calls each
+selected endpoint once. Reported per endpoint: latency mean/p50/p95/p99/max, throughput and
+errors; for /chat/stream also time to first chunk (TTFT) and inter-chunk latency; plus
+event-loop lag of the load generator and (unless --base-url is given) of the backend itself.
+
+By default the benchmark starts benchmarks.mock_ollama and the backend
+in-process on free ports, with a temporary database and upload dir, so the numbers measure
+backend overhead over a model of known speed. Use --base-url to load an already running backend.
+
+Results are written as JSON (--out); --compare prints the change against an earlier result
+file and exits with status 1 when a latency grew by more than --regression-pct.
+
+Run from backend/:  python -m benchmarks.load_chat --sessions 8 --turns 10
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from dataclasses import asdict
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+_BACKEND_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(_BACKEND_ROOT))
+
+from benchmarks.mock_ollama import MockConfig, create_app  # noqa: E402
+
+ENDPOINTS = ("chat", "chat_stream", "sessions", "vision")
+# Compared by --compare: growth beyond --regression-pct (and 1 ms) counts as a regression.
+_COMPARED = ("p50_ms", "p95_ms", "p99_ms")
+
+
+# ---------- statistics ----------
+
+def _summary(samples: List[float]) -> Dict[str, Any]:
+    """Mean and nearest-rank percentiles of samples (ms)."""
+    if not samples:
+        return {"count": 0}
+    s = sorted(samples)
+
+    def pct(p: float) -> float:
+        return round(s[min(len(s) - 1, max(0, int(round(p * len(s))) - 1))], 3)
+
+    return {
+        "count": len(s),
+        "mean_ms": round(sum(s) / len(s), 3),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": round(s[-1], 3),
+    }
+
+
+class LoopLagMonitor:
+    """Samples event-loop lag: how late a sleep(interval) wakes up on the loop it runs on."""
+
+    def __init__(self, interval_ms: float = 10.0) -> None:
+        self.interval = interval_ms / 1000
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, (time.perf_counter() - t0 - self.interval) * 1000))
+
+
+class _Recorder:
+    def __init__(self) -> None:
+        self.latency: Dict[str, List[float]] = {e: [] for e in ENDPOINTS}
+        self.status: Dict[str, Dict[str, int]] = {e: {} for e in ENDPOINTS}
+        self.errors: Dict[str, List[str]] = {e: [] for e in ENDPOINTS}
+        self.ttft: List[float] = []
+        self.inter_chunk: List[float] = []
+        self.chunks = 0
+
+    def record(self, endpoint: str, ms: float, status: str, error: Optional[str] = None) -> None:
+        self.status[endpoint][status] = self.status[endpoint].get(status, 0) + 1
+        if error is None:
+            self.latency[endpoint].append(ms)
+        elif len(self.errors[endpoint]) < 5:
+            self.errors[endpoint].append(error[:200])
+
+
+# ---------- requests ----------
+
+def _sample_png(width: int = 640, height: int = 480) -> bytes:
+    """A gradient PNG built with zlib only, so the benchmark does not need Pillow."""
+    rows = bytearray()
+    for y in range(height):
+        rows.append(0)  # filter: none
+        for x in range(width):
+            rows += bytes((x * 255 // width, y * 255 // height, 128))
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + chunk(b"IDAT", zlib.compress(bytes(rows), 6)) + chunk(b"IEND", b"")
+
+
+async def _chat(client, rec: _Recorder, session_id: str, message: str) -> None:
+    t0 = time.perf_counter()
+    try:
+        r = await client.post("/chat", json={"message": message, "session_id": session_id})
+    except Exception as e:
+        rec.record("chat", 0, "exception", repr(e))
+        return
+    ms = (time.perf_counter() - t0) * 1000
+    rec.record("chat", ms, str(r.status_code), None if r.status_code == 200 else r.text)
+
+
+async def _chat_stream(client, rec: _Recorder, session_id: str, message: str) -> None:
+    t0 = time.perf_counter()
+    first: Optional[float] = None
+    last: Optional[float] = None
+    error: Optional[str] = None
+    status = "exception"
+    try:
+        async with client.stream("POST", "/chat/stream", json={"message": message, "session_id": session_id}) as r:
+            status = str(r.status_code)
+            if r.status_code != 200:
+                error = (await r.aread()).decode("utf-8", "replace")
+            else:
+                async for line in r.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    event = json.loads(line[6:])
+                    now = time.perf_counter()
+                    if event.get("type") == "chunk":
+                        if first is None:
+                            first = now
+                            rec.ttft.append((now - t0) * 1000)
+                        else:
+                            rec.inter_chunk.append((now - last) * 1000)
+                        last = now
+                        rec.chunks += 1
+                    elif event.get("type") == "error":
+                        error = event.get("message") or "error event"
+                    elif event.get("type") == "done":
+                        break
+    except Exception as e:
+        error = repr(e)
+    rec.record("chat_stream", (time.perf_counter() - t0) * 1000, status, error)
+
+
+async def _sessions(client, rec: _Recorder) -> None:
+    t0 = time.perf_counter()
+    try:
+        r = await client.get("/chat/sessions", params={"limit": 50})
+    except Exception as e:
+        rec.record("sessions", 0, "exception", repr(e))
+        return
+    ms = (time.perf_counter() - t0) * 1000
+    rec.record("sessions", ms, str(r.status_code), None if r.status_code == 200 else r.text)
+
+
+async def _vision(client, rec: _Recorder, image: bytes, message: str) -> None:
+    t0 = time.perf_counter()
+    try:
+        r = await client.post(
+            "/vision",
+            data={"message": message},
+            files={"image": ("bench.png", image, "image/png")},
+        )
+    except Exception as e:
+        rec.record("vision", 0, "exception", repr(e))
+        return
+    ms = (time.perf_counter() - t0) * 1000
+    rec.record("vision", ms, str(r.status_code), None if r.status_code == 200 else r.text)
+
+
+async def _user(client, rec: _Recorder, user: int, args: argparse.Namespace, image: bytes) -> None:
+    session_id = f"bench-{user}"
+    for turn in range(args.turns):
+        # Distinct prompts: no greeting/intent-router shortcut and no vision cache hits.
+        message = f"Tell me something about topic number {user}-{turn}."
+        if "chat_stream" in args.endpoints:
+            await _chat_stream(client, rec, session_id, message)
+        if "chat" in args.endpoints:
+            await _chat(client, rec, session_id, message)
+        if "sessions" in args.endpoints:
+            await _sessions(client, rec)
+        if "vision" in args.endpoints:
+            await _vision(client, rec, image, f"Describe this image ({user}-{turn}).")
+
+
+async def _load(base_url: str, args: argparse.Namespace) -> Tuple[_Recorder, float, List[float]]:
+    import httpx
+
+    rec = _Recorder()
+    image = _sample_png()
+    monitor = LoopLagMonitor()
+    monitor.start()
+    limits = httpx.Limits(max_connections=args.sessions * 2, max_keepalive_connections=args.sessions * 2)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        t0 = time.perf_counter()
+        await asyncio.gather(*(_user(client, rec, u, args, image) for u in range(args.sessions)))
+        elapsed = time.perf_counter() - t0
+    await monitor.stop()
+    return rec, elapsed, monitor.samples
+
+
+# ---------- in-process servers ----------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _ThreadedServer:
+    """uvicorn serving an app on its own event loop in a thread, optionally with a lag monitor on that loop."""
+
+    def __init__(self, app, port: int, monitor: Optional[LoopLagMonitor] = None) -> None:
+        import uvicorn
+
+        self.port = port
+        self.monitor = monitor
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        async def serve() -> None:
+            if self.monitor is not None:
+                self.monitor.start()
+            await self.server.serve()
+            if self.monitor is not None:
+                await self.monitor.stop()
+
+        asyncio.run(serve())
+
+    def __enter__(self) -> "_ThreadedServer":
+        self.thread.start()
+        deadline = time.monotonic() + 30
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError(f"server on port {self.port} failed to start")
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=30)
+
+
+def _spawn_env(args: argparse.Namespace, mock_port: int, tmp: Path) -> None:
+    """Backend settings for the spawned run (set before app.main is imported). Existing env vars win."""
+    defaults = {
+        "DB_PATH": str(tmp / "bench.db"),
+        "UPLOAD_DIR": str(tmp / "uploads"),
+        "FILE_INDEX_ENABLED": "false",
+        "FILE_INDEX_DB_PATH": str(tmp / "file_index.db"),
+        # Match the mock's parallelism so the scheduler, not the mock, decides what waits.
+        "LLM_MAX_IN_FLIGHT_PER_MODEL": str(args.parallel or args.sessions),
+        "LLM_MAX_QUEUE_DEPTH": str(max(8, args.sessions * 4)),
+    }
+    os.environ["OLLAMA_URL"] = f"http://127.0.0.1:{mock_port}"
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+
+# ---------- results ----------
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=_BACKEND_ROOT, capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _report(rec: _Recorder, elapsed: float, client_lag: List[float], server_lag: Optional[List[float]],
+            args: argparse.Namespace, mock: Optional[MockConfig]) -> Dict[str, Any]:
+    endpoints: Dict[str, Any] = {}
+    for name in args.endpoints:
+        ok = len(rec.latency[name])
+        total = sum(rec.status[name].values())
+        endpoints[name] = {
+            **_summary(rec.latency[name]),
+            "requests": total,
+            "errors": total - ok,
+            "status_codes": rec.status[name],
+            "throughput_rps": round(ok / elapsed, 2) if elapsed else 0.0,
+            "error_samples": rec.errors[name],
+        }
+    if "chat_stream" in endpoints:
+        endpoints["chat_stream"]["ttft_ms"] = _summary(rec.ttft)
+        endpoints["chat_stream"]["inter_chunk_ms"] = _summary(rec.inter_chunk)
+        endpoints["chat_stream"]["chunks"] = rec.chunks
+    if mock is not None:
+        # What the fake model alone accounts for; the rest is backend (and client) overhead.
+        model_ms = mock.prefill_ms + max(0, mock.tokens - 1) * mock.token_delay_ms
+        for name in ("chat", "vision"):
+            if endpoints.get(name, {}).get("count"):
+                endpoints[name]["overhead_p50_ms"] = round(endpoints[name]["p50_ms"] - model_ms, 3)
+        ttft = endpoints.get("chat_stream", {}).get("ttft_ms", {})
+        if ttft.get("count"):
+            ttft["overhead_p50_ms"] = round(ttft["p50_ms"] - mock.prefill_ms, 3)
+    completed = sum(len(v) for v in rec.latency.values())
+    return {
+        "benchmark": "load_chat",
+        "started_at": args.started_at,
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git_commit": _git_commit(),
+        },
+        "config": {
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "endpoints": list(args.endpoints),
+            "base_url": args.base_url,
+            "mock": asdict(mock) if mock is not None else None,
+        },
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 2) if elapsed else 0.0,
+        "endpoints": endpoints,
+        "event_loop_lag_ms": {
+            "client": _summary(client_lag),
+            "server": _summary(server_lag) if server_lag is not None else None,
+        },
+    }
+
+
+def _metrics(result: Dict[str, Any]) -> Dict[str, float]:
+    """Flat 'endpoint.metric' -> value map of the latencies compared between runs."""
+    flat: Dict[str, float] = {}
+    for name, stats in result.get("endpoints", {}).items():
+        for key in _COMPARED:
+            if key in stats:
+                flat[f"{name}.{key}"] = stats[key]
+        for sub in ("ttft_ms", "inter_chunk_ms"):
+            for key in _COMPARED:
+                if key in stats.get(sub, {}):
+                    flat[f"{name}.{sub}.{key}"] = stats[sub][key]
+    server = (result.get("event_loop_lag_ms") or {}).get("server") or {}
+    for key in _COMPARED:
+        if key in server:
+            flat[f"server_loop_lag.{key}"] = server[key]
+    return flat
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], regression_pct: float) -> List[Dict[str, Any]]:
+    """Per-metric change from baseline to current; 'regression' marks growth beyond regression_pct and 1 ms."""
+    before, after = _metrics(baseline), _metrics(current)
+    rows = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        change = (new - old) / old * 100 if old else 0.0
+        rows.append({
+            "metric": key,
+            "baseline": old,
+            "current": new,
+            "change_pct": round(change, 1),
+            "regression": change > regression_pct and new - old > 1.0,
+        })
+    return rows
+
+
+def _print_summary(result: Dict[str, Any]) -> None:
+    print(f"{result['config']['sessions']} sessions x {result['config']['turns']} turns in {result['duration_s']} s "
+          f"({result['throughput_rps']} req/s)")
+    for name, s in result["endpoints"].items():
+        if not s.get("count"):
+            print(f"{name:>14}: no successful requests ({s['errors']} errors: {s['error_samples'][:1]})")
+            continue
+        print(f"{name:>14}: p50 {s['p50_ms']:.1f} ms  p95 {s['p95_ms']:.1f} ms  p99 {s['p99_ms']:.1f} ms  "
+              f"{s['throughput_rps']} req/s  errors {s['errors']}")
+        for sub in ("ttft_ms", "inter_chunk_ms"):
+            if s.get(sub, {}).get("count"):
+                t = s[sub]
+                print(f"{sub:>14}: p50 {t['p50_ms']:.1f} ms  p95 {t['p95_ms']:.1f} ms  p99 {t['p99_ms']:.1f} ms")
+    for side, lag in result["event_loop_lag_ms"].items():
+        if lag and lag.get("count"):
+            print(f"{side + ' lag':>14}: p50 {lag['p50_ms']:.2f} ms  p99 {lag['p99_ms']:.2f} ms  max {lag['max_ms']:.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent virtual users")
+    parser.add_argument("--turns", type=int, default=10, help="turns per user")
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help=f"comma-separated subset of {','.join(ENDPOINTS)}")
+    parser.add_argument("--base-url", default=None, help="load a running backend instead of spawning one with the mock")
+    parser.add_argument("--prefill-ms", type=float, default=MockConfig.prefill_ms)
+    parser.add_argument("--token-delay-ms", type=float, default=MockConfig.token_delay_ms)
+    parser.add_argument("--tokens", type=int, default=MockConfig.tokens)
+    parser.add_argument("--parallel", type=int, default=0, help="mock generations at once (0 = one per session)")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--out", default=None, help="result JSON path (default benchmarks/results/load_chat-<time>.json)")
+    parser.add_argument("--compare", default=None, help="earlier result JSON to compare against")
+    parser.add_argument("--regression-pct", type=float, default=10.0)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args()
+    args.endpoints = [e.strip() for e in args.endpoints.split(",") if e.strip()]
+    unknown = set(args.endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    args.started_at = datetime.now().isoformat(timespec="seconds")
+
+    mock: Optional[MockConfig] = None
+    server_lag: Optional[List[float]] = None
+    if args.base_url:
+        rec, elapsed, client_lag = asyncio.run(_load(args.base_url, args))
+    else:
+        mock = MockConfig(args.prefill_ms, args.token_delay_ms, args.tokens, args.parallel or args.sessions)
+        mock_port, backend_port = _free_port(), _free_port()
+        _spawn_env(args, mock_port, Path(tempfile.mkdtemp(prefix="aika-load-")))
+        from app.main import app as backend_app
+
+        backend_monitor = LoopLagMonitor()
+        with _ThreadedServer(create_app(mock), mock_port), _ThreadedServer(backend_app, backend_port, backend_monitor):
+            args.base_url = f"http://127.0.0.1:{backend_port}"
+            rec, elapsed, client_lag = asyncio.run(_load(args.base_url, args))
+        server_lag = backend_monitor.samples
+
+    result = _report(rec, elapsed, client_lag, server_lag, args, mock)
+    out = Path(args.out) if args.out else _BACKEND_ROOT / "benchmarks" / "results" / f"load_chat-{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(result, indent=2), encoding="utf-8")
+
+    regressions = []
+    if args.compare:
+        rows = compare_results(json.loads(Path(args.compare).read_text(encoding="utf-8")), result, args.regression_pct)
+        result["comparison"] = rows
+        regressions = [r for r in rows if r["regression"]]
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        _print_summary(result)
+        for r in result.get("comparison", []):
+            flag = "  REGRESSION" if r["regression"] else ""
+            print(f"{r['metric']:>36}: {r['baseline']:.1f} -> {r['current']:.1f} ms ({r['change_pct']:+.1f}%){flag}")
+        print(f"results: {out}")
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Fake Ollama server for benchmarks: answers /api/chat (streaming and not) with a fixed prefill
+time and per-token delay, so backend overhead can be measured apart from model speed.
+
+Also serves /api/generate (model preload), /api/ps and /api/tags so the model warmer and
+readiness checks work against it. Point the backend at it with OLLAMA_URL.
+
+Run from backend/:  python -m benchmarks.mock_ollama --port 11435 --prefill-ms 150 --token-delay-ms 15
+"""
+from __future__ import annotations
+import argparse
+import asyncio
+import json
+import time
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+
+@dataclass
+class MockConfig:
+    # Time before the first token (prompt evaluation), and between tokens.
+    prefill_ms: float = 150.0
+    token_delay_ms: float = 15.0
+    # Tokens per reply, capped by the request's num_predict.
+    tokens: int = 64
+    # Requests generated at once; others wait, like OLLAMA_NUM_PARALLEL. 0 = no limit.
+    parallel: int = 0
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _token_count(body: Dict[str, Any], config: MockConfig) -> int:
+    num_predict = (body.get("options") or {}).get("num_predict")
+    if isinstance(num_predict, int) and num_predict > 0:
+        return min(config.tokens, num_predict)
+    return config.tokens
+
+
+def _prompt_tokens(body: Dict[str, Any]) -> int:
+    chars = sum(len(m.get("content") or "") for m in body.get("messages") or [])
+    return max(1, chars // 4)
+
+
+def create_app(config: Optional[MockConfig] = None) -> FastAPI:
+    config = config or MockConfig()
+    app = FastAPI(title="Mock Ollama")
+    gate = asyncio.Semaphore(config.parallel) if config.parallel > 0 else None
+    loaded: Dict[str, str] = {}
+    counters = {"chat": 0, "chat_stream": 0, "generate": 0}
+
+    def final_fields(body: Dict[str, Any], tokens: int) -> Dict[str, Any]:
+        return {
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": _prompt_tokens(body),
+            "prompt_eval_duration": int(config.prefill_ms * 1e6),
+            "eval_count": tokens,
+            "eval_duration": int(tokens * config.token_delay_ms * 1e6),
+        }
+
+    async def generate(body: Dict[str, Any]) -> AsyncIterator[str]:
+        """Yield the reply token by token, holding a generation slot like Ollama does."""
+        model = body.get("model") or "mock"
+        tokens = _token_count(body, config)
+        if gate is not None:
+            await gate.acquire()
+        try:
+            loaded[model] = _now()
+            await asyncio.sleep(config.prefill_ms / 1000)
+            for i in range(tokens):
+                if i:
+                    await asyncio.sleep(config.token_delay_ms / 1000)
+                yield f"word{i} "
+        finally:
+            if gate is not None:
+                gate.release()
+
+    @app.post("/api/chat")
+    async def chat(request: Request):
+        body = await request.json()
+        tokens = _token_count(body, config)
+        model = body.get("model") or "mock"
+        if body.get("stream", True):
+            counters["chat_stream"] += 1
+
+            async def lines():
+                async for piece in generate(body):
+                    yield json.dumps({"model": model, "created_at": _now(), "message": {"role": "assistant", "content": piece}, "done": False}) + "\n"
+                yield json.dumps({"model": model, "created_at": _now(), "message": {"role": "assistant", "content": ""}, **final_fields(body, tokens)}) + "\n"
+
+            return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+        counters["chat"] += 1
+        content: List[str] = [piece async for piece in generate(body)]
+        return {
+            "model": model,
+            "created_at": _now(),
+            "message": {"role": "assistant", "content": "".join(content).strip()},
+            **final_fields(body, tokens),
+        }
+
+    @app.post("/api/generate")
+    async def generate_route(request: Request):
+        body = await request.json()
+        counters["generate"] += 1
+        model = body.get("model") or "mock"
+        loaded[model] = _now()
+        return {"model": model, "created_at": _now(), "response": "", "done": True, "done_reason": "load"}
+
+    @app.get("/api/ps")
+    async def ps():
+        return {"models": [{"name": name if ":" in name else f"{name}:latest", "model": name, "expires_at": None, "size_vram": 0} for name in loaded]}
+
+    @app.get("/api/tags")
+    async def tags():
+        return {"models": [{"name": name} for name in loaded]}
+
+    @app.get("/mock/stats")
+    async def stats():
+        return {"config": asdict(config), "requests": dict(counters), "loaded": dict(loaded)}
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--prefill-ms", type=float, default=MockConfig.prefill_ms)
+    parser.add_argument("--token-delay-ms", type=float, default=MockConfig.token_delay_ms)
+    parser.add_argument("--tokens", type=int, default=MockConfig.tokens)
+    parser.add_argument("--parallel", type=int, default=MockConfig.parallel, help="concurrent generations (0 = unlimited)")
+    args = parser.parse_args()
+
+    import uvicorn
+
+    config = MockConfig(args.prefill_ms, args.token_delay_ms, args.tokens, args.parallel)
+    print(f"Mock Ollama on http://{args.host}:{args.port} ({asdict(config)})")
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Point the app at a throwaway database before app.memory.db is imported.
+os.environ.setdefault("DB_PATH", str(Path(tempfile.mkdtemp(prefix="aika-test-")) / "aika.db"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
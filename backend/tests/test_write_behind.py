@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.memory import repo
+from app.memory.init_db import init_db
+
+
+class _SlowRelease:
+    """commit_lock that pauses after each release, widening any gap between a commit and its bookkeeping."""
+
+    def __init__(self, lock) -> None:
+        self._lock = lock
+
+    def __enter__(self):
+        return self._lock.__enter__()
+
+    def __exit__(self, *exc):
+        self._lock.__exit__(*exc)
+        time.sleep(0.002)
+
+
+@pytest.fixture(autouse=True)
+def _db(monkeypatch):
+    init_db()
+    monkeypatch.setattr(settings, "DB_WRITE_MODE", "async")
+    monkeypatch.setattr(settings, "DB_FLUSH_INTERVAL_MS", 1)
+    monkeypatch.setattr(repo._writer, "commit_lock", _SlowRelease(repo._writer.commit_lock))
+    yield
+    repo.flush_writes()
+
+
+def test_reader_during_commit_sees_each_message_once():
+    session_id = f"race-{time.time_ns()}"
+    total = 200
+    submitted = 0
+    failures = []
+    done = threading.Event()
+
+    def reader() -> None:
+        while not done.is_set():
+            expected_at_least = submitted
+            contents = [m["content"] for m in repo.get_recent_messages(session_id, limit=total * 2)]
+            if contents != [f"m{i}" for i in range(len(contents))] or len(contents) < expected_at_least:
+                failures.append(contents)
+                return
+
+    thread = threading.Thread(target=reader)
+    thread.start()
+    try:
+        for i in range(total):
+            repo.add_message(session_id, "user", f"m{i}")
+            submitted = i + 1
+            if i % 10 == 0:
+                time.sleep(0.002)  # let batches commit while the reader is running
+        repo.flush_writes()
+    finally:
+        done.set()
+        thread.join()
+
+    assert not failures, f"inconsistent history: {failures[0][-5:]}"
+    assert [m["content"] for m in repo.get_recent_messages(session_id, limit=total)] == [f"m{i}" for i in range(total)]